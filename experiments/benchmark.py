@@ -1,22 +1,29 @@
-
 import time
 import os
 import sys
-from typing import List
+import argparse
+import tempfile
+import statistics
+from concurrent.futures import ThreadPoolExecutor
 # Mock config to avoid loading real env if missing
 sys.path.append(os.getcwd())
+from src.core.config import Config
 from src.agents.code_agent import CodeAgent
-# We need to mock GitProvider to avoid real pushes
-from unittest.mock import MagicMock
+from src.core.mock_llm_server import MockLLMServer
+from src.core.telemetry import RunTelemetry
+from src.core.db import init_db
 
 class MockGitProvider:
     def get_issue(self, url):
         return TASKS.get(url, "Unknown task")
+    def get_issue_comments(self, url): return ""
+    def get_issue_comment_list(self, url): return []
     def _get_repo_name_from_remote(self): return "bench/repo"
     def create_branch(self, name): pass
     def commit_changes(self, msg): pass
     def create_pr(self, title, body, base="main"): return "http://mock.pr/1"
     def post_comment(self, u, b): pass
+    def remove_label(self, u, label): pass
 
 TASKS = {
     "task/1": "Create a function `factorial(n)` in `math_lib.py`.",
@@ -31,36 +38,78 @@ TASKS = {
     "task/10": "Create `to_json(data)` helper in `json_utils.py`."
 }
 
-def run_benchmark():
-    print("🚀 Starting Benchmark (10 tasks)...")
-    success_count = 0
-    total_time = 0
-    
+# Сценарий mock-сервера: выбор файлов -> пустой список, генерация -> один файл
+MOCK_SCRIPT = [
+    {"pattern": "Return JSON list of paths", "response": "[]"},
+    {"pattern": "Задача", "response": "File: `mock.py`\n```python\ndef mock():\n    pass\n```\n"},
+]
+
+def configure_mock(server: MockLLMServer):
+    """
+    Направляет провайдер YandexGPT (не требует дополнительных пакетов) на mock-сервер.
+    """
+    Config.OPENAI_API_KEY = "mock"
+    Config.YC_FOLDER_ID = "mock"
+    Config.YC_API_URL = f"{server.url}/foundationModels/v1"
+    Config.YC_OPERATIONS_URL = f"{server.url}/operations"
+
+def run_task(url: str) -> tuple[bool, float, RunTelemetry | None]:
     agent = CodeAgent(git_provider=MockGitProvider())
-    # Mock LLM if no key (fallback)
-    if not os.getenv("LLM_API_KEY") and not os.getenv("OPENAI_API_KEY"):
-        print("⚠️ No API Key found. Using Mock LLM for demonstration.")
-        agent.llm = MagicMock()
-        agent.llm.generate.return_value = "File: `mock.py`\n```python\ndef mock(): pass\n```"
+    start = time.time()
+    try:
+        # CodeAgent calls self.git.get_issue(issue_url); our MockGitProvider handles this.
+        agent.run(url)
+        return True, time.time() - start, agent.last_run
+    except Exception as e:
+        print(f"   ❌ Failed {url}: {e}")
+        return False, time.time() - start, agent.last_run
+
+def run_benchmark(args):
+    tasks = [list(TASKS)[i % len(TASKS)] for i in range(args.tasks)]
+    server = None
+    if args.mock or (not os.getenv("LLM_API_KEY") and not os.getenv("OPENAI_API_KEY")):
+        print(f"⚠️ Using Mock LLM server (latency={args.latency}, tps={args.tps}, "
+              f"errors={args.error_rate}, 429={args.rate_limit_rate}).")
+        server = MockLLMServer(latency=args.latency, tokens_per_sec=args.tps, error_rate=args.error_rate,
+                               rate_limit_rate=args.rate_limit_rate, script=MOCK_SCRIPT, seed=args.seed).start()
+        configure_mock(server)
+
+    # Агент пишет файлы в текущую директорию — работаем во временной
+    workdir = tempfile.mkdtemp(prefix="agent-bench-")
+    os.chdir(workdir)
+    init_db()
+
+    print(f"🚀 Starting Benchmark ({len(tasks)} tasks, concurrency={args.concurrency})...")
+    wall_start = time.time()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(run_task, tasks))
+    wall = time.time() - wall_start
 
-    for i, (url, prompt) in enumerate(TASKS.items(), 1):
-        print(f"[{i}/10] Running task: {prompt[:30]}...")
-        start = time.time()
-        try:
-            # We override get_issue logic by injecting our prompt via mock, 
-            # but CodeAgent calls self.git.get_issue(issue_url).
-            # Our MockGitProvider handles this.
-            agent.run(url)
-            duration = time.time() - start
-            success_count += 1
-            total_time += duration
-            print(f"   ✅ Success ({duration:.2f}s)")
-        except Exception as e:
-            print(f"   ❌ Failed: {e}")
+    durations = sorted(d for ok, d, _ in results if ok)
+    success_count = len(durations)
+    runs = [run.summary() for _, _, run in results if run]
 
     print("\n📊 Results:")
-    print(f"Success Rate: {success_count}/10 ({success_count*10}%)")
-    print(f"Avg Time: {total_time/10:.2f}s")
+    print(f"Success Rate: {success_count}/{len(tasks)} ({success_count * 100 // max(len(tasks), 1)}%)")
+    if durations:
+        print(f"Avg Time: {statistics.mean(durations):.2f}s | p50 {durations[len(durations) // 2]:.2f}s | "
+              f"p95 {durations[min(len(durations) - 1, int(len(durations) * 0.95))]:.2f}s")
+    print(f"Wall Time: {wall:.2f}s ({len(tasks) / wall:.2f} tasks/s)")
+    if runs:
+        print(f"LLM calls: {sum(r['llm_calls'] for r in runs)} (errors: {sum(r['errors'] for r in runs)}), "
+              f"tokens in/out: {sum(r['tokens_in'] for r in runs)}/{sum(r['tokens_out'] for r in runs)}")
+    if server:
+        print(f"Mock server stats: {server.stats}")
+        server.stop()
 
 if __name__ == "__main__":
-    run_benchmark()
+    parser = argparse.ArgumentParser(description="Code Agent benchmark")
+    parser.add_argument("--tasks", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--mock", action="store_true", help="Использовать mock LLM даже при наличии ключа")
+    parser.add_argument("--latency", default="lognormal:1.0,0.5")
+    parser.add_argument("--tps", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    run_benchmark(parser.parse_args())
@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+sys.path.append(os.getcwd())
+from src.core.config import Config
+from src.core.repo_scanner import RepoMapCache
+
+# Типичный модуль среднего размера: несколько классов и функций
+MODULE_TEMPLATE = '''"""Module {i}."""
+import os
+import json
+from typing import Optional
+
+
+class Service{i}:
+    def __init__(self, name: str, retries: int = 3):
+        self.name = name
+        self.retries = retries
+
+{methods}
+
+def helper_{i}(items: list, key: Optional[str] = None) -> dict:
+    result = {{}}
+    for item in items:
+        result[item.get(key or "id")] = json.dumps(item)
+    return result
+'''
+METHOD_TEMPLATE = '''    def method_{j}(self, value, *args, **kwargs):
+        total = 0
+        for k in range(value):
+            total += k * {j}
+        return os.path.join(self.name, str(total))
+'''
+
+
+def make_repo(root: str, files: int):
+    methods = "\n".join(METHOD_TEMPLATE.format(j=j) for j in range(12))
+    for i in range(files):
+        package = os.path.join(root, f"pkg_{i // 500}")
+        os.makedirs(package, exist_ok=True)
+        with open(os.path.join(package, f"module_{i}.py"), "w") as f:
+            f.write(MODULE_TEMPLATE.format(i=i, methods=methods))
+    for args in (["init", "-q"], ["add", "."], ["-c", "user.email=b@b", "-c", "user.name=b", "commit", "-qm", "init"]):
+        subprocess.run(["git", *args], cwd=root, check=True, capture_output=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк построения карты репозитория по числу процессов")
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--workers", type=int, nargs="*", help="Числа процессов (по умолчанию 1, 2, 4 ... CPU)")
+    args = parser.parse_args()
+    cpus = os.cpu_count() or 1
+    workers = args.workers or sorted({1, *[w for w in (2, 4, 8, 16, 32) if w <= cpus], cpus})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = os.path.join(tmp, "repo")
+        os.makedirs(repo)
+        print(f"Generating {args.files} files...")
+        make_repo(repo, args.files)
+        Config.REPO_MAP_PARALLEL_MIN = 1
+
+        print(f"{'workers':>8} {'cold, s':>9} {'files/s':>9} {'speedup':>8}")
+        baseline = None
+        for count in workers:
+            Config.REPO_MAP_WORKERS = count
+            cache = RepoMapCache(repo, cache_dir=os.path.join(tmp, f"cache-{count}"))
+            start = time.perf_counter()
+            cache.refresh()
+            cold = time.perf_counter() - start
+            baseline = baseline or cold
+            print(f"{count:>8} {cold:>9.2f} {args.files / cold:>9.0f} {baseline / cold:>7.2f}x")
+
+        # Теплый кэш: новый экземпляр (как новый запуск) читает кэш с диска и ничего не разбирает
+        cache = RepoMapCache(repo, cache_dir=os.path.join(tmp, f"cache-{workers[-1]}"))
+        start = time.perf_counter()
+        stats = cache.refresh()
+        repo_map = cache.render()
+        warm = time.perf_counter() - start
+        print(f"Warm cache: {warm:.3f}s ({stats['parsed']} parsed, map {len(repo_map)} chars)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import threading
+import contextvars
+from typing import Callable
+from src.core.llm import LLMRouter, STAGE_SELECTION, STAGE_GENERATION
+from src.core.config import Config
+from src.core.git_provider import GitProvider
+from src.core.telemetry import track_run
+from src.core.candidates import isolated_worktree
+from src.agents.code_agent import CodeAgent
+
+
+class BatchAgent:
+    """
+    Пакетный режим Code Agent: несколько задач одного репозитория за один запуск.
+
+    Карта репозитория и индексы строятся один раз и общие для всех задач. Выбор файлов и генерация
+    для всех задач идут параллельно через общий LLMRouter (провайдеры и их лимиты запросов общие).
+    Когда все ответы получены, правки каждой задачи применяются в отдельном git worktree
+    в свою ветку, и PR открываются по очереди.
+    """
+    def __init__(self, git_provider: GitProvider | None = None,
+                 git_factory: Callable[[str], GitProvider] = GitProvider):
+        self.git = git_provider or GitProvider()
+        # Провайдер для worktree задачи (по пути к нему)
+        self.git_factory = git_factory
+        self.router = LLMRouter()
+        # Провайдеры создаются заранее: LLMRouter создает их лениво и не рассчитан на гонку потоков
+        for stage in (STAGE_SELECTION, STAGE_GENERATION):
+            self.router.get(stage)
+        self._slots = threading.Semaphore(max(Config.BATCH_MAX_CONCURRENCY, 1))
+        self._delivery = threading.Lock()
+
+    def run(self, issue_urls: list[str]) -> list[dict]:
+        """
+        Решает задачи issue_urls и возвращает итог по каждой: status (pr | rejected | not_delivered | failed),
+        pr_url, error.
+        """
+        issue_urls = list(dict.fromkeys(issue_urls))
+        if not issue_urls:
+            return []
+        print(f"Batch Agent: {len(issue_urls)} задач")
+
+        # Карта и индексы — одна предзагрузка на весь пакет
+        base = CodeAgent(git_provider=self.git, router=self.router)
+        base._prefetch(**base._context_prefetch_tasks())
+        shared = dict(base._prefetched)
+
+        results = [{"issue": url, "status": "failed", "pr_url": None, "error": ""} for url in issue_urls]
+        barrier = threading.Barrier(len(issue_urls))
+        threads = [
+            threading.Thread(target=contextvars.copy_context().run,
+                             args=(self._process, url, shared, barrier, result),
+                             name=f"batch-{i}")
+            for i, (url, result) in enumerate(zip(issue_urls, results))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for result in results:
+            print(f"  {result['issue']}: {result['status']} {result['pr_url'] or result['error']}")
+        try:
+            from src.core.db import log_event
+            log_event("batch_completed", base._repo_name(), {"results": results})
+        except Exception as e:
+            print(f"Log Error: {e}")
+        return results
+
+    def _process(self, issue_url: str, shared: dict, barrier: threading.Barrier, result: dict):
+        try:
+            agent = CodeAgent(git_provider=self.git, router=self.router)
+            with track_run("code", agent._repo_name(), issue_url) as run:
+                agent.last_run = run
+                response = None
+                try:
+                    with self._slots:
+                        response = agent._solve(issue_url, shared=shared)
+                    if response is None:
+                        result["status"] = "rejected"
+                except Exception as e:
+                    result["error"] = str(e)
+                    print(f"Batch Agent: {issue_url} failed: {e}")
+                finally:
+                    # PR открываются, когда сгенерированы ответы для всех задач
+                    self._wait_for_batch(barrier)
+                if response is not None:
+                    with self._delivery:
+                        self._deliver(agent, issue_url, response, result)
+        except Exception as e:
+            # Задача упала до барьера (агент, телеметрия): остальные не должны ждать ее
+            barrier.abort()
+            result["error"] = result["error"] or str(e)
+            print(f"Batch Agent: {issue_url} failed: {e}")
+
+    @staticmethod
+    def _wait_for_batch(barrier: threading.Barrier):
+        """
+        Ждет, пока ответы будут готовы для всех задач. Если какая-то задача упала или ждать
+        дольше BATCH_WAIT_TIMEOUT, барьер ломается и каждая задача открывает свой PR без ожидания.
+        """
+        try:
+            barrier.wait(timeout=Config.BATCH_WAIT_TIMEOUT or None)
+        except threading.BrokenBarrierError:
+            print("Batch Agent: не все задачи пакета завершили генерацию, PR открываются без ожидания")
+
+    def _deliver(self, agent: CodeAgent, issue_url: str, response: str, result: dict):
+        """
+        Применяет ответ в отдельном worktree: своя ветка задачи, основное рабочее дерево не меняется.
+        """
+        try:
+            with isolated_worktree(agent.root) as tree:
+                agent.git = self.git_factory(tree)
+                agent.root = tree
+                agent._apply_and_push(response, f"Решение задачи {issue_url.split('/')[-1]}", issue_url)
+        except Exception as e:
+            result["error"] = str(e)
+            print(f"Batch Agent: {issue_url} delivery failed: {e}")
+            return
+        if agent.last_pr_url and agent.last_pr_url.startswith("http"):
+            result.update(status="pr", pr_url=agent.last_pr_url)
+        else:
+            # create_pr возвращает текст ошибки вместо URL
+            result.update(status="not_delivered", error=agent.last_pr_url or "")
@@ -1,18 +1,48 @@
 import os
+import re
 import time
-from src.core.llm import get_llm
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+from src.core.llm import LLMRouter, STAGE_SELECTION, STAGE_GENERATION, STAGE_FIX
 from src.core.config import Config
 from src.core.git_provider import GitProvider
-from src.core.utils import parse_code_blocks, apply_file_changes
+from src.core.telemetry import track_run
+from src.core.prompt_builder import PromptBuilder
+from src.core.pr_state import PRState, load_pr_state, save_pr_state, update_pr_state, summarize_comment
+from src.core.convergence import (STOP_MESSAGES, review_fingerprint, has_guidance, repeated_reviews,
+                                  file_state_fingerprint, check_progress, is_agent_comment, is_command)
+from src.core.checkpoint import RunCheckpoint, load_checkpoint
+from src.core.telemetry import current_run
+from src.core.warmup import is_warm
+from src.core.utils import parse_code_blocks, apply_file_changes, ApplyReport
+from src.core.validation import ValidationReport, validate_changes
 
 class CodeAgent:
     """
     Агент-разработчик.
     Отвечает за анализ задач, генерацию кода и создание Pull Requests.
     """
-    def __init__(self, git_provider: GitProvider | None = None):
-        self.llm = get_llm()
+    def __init__(self, git_provider: GitProvider | None = None, router: LLMRouter | None = None):
+        self.router = router or LLMRouter()
+        self.llm = self.router.get(STAGE_GENERATION)
         self.git = git_provider or GitProvider()
+        # Рабочее дерево, в котором читаются и применяются файлы (в пакетном режиме — отдельный worktree задачи)
+        self.root = "."
+        self.last_run = None
+        self.last_pr_url: str | None = None
+        self._prefetched: dict[str, Future] = {}
+        # Файлы контекста, которые нужны только для чтения (отправляются минифицированными)
+        self._read_only_files: set[str] = set()
+        self._checkpoint: RunCheckpoint | None = None
+        # Состояние PR текущей итерации исправлений (для проверки сходимости перед push)
+        self._fix_state: PRState | None = None
+        self._fix_state_fp = ""
+        self._last_validation = ValidationReport()
+        # Ответ уже проверен в отдельной копии репозитория (best-of-N), повторная проверка не нужна
+        self._prevalidated = False
+        # Последний запрос генерации (модель и системный промпт) — для повторного запроса при ошибках проверки
+        self._last_generation: tuple | None = None
 
     def _log_step(self, message: str, details: dict = None, icon: str = "ℹ️"):
         """
@@ -35,17 +65,160 @@ class CodeAgent:
         """
         Запускает процесс выполнения задачи (Initial Flow).
         """
+        with track_run("code", self._repo_name(), issue_url) as run:
+            self.last_run = run
+            self._run(issue_url)
+
+    def _prefetch(self, **tasks: Callable[[], Any]):
+        """
+        Запускает независимые I/O-запросы (GitHub API, карта репозитория) параллельно.
+        Результаты мемоизируются на время запуска и забираются через _fetched(name).
+        """
+        pool = ThreadPoolExecutor(max_workers=max(len(tasks), 1), thread_name_prefix="prefetch")
+        for name, fn in tasks.items():
+            self._prefetched[name] = pool.submit(contextvars.copy_context().run, fn)
+        pool.shutdown(wait=False)
+
+    def _fetched(self, name: str, fallback: Callable[[], Any] | None = None) -> Any:
+        """
+        Результат предзагрузки (ждет завершения). Если задача не запускалась — вычисляет fallback и запоминает.
+        """
+        if name not in self._prefetched:
+            future: Future = Future()
+            future.set_result(fallback() if fallback else None)
+            self._prefetched[name] = future
+        return self._prefetched[name].result()
+
+    def _build_repo_map(self) -> str:
+        from src.core.repo_scanner import RepoMapGenerator
+        print("Генерация карты репозитория...")
+        repo_map = RepoMapGenerator.generate_map(".")
+        print(f"Карта создана ({len(repo_map)} chars).")
+        return repo_map
+
+    def _load_repo_graph(self):
+        try:
+            from src.core.repo_graph import get_repo_graph
+            return get_repo_graph(self.root)
+        except Exception as e:
+            print(f"Repo graph unavailable: {e}")
+            return None
+
+    def _repo_map_for(self, issue: str, candidates: list[str], only_candidates: bool = False) -> str:
+        """
+        Карта репозитория для выбора файлов. При REPO_MAP_TOKENS > 0 — ранжированная по графу ссылок
+        относительно задачи и ограниченная бюджетом, иначе полная.
+        only_candidates — оставить в карте только кандидатов индекса (режим hybrid).
+        """
+        from src.core.repo_scanner import RepoMapGenerator
+        graph = self._fetched("repo_graph", self._load_repo_graph) if Config.REPO_MAP_TOKENS > 0 else None
+        if graph is None:
+            repo_map = self._fetched("repo_map", self._build_repo_map)
+            return RepoMapGenerator.filter_map(repo_map, candidates) if only_candidates else repo_map
+        model = self.router.get(STAGE_SELECTION).model
+        repo_map = graph.render(issue, Config.REPO_MAP_TOKENS, candidates,
+                                only=candidates if only_candidates else None, model=model)
+        print(f"Ранжированная карта: {len(repo_map)} chars из {len(graph.entries)} файлов.")
+        return repo_map
+
+    def _load_retrieval_index(self):
+        try:
+            from src.core.retrieval import get_retrieval_index
+            return get_retrieval_index(".")
+        except Exception as e:
+            print(f"Retrieval index unavailable: {e}")
+            return None
+
+    def _load_history_index(self):
+        try:
+            from src.core.history_index import get_history_index
+            return get_history_index(".")
+        except Exception as e:
+            print(f"History index unavailable: {e}")
+            return None
+
+    def _context_prefetch_tasks(self) -> dict[str, Callable[[], Any]]:
+        """
+        Что нужно для выбора файлов контекста при текущем FILE_SELECTION_MODE.
+        """
+        tasks: dict[str, Callable[[], Any]] = {}
+        if Config.FILE_SELECTION_MODE != "index":
+            if Config.REPO_MAP_TOKENS > 0 or Config.FILE_SELECTION_MODE == "hierarchical":
+                tasks["repo_graph"] = self._load_repo_graph
+            else:
+                tasks["repo_map"] = self._build_repo_map
+        if Config.FILE_SELECTION_MODE in ("index", "hybrid"):
+            tasks["retrieval"] = self._load_retrieval_index
+        if Config.HISTORY_COMPANIONS > 0:
+            tasks["history"] = self._load_history_index
+        return tasks
+
+    def _open_checkpoint(self, *inputs: str) -> RunCheckpoint | None:
+        """
+        Контрольная точка запуска. Ключ — входные данные, HEAD репозитория и параметры генерации:
+        повторный запуск возобновляется, только если ответ LLM был бы получен для того же кода.
+        """
+        checkpoint = load_checkpoint(*inputs, self._head_sha(), self.llm.model, Config.EDIT_FORMAT,
+                                     Config.FILE_SELECTION_MODE)
+        if checkpoint and checkpoint.last_stage:
+            self._log_step(f"Resuming from checkpoint (stage: {checkpoint.last_stage})", icon="⏯️",
+                           details={"stages": [s for s in checkpoint.data if s != "updated_at"]})
+            run = current_run()
+            if run:
+                run.annotate(resumed_from=checkpoint.last_stage)
+        return checkpoint
+
+    @staticmethod
+    def _checkpoint_comments(comments: list[dict]) -> list[str]:
+        """
+        Комментарии, которые входят в ключ контрольной точки: команды (/retry) и сообщения самого агента
+        не меняют задачу, и повтор после них должен продолжить прерванный запуск.
+        """
+        return [c["body"] for c in comments if not is_agent_comment(c) and not is_command(c["body"])]
+
+    def _repo_name(self) -> str:
+        try:
+            return self.git._get_repo_name_from_remote() or "unknown"
+        except Exception:
+            return "unknown"
+
+    def _run(self, issue_url: str):
+        response = self._solve(issue_url)
+        if response is not None:
+            # 4. Обработка ответа и создание PR
+            self._apply_and_push(response, f"Решение задачи {issue_url.split('/')[-1]}", issue_url)
+
+    def _solve(self, issue_url: str, shared: dict[str, Future] | None = None) -> str | None:
+        """
+        Этапы до генерации включительно: задача, валидация, контекст, ответ LLM.
+        shared — уже запущенные предзагрузки (карта, индексы), общие для нескольких задач пакетного режима.
+        Возвращает None, если задача отклонена.
+        """
         self.current_issue_url = issue_url
+        self._prefetched = dict(shared or {})
+        self._checkpoint = None
+        self._prevalidated = False
         print(f"Code Agent запущен для задачи: {issue_url}")
         
+        # 0. Независимые запросы стартуют одной параллельной волной
+        self._prefetch(
+            issue=lambda: self.git.get_issue(issue_url),
+            comments=lambda: self.git.get_issue_comment_list(issue_url),
+            **{name: fn for name, fn in self._context_prefetch_tasks().items() if name not in self._prefetched},
+        )
+        run = current_run()
+        if run:
+            run.annotate(warm_cache=is_warm(self.root))
         self._log_step(f"Started working on Issue {issue_url.split('/')[-1]}", icon="🏁")
         
         # 1. Чтение задачи
         self._log_step("Fetching Issue content...", icon="📥")
-        issue_content = self.git.get_issue(issue_url)
+        issue_body = self._fetched("issue")
+        issue_content = issue_body
         
         # 1.a Добавляем комментарии (User Refinement)
-        comments = self.git.get_issue_comments(issue_url)
+        comment_list = self._fetched("comments") or []
+        comments = GitProvider.format_issue_comments(comment_list)
         if comments:
             print(f"Найдены комментарии к задаче ({len(comments)} chars). Добавляем в контекст.")
             issue_content += f"\n\nUPDATES (Comments):\n{comments}"
@@ -74,9 +247,13 @@ class CodeAgent:
             from src.core.db import log_event
             repo_name = self.git._get_repo_name_from_remote() or "unknown"
             log_event("agent_error", repo_name, {"error": "Validation Failed", "reason": reason})
-            return
+            return None
             
         self._log_step("Validation Passed. Starting pipeline.", icon="✅")
+        checkpoint = self._checkpoint = self._open_checkpoint("code", issue_url, issue_body,
+                                                              *self._checkpoint_comments(comment_list))
+        if checkpoint and not checkpoint.get("issue"):
+            checkpoint.save("issue", {"url": issue_url, "content": issue_content})
 
         # 2. Сбор контекста
         self._log_step("Analyzing repository context...", icon="🔍")
@@ -84,23 +261,27 @@ class CodeAgent:
         
         # 3. Генерация плана и кода
         system_prompt = self._get_system_prompt()
-        user_prompt = f"""
+        builder = PromptBuilder.for_llm(self.llm, """
 Текущие файлы проекта:
 {context}
 
 Задача:
-{issue_content}
-
+{task}
+{comments}
 Задание:
 Проанализируй задачу и перепиши необходимые файлы для её решения или реализации фичи.
-Верни ПОЛНОЕ содержимое модифицированных файлов.
-"""
-        print("Запрос к LLM...")
-        self._log_step("Thinking... (Querying LLM)", icon="🧠")
-        response = self.llm.generate(system_prompt, user_prompt)
-        
-        # 4. Обработка ответа и создание PR
-        self._apply_and_push(response, f"Решение задачи {issue_url.split('/')[-1]}", issue_url)
+{output}
+""", system_prompt)
+        builder.add("output", self._output_instruction(), priority=100, min_tokens=200)
+        builder.add("task", issue_body, priority=100, min_tokens=2000)
+        builder.add("comments", f"\nUPDATES (Comments):\n{comments}" if comments else "", priority=80, strategy="head")
+        builder.add("context", context, priority=50, strategy="blocks")
+        user_prompt = self._build_prompt(builder)
+        if Config.CANDIDATES > 1 and not (checkpoint and checkpoint.get("response")):
+            response = self._generate_best(self.llm, system_prompt, user_prompt, Config.CANDIDATES)
+        else:
+            response = self._generate(self.llm, system_prompt, user_prompt)
+        return response
 
     def _validate_issue(self, content: str) -> tuple[bool, str]:
         """
@@ -128,12 +309,52 @@ class CodeAgent:
         """
         Запускает цикл исправления на основе ревью.
         """
+        with track_run("fix", self._repo_name(), pr_url) as run:
+            self.last_run = run
+            self._run_fix(pr_url, issue_url)
+
+    def _run_fix(self, pr_url: str, issue_url: str):
+        self._prefetched = {}
+        self._checkpoint = None
+        self._prevalidated = False
+        self._fix_state = None
         print(f"Code Agent запущен в режиме FIX для PR: {pr_url}")
+
+        # 0. Запросы к API стартуют параллельно. Комментарии берутся из локального состояния PR,
+        # которое пополняется webhooks; полный обход через API — только если истории там нет
+        # или число комментариев в API не совпадает с сохраненным (пропущенный webhook)
+        state = load_pr_state(pr_url)
+        issue_url = state.issue_url or issue_url
+        tasks = dict(
+            issue=lambda: self.git.get_issue(issue_url),
+            pr_files=lambda: self.git.get_pr_files(pr_url),
+            pr_diff=lambda: self.git.get_pr_diff(pr_url),
+        )
+        if state.comments_synced:
+            tasks["pr_comment_count"] = lambda: self.git.get_pr_comment_count(pr_url)
+        else:
+            tasks["pr_comments"] = lambda: self.git.get_pr_comment_list(pr_url)
+        self._prefetch(**tasks)
         self._log_step(f"Starting Fix Loop for PR {pr_url.split('/')[-1]}", icon="🔧", details={"pr_url": pr_url})
+        if state.comments_synced:
+            api_count = self._fetched("pr_comment_count")
+            if api_count is not None and api_count != len(state.comments):
+                print(f"Комментариев в API {api_count}, в локальном состоянии {len(state.comments)}: синхронизация.")
+                state.comments_synced = False
+        if not state.comments_synced:
+            api_comments = self._fetched("pr_comments", lambda: self.git.get_pr_comment_list(pr_url))
+            synced = update_pr_state(pr_url, lambda s: s.sync_comments(api_comments))
+            if synced is None:
+                state.sync_comments(api_comments)
+            else:
+                state = synced
+        else:
+            print(f"Комментарии PR из локального состояния ({len(state.comments)}), без обхода API.")
+        state.issue_url = state.issue_url or issue_url
         
         # 1. Проверка лимита итераций
-        comments = self.git.get_pr_comments(pr_url)
-        request_changes_count = comments.count("[REQUEST_CHANGES]")
+        comments = state.comments
+        request_changes_count = state.request_changes_count
         
         if request_changes_count >= Config.MAX_ITERATIONS:
              print(f"CRITICAL: Достигнут лимит итераций ({Config.MAX_ITERATIONS}). Остановка.")
@@ -141,65 +362,304 @@ class CodeAgent:
              self.git.post_comment(pr_url, f"❌ Code Agent остановил работу: превышен лимит итераций ({Config.MAX_ITERATIONS}). Требуется вмешательство человека.")
              return
 
+        # Только замечания, появившиеся после прошлой итерации
+        new_comments = state.new_comments(comments)
+        if not new_comments:
+            print("Новых замечаний с прошлой итерации нет.")
+            self._log_step("No new review comments since the last fix. Nothing to do.", icon="💤")
+            return
+
+        # Ревьюер повторяет замечания, которые уже исправлялись: новая итерация вряд ли сойдется
+        review_fp = review_fingerprint(new_comments)
+        repeats = repeated_reviews(state.iterations, review_fp, Config.FIX_REVIEW_SIMILARITY)
+        if Config.FIX_REPEAT_LIMIT and repeats >= Config.FIX_REPEAT_LIMIT and not has_guidance(new_comments):
+            self._stop_fix_loop(state, "repeated_review", new_comments)
+            return
+        self._fix_state = state
+
         # 2. Checkout ветки PR
         self._log_step("Checking out PR branch...", icon="🌿")
         self.git.checkout_pr(pr_url)
         
-        # 3. Сбор информации
+        # 3. Сбор информации: файлы PR и файлы из новых замечаний вместо полного Smart Context
         self._log_step("Reading PR comments and diff...", icon="📖")
-        issue_content = self.git.get_issue(issue_url)
-        pr_comments = self.git.get_pr_comments(pr_url)
-        pr_diff = self.git.get_pr_diff(pr_url)
-        context = self._get_context() # Текущее состояние файлов
+        issue_content = self._fetched("issue")
+        pr_comments = self.git.format_comments(new_comments)
+        referenced = self._referenced_files(new_comments)
+        touched = list(dict.fromkeys(state.touched_files + self._fetched("pr_files")))
+        delta_files = [p for p in dict.fromkeys(referenced + touched) if os.path.isfile(p)]
+        if delta_files:
+            self._log_step(f"Delta context: {len(delta_files)} files (PR + review references)", icon="🧩",
+                           details={"files": delta_files, "new_comments": len(new_comments)})
+            context = self._read_files(delta_files, pr_comments)
+        else:
+            # Карта и индекс строятся по файлам ветки PR, поэтому только после checkout
+            self._prefetch(**self._context_prefetch_tasks())
+            context = self._get_context()
+        pr_diff = self._fetched("pr_diff")
+        if state.iterations and referenced:
+            # На повторных итерациях diff нужен только по файлам, о которых новые замечания
+            pr_diff = self._filter_diff(pr_diff, set(referenced))
         
         # 3. Генерация исправлений
+        fix_llm = self.router.get(STAGE_FIX)
+        key_comments = [c for c in new_comments if not is_agent_comment(c) and not is_command(c["body"])]
+        self._checkpoint = self._open_checkpoint("fix", pr_url, ",".join(c["id"] for c in key_comments),
+                                                 self.git.format_comments(key_comments))
         system_prompt = self._get_system_prompt()
-        user_prompt = f"""
+        builder = PromptBuilder.for_llm(fix_llm, """
 МЫ НАХОДИМСЯ НА ИТЕРАЦИИ ИСПРАВЛЕНИЙ.
 
-Код проекта:
+Код проекта (файлы PR и файлы из замечаний):
 {context}
 
 Изменения в PR (Diff):
-{pr_diff}
+{diff}
 
 Оригинальная задача:
-{issue_content}
+{task}
 
-ЗАМЕЧАНИЯ РЕВЬЮЕРА (Comments):
-{pr_comments}
+Предыдущие итерации исправлений:
+{history}
+
+НОВЫЕ ЗАМЕЧАНИЯ РЕВЬЮЕРА (Comments):
+{comments}
 
 Задание:
-Исправь код согласно замечаниям ревьюера.
-Верни ПОЛНОЕ содержимое исправленных файлов.
-"""
+Исправь код согласно новым замечаниям ревьюера.
+{output}
+""", system_prompt)
+        builder.add("output", self._output_instruction(), priority=100, min_tokens=200)
+        builder.add("comments", pr_comments, priority=100, strategy="head", min_tokens=2000)
+        builder.add("task", issue_content, priority=90, min_tokens=1000)
+        builder.add("history", state.summary() or "—", priority=70, strategy="tail")
+        builder.add("diff", pr_diff, priority=60, strategy="blocks")
+        builder.add("context", context, priority=50, strategy="blocks")
+        user_prompt = self._build_prompt(builder)
+
         print("Запрос к LLM для исправлений...")
         self._log_step("Analyzing Reviewer feedback...", icon="🧐")
-        self._log_step("Thinking... (Generating Fix)", icon="🧠")
-        response = self.llm.generate(system_prompt, user_prompt)
+        response = self._generate(fix_llm, system_prompt, user_prompt)
         
         # 4. Применение и пуш
-        self._apply_and_push(response, "Исправления по замечаниям ревью", issue_url, is_fix=True)
+        report = self._apply_and_push(response, "Исправления по замечаниям ревью", issue_url, is_fix=True)
+        if report and report.written:
+            # Замечания считаются обработанными, только если правки дошли до PR
+            head_sha = self._head_sha()
+
+            def record(s):
+                s.issue_url = s.issue_url or issue_url
+                s.record_iteration(new_comments, report.written, self._fix_state_fp, review_fp)
+                s.last_fixed_sha = head_sha or s.last_fixed_sha
+            if update_pr_state(pr_url, record) is None:
+                record(state)
+                save_pr_state(state)
+
+    def _stop_fix_loop(self, state: PRState, reason: str, comments: list[dict]):
+        """
+        Останавливает цикл исправлений, который не сходится, и оставляет в PR сводку для человека.
+        """
+        from src.core.db import log_event
+        iterations = state.iteration_count
+        points = "\n".join(f"- {summarize_comment(c)}" for c in comments[:5])
+        body = (
+            f"⏸️ Code Agent остановил цикл исправлений: {STOP_MESSAGES[reason]}.\n\n"
+            f"Выполнено итераций: {iterations}. Изменявшиеся файлы: {', '.join(state.touched_files) or '—'}.\n\n"
+            f"Последние замечания:\n{points}\n\n"
+            f"Требуется решение человека: уточните замечания в комментарии с `/fix` или внесите правки вручную."
+        )
+        self.git.post_comment(state.pr_url, body)
+        self._log_step(f"Fix loop stopped early: {reason}", icon="🛑",
+                       details={"reason": reason, "iterations": iterations})
+        log_event("agent_error", self._repo_name(), {"error": "Fix loop did not converge", "reason": reason,
+                                                      "pr": state.pr_url, "iterations": iterations})
+        run = current_run()
+        if run:
+            run.annotate(stop_reason=reason, fix_iterations=iterations)
+
+    def _validate_and_repair(self, report: ApplyReport) -> bool:
+        """
+        Проверяет измененные файлы до коммита. При ошибках один раз просит LLM их исправить
+        и применяет исправления поверх (report дополняется). Возвращает True, если код прошел проверку.
+        """
+        validation = self._last_validation = validate_changes(report.written, root=self.root)
+        if validation.ok:
+            self._log_step(f"Local validation passed ({len(validation.checked)} files)", icon="🧪")
+            return True
+        self._log_step(f"Local validation failed: {len(validation.errors)} errors. Asking LLM to repair...", icon="🧪",
+                       details={"errors": [e.describe() for e in validation.errors]})
+        repair = self._repair(report.written, validation)
+        if repair is None or not repair.written:
+            return False
+        report.written += [p for p in repair.written if p not in report.written]
+        report.conflicts += repair.conflicts
+        validation = self._last_validation = validate_changes(report.written, root=self.root)
+        if validation.ok:
+            self._log_step("Local validation passed after repair", icon="🩹")
+            return True
+        self._log_step(f"Local validation still fails after repair ({len(validation.errors)} errors)", icon="🛑",
+                       details={"errors": [e.describe() for e in validation.errors]})
+        return False
+
+    def _repair(self, written: list[str], validation: ValidationReport) -> ApplyReport | None:
+        if self._last_generation is None:
+            return None
+        llm, system_prompt = self._last_generation
+        checkpoint = self._checkpoint
+        response = checkpoint.get("repair") if checkpoint else None
+        if response is None:
+            # Файлы с ошибками идут первыми и целиком редактируемыми: правки применяются к их текущему тексту
+            paths = validation.failed_paths + [p for p in written if p not in validation.failed_paths]
+            self._read_only_files.difference_update(paths)
+            builder = PromptBuilder.for_llm(llm, """
+После применения твоих правок локальная проверка нашла ошибки:
+{errors}
+
+Текущее содержимое измененных файлов:
+{files}
+
+Исходная задача:
+{task}
+
+Задание:
+Исправь только эти ошибки, не меняя остальной код.
+{output}
+""", system_prompt)
+            builder.add("errors", validation.summary(), priority=100, strategy="head", min_tokens=1000)
+            builder.add("output", self._output_instruction(), priority=100, min_tokens=200)
+            builder.add("task", self._fetched("issue") or "", priority=70, min_tokens=500)
+            builder.add("files", self._read_files(paths, validation.summary()), priority=60, strategy="blocks")
+            response = llm.generate(system_prompt, self._build_prompt(builder))
+            if checkpoint and response:
+                checkpoint.save("repair", response)
+        changes = parse_code_blocks(response or "")
+        if not changes:
+            return None
+        return apply_file_changes(changes, root=self.root)
+
+    def _discard_changes(self, paths: list[str]):
+        for path in paths:
+            try:
+                self.git.repo.git.checkout("--", path)
+            except Exception:
+                pass
+
+    def _generate(self, llm, system_prompt: str, user_prompt: str) -> str:
+        """
+        Генерация кода; ответ сохраняется в контрольной точке и при возобновлении не запрашивается повторно.
+        """
+        self._last_generation = (llm, system_prompt)
+        checkpoint = self._checkpoint
+        if checkpoint and checkpoint.get("response") is not None:
+            self._log_step("Reusing LLM response from checkpoint", icon="♻️")
+            return checkpoint.get("response")
+        print("Запрос к LLM...")
+        self._log_step("Thinking... (Querying LLM)", icon="🧠")
+        response = llm.generate(system_prompt, user_prompt)
+        if checkpoint and response:
+            checkpoint.save("response", response)
+        return response
+
+    def _generate_best(self, llm, system_prompt: str, user_prompt: str, n: int) -> str:
+        """
+        Best-of-N: n вариантов генерируются и проверяются параллельно в отдельных worktree,
+        дальше идет лучший (прошедший проверку, с наименьшим числом замечаний и diff).
+        """
+        from src.core.candidates import generate_candidates, select_best
+        self._last_generation = (llm, system_prompt)
+        self._log_step(f"Thinking... (Generating {n} candidate solutions)", icon="🧠")
+        candidates = generate_candidates(llm, system_prompt, user_prompt, n)
+        best = select_best(candidates)
+        details = [c.describe() for c in candidates]
+        run = current_run()
+        if run:
+            run.annotate(candidates=n, candidates_evaluated=len(candidates),
+                         candidates_passed=sum(c.passed for c in candidates),
+                         chosen_candidate=best.index if best else None)
+        if best is None:
+            self._log_step("No candidate produced a response", icon="⚠️", details={"candidates": details})
+            return ""
+        self._log_step(f"Chose candidate {best.index + 1} of {len(candidates)} "
+                       f"({sum(c.passed for c in candidates)} passed validation)", icon="🏆",
+                       details={"candidates": details})
+        self._prevalidated = best.passed
+        if self._checkpoint:
+            self._checkpoint.save("response", best.response)
+        return best.response
+
+    def _head_sha(self) -> str:
+        try:
+            # Отдельный процесс git: общий объект Repo (пакетный режим) не рассчитан на обращения из потоков
+            return self.git.repo.git.rev_parse("HEAD")
+        except Exception:
+            return ""
+
+    def _referenced_files(self, comments: list[dict]) -> list[str]:
+        """
+        Файлы репозитория, о которых говорят замечания: путь review-комментария
+        и упоминания путей или имен файлов в тексте.
+        """
+        from src.core.repo_files import list_repo_files
+        known = list(list_repo_files("."))
+        by_name: dict[str, list[str]] = {}
+        for path in known:
+            by_name.setdefault(os.path.basename(path), []).append(path)
+
+        found = []
+        for comment in comments:
+            if comment.get("path"):
+                found.append(comment["path"])
+            for word in re.findall(r"[\w./-]+\.\w+", comment["body"]):
+                word = word.strip("./")
+                if word in by_name and len(by_name[word]) == 1:
+                    found.append(by_name[word][0])
+                elif word in known:
+                    found.append(word)
+        return list(dict.fromkeys(found))
+
+    @staticmethod
+    def _filter_diff(pr_diff: str, paths: set[str]) -> str:
+        blocks = [b for b in pr_diff.split("\n---\n") if b.strip()]
+        kept = [b for b in blocks if b.startswith("File: ") and b.splitlines()[0][6:].strip() in paths]
+        return "\n---\n".join(kept) + "\n---\n" if kept else pr_diff
+
+    def _build_prompt(self, builder: PromptBuilder) -> str:
+        """
+        Собирает промпт в пределах бюджета токенов и логирует, что пришлось урезать.
+        """
+        prompt = builder.build()
+        trimmed = builder.summary()
+        if trimmed:
+            dropped = [path for r in builder.report for path in r.dropped]
+            self._log_step(f"Prompt trimmed to fit {builder.budget_tokens} tokens ({trimmed})", icon="✂️",
+                           details={"dropped_files": dropped})
+        return prompt
 
-    def _apply_and_push(self, llm_response: str, title: str, issue_url: str, is_fix: bool = False):
+    def _apply_and_push(self, llm_response: str, title: str, issue_url: str, is_fix: bool = False) -> ApplyReport | None:
         """
         Парсит ответ, примененияет изменения, коммитит и пушит (создает PR если нужно).
+        Возвращает отчет о применении (None, если LLM не вернула изменений или цикл исправлений остановлен).
         """
         from src.core.db import log_event
         
-        changes = parse_code_blocks(llm_response)
+        checkpoint = self._checkpoint
+        changes = checkpoint.get("changes") if checkpoint else None
+        if changes is None:
+            changes = parse_code_blocks(llm_response)
+            if checkpoint and changes:
+                checkpoint.save("changes", changes)
         repo_name = self.git._get_repo_name_from_remote() or "unknown/repo"
         
         if not changes:
             print("LLM не сгенерировала изменений.")
             self._log_step("LLM did not return any code changes.", icon="⚠️")
             log_event("agent_error", repo_name, {"error": "LLM returned no code changes", "issue": issue_url})
-            return
+            return None
 
         # Если это новая задача, создаем ветку (если не fix mode, где мы уже на ветке)
         if not is_fix:
             timestamp = int(time.time())
-            branch_name = f"fix/issue-{timestamp}"
+            branch_name = f"fix/issue-{issue_url.split('/')[-1]}-{timestamp}"
             self.git.create_branch(branch_name)
             self._log_step(f"Created branch `{branch_name}`", icon="🌿")
         
@@ -207,7 +667,40 @@ class CodeAgent:
         file_list = [c.get('path', c.get('file', 'unknown')) for c in changes]
         self._log_step(f"Applying changes to {len(file_list)} files: {', '.join(file_list)}", icon="📝")
         
-        apply_file_changes(changes)
+        state_before = file_state_fingerprint([c["path"] for c in changes]) if is_fix else ""
+        report = apply_file_changes(changes, root=self.root)
+        if report.conflicts:
+            self._log_step(f"{len(report.conflicts)} edits could not be applied", icon="⚠️",
+                           details={"conflicts": [c.describe() for c in report.conflicts]})
+            log_event("agent_error", repo_name, {"error": "Edit conflicts", "issue": issue_url,
+                                                 "conflicts": report.summary()})
+        if not report.written:
+            print("Ни одно изменение не применилось.")
+            self._log_step("No changes could be applied. Stopping.", icon="🛑")
+            return report
+
+        if is_fix and self._fix_state is not None:
+            # Те же правки повторно или возврат к коду прошлой итерации — цикл не сходится, push не нужен
+            self._fix_state_fp = file_state_fingerprint([c["path"] for c in changes])
+            reason = check_progress(self._fix_state.iterations, state_before, self._fix_state_fp)
+            if reason:
+                self._discard_changes(report.written)
+                self._stop_fix_loop(self._fix_state, reason, self._fix_state.new_comments(self._fix_state.comments))
+                return None
+
+        if Config.VALIDATION_ENABLED and not self._prevalidated and not self._validate_and_repair(report):
+            # Сломанный код не коммитится: ревьюер и CI его не увидят. Повтор должен сгенерировать код заново
+            self._discard_changes(report.written)
+            if checkpoint:
+                checkpoint.clear()
+            target = self._fix_state.pr_url if is_fix and self._fix_state else issue_url
+            self.git.post_comment(target, (
+                "⚠️ Code Agent не отправил изменения: локальная проверка нашла ошибки, "
+                "которые не удалось исправить автоматически.\n\n" + self._last_validation.summary()
+            ))
+            log_event("agent_error", repo_name, {"error": "Local validation failed", "issue": issue_url,
+                                                 "errors": self._last_validation.summary()})
+            return None
         
         # Коммит
         self.git.commit_changes(title)
@@ -221,6 +714,8 @@ class CodeAgent:
             self.git.create_pr("Update", "Fixes", "main") # create_pr делает push
             print(f"Изменения отправлены в PR.")
             self._log_step("Fix pushed to PR successfully", icon="✅")
+            if checkpoint:
+                checkpoint.clear()
             log_event("agent_action", repo_name, {"action": "changes_pushed", "pr": issue_url}) # issue_url here is PR url in fix mode
         else:
             # 6. Коммит и создание PR
@@ -230,11 +725,15 @@ class CodeAgent:
             
             self._log_step("Creating Pull Request...", icon="🚀")
             
+            pr_body = f"Реализованы изменения на основе описания задачи.\n\nCloses #{issue_number}"
+            if report.conflicts:
+                pr_body += f"\n\n⚠️ Не удалось применить часть правок:\n\n{report.summary()}"
             pr_url = self.git.create_pr(
                 title=f"Fix: Issue {issue_number}", 
-                body=f"Реализованы изменения на основе описания задачи.\n\nCloses #{issue_number}"
+                body=pr_body
             )
             
+            self.last_pr_url = pr_url
             print(f"Code Agent завершил работу. PR создан: {pr_url}")
             
             self._log_step(f"Pull Request Created: {pr_url}", icon="🎉", details={"pr_url": pr_url})
@@ -248,6 +747,9 @@ class CodeAgent:
             })
             
             # COMMENT ON ISSUE
+            if checkpoint and "Error creating PR" not in pr_url:
+                # Запуск завершен; при ошибке API контрольная точка остается для /retry
+                checkpoint.clear()
             if "Error creating PR" in pr_url:
                  comment_body = (
                     f"⚠️ **Task Completed but PR Failed**\n\n"
@@ -262,6 +764,7 @@ class CodeAgent:
                     f"Please review the changes."
                 )
             self.git.post_comment(issue_url, comment_body)
+        return report
 
     def _get_context(self) -> str:
         """
@@ -273,95 +776,296 @@ class CodeAgent:
             print("RepoMapGenerator not found. Falling back to naive scan.")
             return self._get_context_legacy()
 
-        # 1. Generate Map
-        print("Генерация карты репозитория...")
         self._log_step("Scanning repository structure (Smart Context)...", icon="📡")
-        repo_map = RepoMapGenerator.generate_map(".")
-        print(f"Карта создана ({len(repo_map)} chars).")
+        self._read_only_files = set()
+        issue_content = self._fetched("issue", lambda: self.git.get_issue(self.current_issue_url)
+                                      if hasattr(self, 'current_issue_url') else "Task")
 
-        # 2. Select Files via LLM
-        issue_content = self.git.get_issue(self.current_issue_url) if hasattr(self, 'current_issue_url') else "Task"
-        relevant_files = self._select_relevant_files(issue_content, repo_map)
-        
-        self._log_step(f"AI Selected {len(relevant_files)} relevant files", icon="🎯", details={"files": relevant_files})
-        print(f"LLM выбрала файлы: {relevant_files}")
+        selection = self._checkpoint.get("selection") if self._checkpoint else None
+        if selection is not None:
+            self._read_only_files = set(selection["read_only"])
+            self._log_step(f"Reusing {len(selection['files'])} selected files from checkpoint", icon="♻️",
+                           details={"files": selection["files"]})
+            return self._read_files(selection["files"], issue_content)
+
+        # 1. Локальное ранжирование файлов (индекс обычно уже обновлен предзагрузкой)
+        mode = Config.FILE_SELECTION_MODE
+        index = self._fetched("retrieval", self._load_retrieval_index) if mode in ("index", "hybrid") else None
+        history = self._fetched("history", self._load_history_index) if Config.HISTORY_COMPANIONS > 0 else None
+        ranked = []
+        if index is not None:
+            start = time.perf_counter()
+            ranked = [path for path, _ in index.rank(issue_content, Config.RETRIEVAL_PREFILTER_K)]
+            print(f"Индекс ранжировал {len(index)} файлов за {(time.perf_counter() - start) * 1000:.0f}ms")
+            if history is not None:
+                # Файлы, которые менялись под похожие задачи, тоже попадают в кандидаты
+                ranked += [p for p, _ in history.similar_files(issue_content, Config.RETRIEVAL_TOP_K) if p not in ranked]
+
+        if mode == "index" and index is not None:
+            relevant_files = ranked[:Config.RETRIEVAL_TOP_K]
+            self._log_step(f"Index selected {len(relevant_files)} relevant files", icon="🎯",
+                           details={"files": relevant_files})
+        elif mode == "hierarchical" and (relevant_files := self._select_hierarchical(issue_content)) is not None:
+            self._remember_selection(issue_content, relevant_files, mode)
+            self._log_step(f"AI Selected {len(relevant_files)} relevant files in two stages", icon="🎯",
+                           details={"files": relevant_files})
+        else:
+            # 2. Select Files via LLM (в режиме hybrid — только среди кандидатов индекса)
+            prefilter = bool(ranked) and len(index) > Config.RETRIEVAL_PREFILTER_K
+            repo_map = self._repo_map_for(issue_content, ranked, only_candidates=prefilter)
+            if prefilter:
+                self._log_step(f"Index pre-filtered repo map to {len(ranked)} of {len(index)} files", icon="🔎")
+            relevant_files = self._select_relevant_files(issue_content, repo_map)
+            if relevant_files is None:
+                relevant_files = ranked[:Config.RETRIEVAL_TOP_K]
+                self._log_step("LLM file selection failed, using index ranking", icon="⚠️",
+                               details={"files": relevant_files})
+            else:
+                self._remember_selection(issue_content, relevant_files, mode)
+                self._log_step(f"AI Selected {len(relevant_files)} relevant files", icon="🎯",
+                               details={"files": relevant_files})
+        if history is not None and relevant_files:
+            companions = [p for p, _ in history.companions(relevant_files, Config.HISTORY_COMPANIONS)]
+            if companions:
+                relevant_files = relevant_files + companions
+                self._read_only_files.update(companions)
+                self._log_step(f"Added {len(companions)} files that usually change together", icon="🔗",
+                               details={"files": companions})
+        print(f"Выбраны файлы: {relevant_files}")
+        if self._checkpoint:
+            self._checkpoint.save("selection", {"files": relevant_files, "read_only": sorted(self._read_only_files)})
         
         # 3. Read Files
+        return self._read_files(relevant_files, issue_content)
+
+    def _read_files(self, paths: list[str], query: str) -> str:
+        """
+        Файлы контекста для промпта. Большие файлы режутся до символов, релевантных query,
+        файлы только для чтения минифицируются.
+        """
+        from src.core.context_slicer import render_context_file
         context = ""
-        for path in relevant_files:
-            if os.path.exists(path) and os.path.isfile(path):
-                try:
-                    with open(path, "r", encoding="utf-8") as f:
-                        content = f.read()
-                    context += f"\nFile: `{path}`\n```\n{content}\n```\n"
-                except Exception as e:
-                    print(f"Failed to read {path}: {e}")
+        for path in paths:
+            full_path = os.path.join(self.root, path)
+            if os.path.isfile(full_path):
+                content = render_context_file(full_path, query, editable=path not in self._read_only_files)
+                if content is None:
+                    print(f"Skipping binary or unreadable file: {path}")
+                    continue
+                context += f"\nFile: `{path}`\n```\n{content}\n```\n"
             else:
                  # File might be new (to be created), so we just skip reading it
                  pass
                  
         return context
 
-    def _select_relevant_files(self, issue: str, repo_map: str) -> list[str]:
+    def _remember_selection(self, issue: str, files: list[str], source: str):
+        """
+        История выборов LLM нужна для оценки recall локального индекса (python -m src.core.retrieval --eval).
+        """
+        if not files:
+            return
+        try:
+            from src.core.retrieval import record_selection
+            record_selection(issue, files, source)
+        except Exception as e:
+            print(f"Failed to record file selection: {e}")
+
+    def _select_relevant_files(self, issue: str, repo_map: str) -> list[str] | None:
         """
         Asks LLM to select relevant files based on the map.
+        Returns None if the model call failed or the answer is not a JSON list.
+        """
+        selection = self._choose_files(issue, repo_map)
+        if selection is None:
+            return None
+        files, self._read_only_files = selection
+        return files
+
+    def _choose_files(self, issue: str, repo_map: str) -> tuple[list[str], set[str]] | None:
+        """
+        Один запрос выбора файлов по карте: (файлы, из них только для чтения) или None.
         """
         system_prompt = """You are a Principal Software Architect.
 Your task is to identify which files in the repository are relevant to a specific Issue/Task.
-You must return a raw JSON list of file paths.
+You must return raw JSON: files that need to be modified and files needed only as read-only context.
 
 Example Output:
-["src/main.py", "src/auth/login.py"]
+{"modify": ["src/auth/login.py"], "read": ["src/main.py"]}
 
-Do not output ANY explanation. Just the JSON list.
+Do not output ANY explanation. Just the JSON.
 """
-        user_prompt = f"""
+        selection_llm = self.router.get(STAGE_SELECTION)
+        builder = PromptBuilder.for_llm(selection_llm, """
 REPO MAP:
 {repo_map}
 
 TASK:
-{issue}
+{task}
 
 Which files should I read or modify to solve this task?
-Includes files that need to be modified and files that provide necessary context (definitions, helpers).
+Put files that need to be modified into "modify" and files that only provide necessary context (definitions, helpers) into "read".
 If the task requires creating a new file, do not list it here (as it doesn't exist yet), unless you need to check if it conflicts.
-Return JSON list of paths.
-"""
+Return JSON list of paths split into {{"modify": [...], "read": [...]}}.
+""", system_prompt)
+        builder.add("task", issue, priority=100, min_tokens=2000)
+        builder.add("repo_map", repo_map, priority=50)
+        user_prompt = self._build_prompt(builder)
         try:
-            response = self.llm.generate(system_prompt, user_prompt)
+            response = selection_llm.generate(system_prompt, user_prompt)
             # Cleanup Markdown wrappers
             clean_json = response.replace("```json", "").replace("```", "").strip()
             import json
             files = json.loads(clean_json)
+            if isinstance(files, dict):
+                read_only = [f for f in files.get("read", []) if isinstance(f, str)]
+                modify = [f for f in files.get("modify", []) if isinstance(f, str)]
+                return modify + [f for f in read_only if f not in modify], set(read_only) - set(modify)
             if isinstance(files, list):
-                return files
-            return []
+                return [f for f in files if isinstance(f, str)], set()
+            print(f"Unexpected file selection format: {clean_json[:200]}")
+            return None
         except Exception as e:
             print(f"Error selecting files: {e}")
-            return [] # Fallback to empty or legacy?
+            return None
+
+    def _select_hierarchical(self, issue: str) -> list[str] | None:
+        """
+        Выбор файлов в два этапа для очень больших репозиториев: сначала LLM выбирает поддеревья
+        по их сводкам (кэшируются), затем файлы по картам только выбранных поддеревьев.
+        Запросы каждого этапа идут параллельно, поэтому размер промпта не растет вместе с репозиторием.
+        Если LLM не выбрал поддеревья или файлы, берутся лучшие по рангу графа ссылок: возврат к полной
+        карте (None) — только когда графа нет.
+        """
+        from src.core.repo_hierarchy import partition, DirectoryDigests
+        graph = self._fetched("repo_graph", self._load_repo_graph)
+        if graph is None:
+            self._log_step("Hierarchical selection unavailable: no repo graph, using the full map", icon="⚠️")
+            return None
+        rank = graph.rank(issue)
+        entries = graph.entries
+        units = partition(list(entries), Config.HIERARCHY_UNIT_FILES)
+        if not any(units.values()):
+            self._log_step("Hierarchical selection: repository map is empty", icon="⚠️")
+            return []
+        # Поддеревья с наибольшим суммарным рангом файлов по графу ссылок — первыми
+        mass = {name: sum(rank.get(p, 0.0) for p in files) for name, files in units.items()}
+        ordered = sorted(units, key=lambda name: (-mass[name], name))
+        chosen = ordered
+        if len(units) > 1:
+            digests, built = DirectoryDigests(self.root).get(units, entries)
+            chosen = self._select_subtrees(issue, [(name, digests[name]) for name in ordered])
+            if chosen:
+                chosen = sorted(chosen, key=lambda name: (-mass[name], name))
+                self._log_step(f"Selected {len(chosen)} of {len(units)} subtrees ({built} digests rebuilt)",
+                               icon="🗂️", details={"subtrees": chosen[:Config.HIERARCHY_MAX_UNITS]})
+            else:
+                reason = "selection failed" if chosen is None else "no subtree chosen"
+                chosen = ordered
+                self._log_step(f"Subtree {reason}: using the top-ranked subtrees", icon="⚠️",
+                               details={"subtrees": chosen[:Config.HIERARCHY_MAX_UNITS]})
+        chosen = chosen[:Config.HIERARCHY_MAX_UNITS]
+
+        model = self.router.get(STAGE_SELECTION).model
+
+        def expand(name: str):
+            files = units[name]
+            if Config.REPO_MAP_TOKENS > 0:
+                subtree_map = graph.render(issue, Config.REPO_MAP_TOKENS, only=files, model=model)
+            else:
+                subtree_map = graph.repo_map.render(max((p.count("/") for p in files), default=0), paths=files)
+            return self._choose_files(issue, subtree_map)
+
+        with ThreadPoolExecutor(max_workers=len(chosen), thread_name_prefix="subtree") as pool:
+            results = list(pool.map(lambda name: contextvars.copy_context().run(expand, name), chosen))
+        selections = [r for r in results if r is not None]
+        if not selections:
+            # Второй этап не ответил: лучшие по рангу файлы выбранных поддеревьев
+            candidates = [p for name in chosen for p in units[name]]
+            files = sorted(candidates, key=lambda p: (-rank.get(p, 0.0), p))[:Config.RETRIEVAL_TOP_K]
+            self._log_step("File selection in subtrees failed: using the top-ranked files", icon="⚠️",
+                           details={"files": files})
+            return files
+        files = list(dict.fromkeys(f for selected, _ in selections for f in selected))
+        read_only = set().union(*(read for _, read in selections))
+        self._read_only_files = read_only - {f for selected, read in selections for f in selected if f not in read}
+        return files
+
+    def _select_subtrees(self, issue: str, digests: list[tuple[str, str]]) -> list[str] | None:
+        """
+        Первый этап иерархического выбора: сводки поддеревьев делятся на пачки по HIERARCHY_DIGEST_TOKENS,
+        LLM выбирает поддеревья в каждой пачке параллельно. None — если не ответил ни один запрос.
+        """
+        from src.core.prompt_builder import count_tokens
+        selection_llm = self.router.get(STAGE_SELECTION)
+        batches, batch, used = [], [], 0
+        for name, text in digests:
+            cost = count_tokens(text + "\n", selection_llm.model)
+            if batch and used + cost > Config.HIERARCHY_DIGEST_TOKENS:
+                batches.append(batch)
+                batch, used = [], 0
+            batch.append((name, text))
+            used += cost
+        if batch:
+            batches.append(batch)
+
+        system_prompt = """You are a Principal Software Architect.
+Your task is to identify which parts of a large repository are relevant to a specific Issue/Task.
+Return raw JSON: a list of subtree names exactly as listed, most relevant first. Return [] if none is relevant.
+Do not output ANY explanation. Just the JSON.
+"""
+
+        def ask(batch: list[tuple[str, str]]) -> list[str] | None:
+            builder = PromptBuilder.for_llm(selection_llm, """
+SUBTREES (name (file count): main files | main symbols):
+{digests}
+
+TASK:
+{task}
+
+Which subtrees contain files that should be read or modified to solve this task? Choose at most {limit}.
+""", system_prompt)
+            builder.add("task", issue, priority=100, min_tokens=2000)
+            builder.add("digests", "\n".join(text for _, text in batch), priority=50)
+            builder.add("limit", str(Config.HIERARCHY_MAX_UNITS), priority=100)
+            try:
+                response = selection_llm.generate(system_prompt, self._build_prompt(builder))
+                import json
+                names = json.loads(response.replace("```json", "").replace("```", "").strip())
+            except Exception as e:
+                print(f"Error selecting subtrees: {e}")
+                return None
+            known = {name for name, _ in batch}
+            return [n for n in names if isinstance(n, str) and n in known] if isinstance(names, list) else None
+
+        with ThreadPoolExecutor(max_workers=len(batches), thread_name_prefix="subtrees") as pool:
+            answers = list(pool.map(lambda b: contextvars.copy_context().run(ask, b), batches))
+        if all(answer is None for answer in answers):
+            return None
+        return list(dict.fromkeys(name for answer in answers if answer for name in answer))
 
     def _get_context_legacy(self) -> str:
         """
-        Legacy: Reads all Python files.
+        Legacy: Reads all Python files of the source tree (git files with .gitignore and REPO_*_GLOBS applied).
         """
+        from src.core.repo_files import source_files, is_binary
         context = ""
-        exclude_dirs = {'.git', '.venv', '__pycache__', 'venv', 'env'}
-        for root, dirs, files in os.walk("."):
-            dirs[:] = [d for d in dirs if d not in exclude_dirs]
-            
-            for file in files:
-                if file.endswith(".py") or file in ["Dockerfile", "pyproject.toml"]:
-                    path = os.path.join(root, file)
-                    try:
-                        with open(path, "r") as f:
-                            content = f.read()
-                        context += f"\nFile: `{path}`\n```python\n{content}\n```\n"
-                    except:
-                        pass
+        for path in sorted(source_files(self.root)):
+            if path.endswith(".py") or os.path.basename(path) in ["Dockerfile", "pyproject.toml"]:
+                full_path = os.path.join(self.root, path)
+                try:
+                    if os.path.getsize(full_path) > Config.REPO_MAX_FILE_BYTES or is_binary(full_path):
+                        continue
+                    with open(full_path, "r") as f:
+                        content = f.read()
+                    context += f"\nFile: `{path}`\n```python\n{content}\n```\n"
+                except:
+                    pass
         return context
 
     def _get_system_prompt(self) -> str:
-        return """Ты опытный Python разработчик ПО.
+        if Config.EDIT_FORMAT == "whole":
+            return """Ты опытный Python разработчик ПО.
 Твоя задача — прочитать GitHub Issue и модифицировать кодовую базу для её решения.
 
 Формат вывода:
@@ -377,3 +1081,35 @@ File: `path/to/file.py`
 Не выводи diff. Выводи полное содержимое файла.
 Используй идиоматичный Python 3.11+.
 """
+        return """Ты опытный Python разработчик ПО.
+Твоя задача — прочитать GitHub Issue и модифицировать кодовую базу для её решения.
+
+Формат вывода:
+Ты должен вывести изменения в строгом формате для автоматического применения.
+
+Для СУЩЕСТВУЮЩИХ файлов выводи только точечные правки в формате SEARCH/REPLACE:
+File: `path/to/file.py`
+<<<<<<< SEARCH
+... точная копия заменяемых строк (несколько строк контекста, достаточно для однозначного поиска) ...
+=======
+... новые строки ...
+>>>>>>> REPLACE
+
+Для одного файла можно вывести несколько блоков SEARCH/REPLACE подряд.
+SEARCH должен дословно совпадать с текущим кодом файла, включая отступы.
+Чтобы удалить код, оставь REPLACE пустым.
+
+Для НОВЫХ файлов предоставь ПОЛНОЕ содержимое:
+File: `path/to/new_file.py`
+```python
+... полный код файла ...
+```
+
+Не переписывай существующие файлы целиком и не трогай код, не относящийся к задаче.
+Используй идиоматичный Python 3.11+.
+"""
+
+    def _output_instruction(self) -> str:
+        if Config.EDIT_FORMAT == "whole":
+            return "Верни ПОЛНОЕ содержимое модифицированных файлов."
+        return "Верни правки SEARCH/REPLACE для существующих файлов и ПОЛНОЕ содержимое для новых."
@@ -1,5 +1,10 @@
-from src.core.llm import get_llm
+from src.core.llm import LLMRouter, STAGE_REVIEW
 from src.core.git_provider import GitProvider
+from src.core.telemetry import track_run
+from src.core.prompt_builder import PromptBuilder
+from src.core.pr_state import load_pr_state, update_pr_state
+
+OMITTED_NOTE = "\nNOTE: some files were omitted from the diff due to size; do not request changes for them.\n"
 
 class ReviewerAgent:
     """
@@ -7,7 +12,8 @@ class ReviewerAgent:
     Отвечает за анализ Pull Requests и предоставление обратной связи.
     """
     def __init__(self, git_provider: GitProvider | None = None):
-        self.llm = get_llm()
+        self.router = LLMRouter()
+        self.llm = self.router.get(STAGE_REVIEW)
         self.git = git_provider or GitProvider()
 
     def run(self, pr_url: str, issue_url: str):
@@ -18,7 +24,22 @@ class ReviewerAgent:
         3. Запрашивает анализ у LLM.
         4. Публикует результат в Pull Request.
         """
+        try:
+            repo_name = self.git._get_repo_name_from_remote() or "unknown"
+        except Exception:
+            repo_name = "unknown"
+        with track_run("review", repo_name, pr_url):
+            self._run(pr_url, issue_url)
+
+    def _run(self, pr_url: str, issue_url: str):
         print(f"Reviewer Agent запущен для PR: {pr_url}")
+
+        # Этот head SHA уже проверен (повторная доставка webhook или ручной перезапуск)
+        state = load_pr_state(pr_url)
+        if state.head_sha and state.last_reviewed_sha == state.head_sha:
+            print(f"Коммит {state.head_sha[:7]} уже проверен, ревью пропущено.")
+            return
+        issue_url = state.issue_url or issue_url
         
         # 1. Получение информации
         issue_content = self.git.get_issue(issue_url)
@@ -39,15 +60,26 @@ class ReviewerAgent:
 После первой строки напиши подробный отзыв. Будь конструктивен.
 """
         
-        user_prompt = f"""
+        builder = PromptBuilder.for_llm(self.llm, """
 TASK REQUIREMENTS:
-{issue_content}
+{task}
 
 CODE CHANGES (DIFF):
-{pr_diff}
-
+{diff}
+{note}
 Review the changes above.
-"""
+""", system_prompt)
+        builder.add("task", issue_content, priority=100, min_tokens=2000)
+        builder.add("diff", pr_diff, priority=80, strategy="blocks")
+        # Место под примечание резервируется заранее, чтобы промпт с ним тоже укладывался в бюджет
+        builder.add("note", OMITTED_NOTE, priority=100)
+        user_prompt = builder.build()
+        if builder.summary():
+            print(f"Промпт урезан под бюджет токенов: {builder.summary()}")
+        else:
+            # Diff поместился целиком: примечание не нужно, без него промпт только короче
+            builder.replace("note", "")
+            user_prompt = builder.build()
         
         print("Запрос к LLM для ревью...")
         response = self.llm.generate(system_prompt, user_prompt)
@@ -56,6 +88,8 @@ Review the changes above.
         
         # 3. Публикация комментария
         self.git.post_comment(pr_url, response)
+        if state.head_sha:
+            update_pr_state(pr_url, lambda s: setattr(s, "last_reviewed_sha", state.head_sha))
         
         status_line = response.split('\n')[0]
         if "[APPROVE]" in status_line:
@@ -9,9 +9,12 @@ from fastapi.responses import HTMLResponse
 from src.core.config import Config
 from src.core.github_app_auth import GitHubAppAuth
 from src.core.webhook_handler import WebhookVerificator
-from src.core.db import init_db, log_event, get_recent_events
+from src.core.db import init_db, log_event, get_recent_events, get_usage_stats
 from src.core.auto_setup import run_auto_setup
-from src.core.runner import run_code_agent_task, run_fix_agent_task, run_reviewer_agent_task
+from src.core.runner import (run_code_agent_task, run_fix_agent_task, run_reviewer_agent_task, run_batch_agent_task,
+                            run_warmup_task)
+from src.core.pr_state import apply_webhook, load_pr_state
+from src.core.warmup import should_warm, schedule_warmup, wait_for_warmup
 
 app = FastAPI(title="MegaSchool Coding Agent")
 templates = Jinja2Templates(directory="src/templates")
@@ -32,6 +35,14 @@ async def read_dashboard(request: Request):
 async def read_events(repo: str = None):
     return get_recent_events(repo_name=repo)
 
+@app.get("/api/usage")
+async def read_usage(repo: str = None, group_by: str = "repo,stage"):
+    """
+    Агрегированная статистика вызовов LLM (токены, задержки, стоимость).
+    group_by: через запятую из repo, stage, model, run, run_kind.
+    """
+    return get_usage_stats(repo_name=repo, group_by=group_by.split(","))
+
 # ---------------------------------------------------------------------
 # Remote Logging Endpoint
 # ---------------------------------------------------------------------
@@ -55,6 +66,40 @@ async def receive_remote_log(log: LogEventRequest):
     log_event(log.event_type, log.repo_name, log.details)
     return {"status": "ok"}
 
+# ---------------------------------------------------------------------
+# Batch Endpoint
+# ---------------------------------------------------------------------
+import hmac
+from typing import List
+
+class BatchRequest(BaseModel):
+    installation_id: int
+    repo_name: str
+    issues: List[str]
+
+@app.post("/api/batch")
+async def start_batch(batch: BatchRequest, request: Request):
+    """
+    Пакетный запуск Code Agent для нескольких задач одного репозитория (аналог `src.main batch`).
+    Требует заголовок Authorization: Bearer <BATCH_API_TOKEN>.
+    """
+    if not Config.BATCH_API_TOKEN:
+        raise HTTPException(status_code=403, detail="Batch API is disabled")
+    auth = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(auth, f"Bearer {Config.BATCH_API_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    prefix = f"https://github.com/{batch.repo_name}/issues/"
+    foreign = [url for url in batch.issues if not url.startswith(prefix)]
+    if not batch.issues or foreign:
+        raise HTTPException(status_code=400, detail=f"Issues must belong to {batch.repo_name}: {foreign}")
+
+    import threading
+    log_event("batch_started", batch.repo_name, {"issues": batch.issues})
+    thread = threading.Thread(target=run_batch_agent_task,
+                              args=(batch.installation_id, batch.repo_name, batch.issues))
+    thread.start()
+    return {"status": "processing_batch", "issues": len(batch.issues)}
+
 # ---------------------------------------------------------------------
 # Webhook Handler
 # ---------------------------------------------------------------------
@@ -83,6 +128,17 @@ async def handle_webhook(
     
     log_event(event_type, repo_name, log_details)
 
+    # Keep the local PR state (head SHA, linked issue, comments) current before dispatching agents
+    try:
+        apply_webhook(event_type, payload)
+    except Exception as e:
+        print(f"PR state update failed: {e}")
+
+    # Speculative warm-up: refresh the mirror and caches before the label arrives / after pushes
+    installation_id = payload.get("installation", {}).get("id")
+    if Config.WARMUP_ENABLED and installation_id and should_warm(event_type, payload):
+        schedule_warmup(repo_name, lambda: run_warmup_task(installation_id, repo_name))
+
     import threading
     
     # 2. Process Event
@@ -154,20 +210,22 @@ def run_code_agent(payload: dict):
     installation_id = payload["installation"]["id"]
     repo_name = payload["repository"]["full_name"]
     issue_url = payload["issue"]["html_url"]
+    # Start from warm caches instead of rebuilding them alongside an in-flight warm-up
+    wait_for_warmup(repo_name)
     run_code_agent_task(installation_id, repo_name, issue_url)
 
 def run_fix_agent(payload: dict):
     installation_id = payload["installation"]["id"]
     repo_name = payload["repository"]["full_name"]
     pr_url = payload["issue"]["pull_request"]["html_url"]
-    issue_url = payload["issue"]["html_url"]
+    issue_url = load_pr_state(pr_url).issue_url or payload["issue"]["html_url"]
     run_fix_agent_task(installation_id, repo_name, pr_url, issue_url)
 
 def run_reviewer_agent(payload: dict):
     installation_id = payload["installation"]["id"]
     repo_name = payload["repository"]["full_name"]
     pr_url = payload["pull_request"]["html_url"]
-    run_reviewer_agent_task(installation_id, repo_name, pr_url)
+    run_reviewer_agent_task(installation_id, repo_name, pr_url, load_pr_state(pr_url).issue_url or None)
 
 if __name__ == "__main__":
     import uvicorn
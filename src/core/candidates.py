@@ -0,0 +1,184 @@
+import os
+import re
+import time
+import shutil
+import difflib
+import tempfile
+import threading
+import subprocess
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+from src.core.config import Config
+from src.core.repo_files import EXCLUDE_DIRS
+from src.core.utils import parse_code_blocks, apply_file_changes, ApplyReport
+from src.core.validation import ValidationReport, validate_changes
+
+# Признаки незавершенного кода в добавленных строках
+PLACEHOLDER_RE = re.compile(
+    r"\b(TODO|FIXME)\b|raise NotImplementedError|#\s*\.\.\.|\.\.\.\s*(rest|existing|остальн)", re.IGNORECASE
+)
+# Полная перезапись существующего файла, после которой осталось меньше этой доли строк, подозрительна
+SHRINK_RATIO = 0.5
+
+
+@dataclass
+class Candidate:
+    """
+    Один вариант решения: ответ LLM, результат его применения и проверки в изолированной копии репозитория.
+    """
+    index: int
+    response: str = ""
+    report: Optional[ApplyReport] = None
+    validation: Optional[ValidationReport] = None
+    issues: list[str] = field(default_factory=list)  # замечания эвристического ревью
+    diff_lines: int = 0
+    error: str = ""
+    seconds: float = 0.0
+
+    @property
+    def passed(self) -> bool:
+        return (not self.error and self.report is not None and bool(self.report.written)
+                and self.validation is not None and self.validation.ok)
+
+    def score(self) -> tuple:
+        """
+        Чем больше, тем лучше: прошел проверку, меньше конфликтов правок и замечаний ревью, меньше diff.
+        """
+        conflicts = len(self.report.conflicts) if self.report else 0
+        errors = len(self.validation.errors) if self.validation else 0
+        return (self.passed, not self.error, -errors, -conflicts, -len(self.issues), -self.diff_lines)
+
+    def describe(self) -> dict:
+        return {
+            "index": self.index,
+            "passed": self.passed,
+            "error": self.error,
+            "files": self.report.written if self.report else [],
+            "validation_errors": len(self.validation.errors) if self.validation else 0,
+            "issues": self.issues,
+            "diff_lines": self.diff_lines,
+            "seconds": self.seconds,
+        }
+
+
+def _git(root: str, *args: str) -> bool:
+    try:
+        subprocess.run(["git", *args], cwd=root, capture_output=True, check=True)
+        return True
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return False
+
+
+@contextmanager
+def isolated_worktree(root: str = ".") -> Iterator[str]:
+    """
+    Временная копия репозитория на HEAD: `git worktree` (объекты git общие, копируются только файлы);
+    вне git — копия рабочего дерева без служебных каталогов.
+    """
+    path = tempfile.mkdtemp(prefix="candidate-")
+    is_worktree = _git(root, "worktree", "add", "--detach", path, "HEAD")
+    if not is_worktree:
+        shutil.copytree(root, path, ignore=shutil.ignore_patterns(*EXCLUDE_DIRS), dirs_exist_ok=True)
+    try:
+        yield path
+    finally:
+        if is_worktree:
+            _git(root, "worktree", "remove", "--force", path)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def review_changes(originals: dict[str, Optional[str]], root: str, written: list[str]) -> tuple[list[str], int]:
+    """
+    Эвристическое ревью примененных правок: заглушки в добавленном коде, подозрительное сокращение файлов.
+    Возвращает (замечания, число измененных строк).
+    """
+    issues, diff_lines = [], 0
+    for path in written:
+        with open(os.path.join(root, path), "r", encoding="utf-8", errors="ignore") as f:
+            new = f.read().splitlines()
+        old = (originals.get(path) or "").splitlines()
+        added = []
+        for line in difflib.unified_diff(old, new, lineterm="", n=0):
+            if line.startswith(("+++", "---", "@@")):
+                continue
+            diff_lines += 1
+            if line.startswith("+"):
+                added.append(line[1:])
+        placeholders = [line.strip() for line in added if PLACEHOLDER_RE.search(line)]
+        if placeholders:
+            issues.append(f"{path}: незавершенный код ({placeholders[0][:80]})")
+        if len(old) >= 20 and len(new) < len(old) * SHRINK_RATIO:
+            issues.append(f"{path}: файл сократился с {len(old)} до {len(new)} строк")
+    return issues, diff_lines
+
+
+def evaluate_candidate(index: int, response: str, root: str = ".") -> Candidate:
+    """
+    Применяет ответ LLM в отдельной копии репозитория, проверяет (validate_changes) и оценивает эвристиками.
+    """
+    start = time.perf_counter()
+    candidate = Candidate(index, response)
+    changes = parse_code_blocks(response or "")
+    if not changes:
+        candidate.error = "no code changes"
+        return candidate
+    try:
+        with isolated_worktree(root) as tree:
+            originals = {}
+            for change in changes:
+                target = os.path.join(tree, change["path"])
+                if os.path.isfile(target):
+                    with open(target, "r", encoding="utf-8", errors="ignore") as f:
+                        originals[change["path"]] = f.read()
+            candidate.report = apply_file_changes(changes, root=tree)
+            if candidate.report.written:
+                candidate.validation = validate_changes(candidate.report.written, root=tree)
+                candidate.issues, candidate.diff_lines = review_changes(originals, tree, candidate.report.written)
+            else:
+                candidate.error = "no edits could be applied"
+    except Exception as e:
+        candidate.error = f"evaluation failed: {e}"
+    candidate.seconds = round(time.perf_counter() - start, 3)
+    return candidate
+
+
+def generate_candidates(llm, system_prompt: str, user_prompt: str, n: int, budget: Optional[float] = None,
+                        root: str = ".") -> list[Candidate]:
+    """
+    Генерирует n вариантов параллельно; каждый проверяется сразу по готовности, не дожидаясь остальных.
+    По истечении budget секунд возвращаются уже готовые варианты (если готовых нет — первый завершившийся);
+    незавершенные отменяются: запрос к LLM, уже ушедший в провайдер, дожидается ответа в фоне,
+    но ответ не применяется и не проверяется.
+    """
+    budget = Config.CANDIDATES_TIME_BUDGET if budget is None else budget
+    stop = threading.Event()
+
+    def run(index: int) -> Candidate:
+        try:
+            response = llm.generate(system_prompt, user_prompt)
+        except Exception as e:
+            return Candidate(index, error=f"generation failed: {e}")
+        if stop.is_set():
+            return Candidate(index, response, error="discarded: time budget exhausted")
+        return evaluate_candidate(index, response, root)
+
+    pool = ThreadPoolExecutor(max_workers=n, thread_name_prefix="candidate")
+    futures = [pool.submit(contextvars.copy_context().run, run, i) for i in range(n)]
+    done, pending = wait(futures, timeout=budget or None)
+    if not done:
+        done, pending = wait(futures, return_when=FIRST_COMPLETED)
+    stop.set()
+    for future in pending:
+        future.cancel()
+    pool.shutdown(wait=False, cancel_futures=True)
+    if pending:
+        print(f"Time budget {budget}s exhausted: {len(pending)} of {n} candidates discarded")
+    return sorted((f.result() for f in done), key=lambda c: c.index)
+
+
+def select_best(candidates: list[Candidate]) -> Optional[Candidate]:
+    usable = [c for c in candidates if c.response]
+    return max(usable, key=lambda c: c.score()) if usable else None
@@ -0,0 +1,93 @@
+import os
+import json
+import time
+import hashlib
+from typing import Any, Optional
+from src.core.config import Config
+from src.core.repo_files import repo_cache_dir
+
+# Стадии запуска в порядке выполнения: снимок задачи, выбор файлов, ответ LLM, разобранные правки,
+# ответ LLM на ошибки локальной проверки
+STAGES = ("issue", "selection", "response", "changes", "repair")
+
+
+def checkpoint_key(*parts: str) -> str:
+    """
+    Ключ контрольной точки: хэш входных данных запуска (текст задачи, HEAD SHA, модель, формат правок).
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8", errors="ignore"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:32]
+
+
+class RunCheckpoint:
+    """
+    Результаты стадий запуска агента, сохраненные на диск по мере выполнения.
+
+    Если запуск упал после дорогой генерации (отклоненный push, ошибка API при создании PR,
+    перезапуск контейнера), повторный запуск с теми же входными данными (тот же ключ)
+    продолжает с последней завершенной стадии и не оплачивает выбор файлов и генерацию заново.
+    После успешного завершения контрольная точка удаляется.
+    """
+    def __init__(self, key: str, cache_dir: Optional[str] = None):
+        self.key = key
+        self.cache_dir = cache_dir or repo_cache_dir(".", "checkpoints")
+        self.data: dict[str, Any] = {}
+        self._load()
+
+    @property
+    def _path(self) -> str:
+        return os.path.join(self.cache_dir, f"{self.key}.json")
+
+    @property
+    def last_stage(self) -> Optional[str]:
+        done = [stage for stage in STAGES if stage in self.data]
+        return done[-1] if done else None
+
+    def get(self, stage: str) -> Any:
+        return self.data.get(stage)
+
+    def save(self, stage: str, value: Any):
+        self.data[stage] = value
+        self.data["updated_at"] = time.time()
+        try:
+            tmp_path = self._path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Checkpoint save error: {e}")
+
+    def clear(self):
+        self.data = {}
+        try:
+            os.remove(self._path)
+        except OSError:
+            pass
+
+    def _load(self):
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        age = time.time() - data.get("updated_at", 0)
+        if age > Config.CHECKPOINT_TTL_HOURS * 3600:
+            self.clear()
+            return
+        self.data = data
+
+
+def load_checkpoint(*parts: str) -> Optional[RunCheckpoint]:
+    """
+    Контрольная точка для входных данных parts; None, если контрольные точки отключены (CHECKPOINT_TTL_HOURS=0).
+    """
+    if Config.CHECKPOINT_TTL_HOURS <= 0:
+        return None
+    try:
+        return RunCheckpoint(checkpoint_key(*parts))
+    except OSError as e:
+        print(f"Checkpoint unavailable: {e}")
+        return None
@@ -1,4 +1,5 @@
 import os
+import json
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,18 +13,165 @@ class Config:
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") or os.getenv("LLM_API_KEY")
     LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.openai.com/v1")
     LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+    LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.3"))
+    LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "8000"))
+
+    # Маршрутизация моделей по стадиям пайплайна (JSON). Пример:
+    # {"selection": {"model": "gpt-4o-mini", "temperature": 0, "max_tokens": 1000},
+    #  "generation": {"provider": "openai", "model": "gpt-4o"}}
+    # Незаданные поля берутся из LLM_MODEL / LLM_TEMPERATURE / LLM_MAX_TOKENS.
+    LLM_ROUTES = os.getenv("LLM_ROUTES", "")
+    # Размер контекстного окна модели в токенах (0 = определить по имени модели)
+    LLM_CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", "0"))
+
+    # Квоты провайдера: запросов в минуту (0 = без ограничения) и одновременных запросов
+    LLM_RPM = int(os.getenv("LLM_RPM", "0"))
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+    # Повторы при ответе 429 (Too Many Requests)
+    LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+
+    # Потоковая генерация (нужна для измерения time-to-first-token)
+    LLM_STREAM = os.getenv("LLM_STREAM", "false").lower() in ("1", "true", "yes")
+    # Цены за 1M токенов для оценки стоимости: {"gpt-4o-mini": {"input": 0.15, "output": 0.6}}
+    LLM_PRICING = os.getenv("LLM_PRICING", "")
     
     # Специфично для YandexGPT
     YC_FOLDER_ID = os.getenv("YC_FOLDER_ID")
+    YC_API_URL = os.getenv("YC_API_URL", "https://llm.api.cloud.yandex.net/foundationModels/v1")
+    YC_OPERATIONS_URL = os.getenv("YC_OPERATIONS_URL", "https://operation.api.cloud.yandex.net/operations")
+    # Режим генерации: "sync" (completion) или "async" (completionAsync + опрос операции)
+    YC_COMPLETION_MODE = os.getenv("YC_COMPLETION_MODE", "sync")
+    YC_POLL_MIN_INTERVAL = float(os.getenv("YC_POLL_MIN_INTERVAL", "0.5"))
+    YC_POLL_MAX_INTERVAL = float(os.getenv("YC_POLL_MAX_INTERVAL", "5"))
+    YC_ASYNC_TIMEOUT = float(os.getenv("YC_ASYNC_TIMEOUT", "600"))
     
+    # Формат ответа Code Agent: "diff" (SEARCH/REPLACE правки, полные файлы только для новых) или "whole"
+    EDIT_FORMAT = os.getenv("EDIT_FORMAT", "diff").lower()
+
+    # Выбор файлов контекста: "llm" (вся карта репозитория в LLM), "index" (только локальный индекс, без LLM)
+    # или "hybrid" (индекс отбирает RETRIEVAL_PREFILTER_K кандидатов, LLM выбирает из них),
+    # "hierarchical" (для очень больших репозиториев: LLM выбирает поддеревья по их сводкам, затем файлы в них)
+    FILE_SELECTION_MODE = os.getenv("FILE_SELECTION_MODE", "hybrid").lower()
+    # Иерархический выбор: сколько файлов максимум в поддереве, сколько поддеревьев раскрывать
+    # и сколько токенов сводок каталогов отправлять в один запрос первого этапа (запросы идут параллельно)
+    HIERARCHY_UNIT_FILES = int(os.getenv("HIERARCHY_UNIT_FILES", "300"))
+    HIERARCHY_MAX_UNITS = int(os.getenv("HIERARCHY_MAX_UNITS", "4"))
+    HIERARCHY_DIGEST_TOKENS = int(os.getenv("HIERARCHY_DIGEST_TOKENS", "4000"))
+    RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+    RETRIEVAL_PREFILTER_K = int(os.getenv("RETRIEVAL_PREFILTER_K", "40"))
+    RETRIEVAL_VECTOR_DIM = int(os.getenv("RETRIEVAL_VECTOR_DIM", "512"))
+    RETRIEVAL_MAX_FILE_BYTES = int(os.getenv("RETRIEVAL_MAX_FILE_BYTES", "262144"))
+    # Файлы-«спутники» из истории git: сколько добавлять к выбранным (0 = отключено) и пороги связи
+    HISTORY_COMPANIONS = int(os.getenv("HISTORY_COMPANIONS", "3"))
+    HISTORY_MIN_SUPPORT = int(os.getenv("HISTORY_MIN_SUPPORT", "2"))
+    HISTORY_MIN_CONFIDENCE = float(os.getenv("HISTORY_MIN_CONFIDENCE", "0.3"))
+    # Коммиты, затронувшие больше файлов, не учитываются при подсчете связей
+    HISTORY_MAX_COMMIT_FILES = int(os.getenv("HISTORY_MAX_COMMIT_FILES", "30"))
+    # Файлы контекста длиннее CONTEXT_SLICE_LINES строк режутся до релевантных задаче классов/функций
+    # (в пределах CONTEXT_SLICE_BYTES), остальные символы остаются сигнатурами
+    CONTEXT_SLICE_LINES = int(os.getenv("CONTEXT_SLICE_LINES", "400"))
+    CONTEXT_SLICE_BYTES = int(os.getenv("CONTEXT_SLICE_BYTES", "24000"))
+    CONTEXT_MAX_FILE_BYTES = int(os.getenv("CONTEXT_MAX_FILE_BYTES", "524288"))
+    # Файлы, которые нужны только для чтения, отправляются без комментариев и docstrings
+    CONTEXT_MINIFY = os.getenv("CONTEXT_MINIFY", "true").lower() in ("1", "true", "yes")
+    # Какие файлы репозитория попадают в карту, индекс и контекст: файлы git (с учетом .gitignore),
+    # отфильтрованные glob-шаблонами через запятую (пустой include = все); бинарные и файлы больше
+    # REPO_MAX_FILE_BYTES в карту попадают только именем
+    REPO_INCLUDE_GLOBS = [g.strip() for g in os.getenv("REPO_INCLUDE_GLOBS", "").split(",") if g.strip()]
+    REPO_EXCLUDE_GLOBS = [g.strip() for g in os.getenv(
+        "REPO_EXCLUDE_GLOBS",
+        "node_modules/*,vendor/*,third_party/*,dist/*,build/*,.venv/*,venv/*,__pycache__/*,"
+        "*.min.js,*.min.css,*.map,*.lock,package-lock.json,*_pb2.py,*.pb.go,*.pyc"
+    ).split(",") if g.strip()]
+    REPO_MAX_FILE_BYTES = int(os.getenv("REPO_MAX_FILE_BYTES", "1048576"))
+    # Разбор файлов для карты репозитория в пуле процессов (0 = по числу CPU), если изменилось
+    # не меньше REPO_MAP_PARALLEL_MIN файлов; меньшие объемы разбираются последовательно
+    REPO_MAP_WORKERS = int(os.getenv("REPO_MAP_WORKERS", "0"))
+    REPO_MAP_PARALLEL_MIN = int(os.getenv("REPO_MAP_PARALLEL_MIN", "500"))
+    # Бюджет карты репозитория в токенах: в карту попадают символы файлов, важных для задачи по графу
+    # импортов и использований идентификаторов (персонализированный PageRank); 0 = полная карта без ранжирования
+    REPO_MAP_TOKENS = int(os.getenv("REPO_MAP_TOKENS", "6000"))
+    # Постоянный кэш агента (индексы репозиториев)
+    AGENT_CACHE_DIR = os.getenv("AGENT_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "coding-agents"))
+
+    # Контрольные точки запусков Code Agent (выбор файлов, ответ LLM, правки) для возобновления
+    # повторного запуска с теми же входными данными; срок хранения в часах (0 = отключены)
+    CHECKPOINT_TTL_HOURS = float(os.getenv("CHECKPOINT_TTL_HOURS", "24"))
+
+    # Локальная проверка измененных файлов перед коммитом (синтаксис, импорт модулей, при VALIDATION_TESTS —
+    # связанные тесты); при ошибках агент один раз просит LLM исправить их в том же запуске
+    VALIDATION_ENABLED = os.getenv("VALIDATION_ENABLED", "true").lower() in ("1", "true", "yes")
+    VALIDATION_TESTS = os.getenv("VALIDATION_TESTS", "false").lower() in ("1", "true", "yes")
+    VALIDATION_TIMEOUT = int(os.getenv("VALIDATION_TIMEOUT", "120"))
+    # Процессов pytest для затронутых изменениями тестов (0 = по числу CPU)
+    TEST_WORKERS = int(os.getenv("TEST_WORKERS", "0"))
+
+    # Best-of-N: сколько вариантов решения генерировать параллельно (1 = один вариант) и сколько секунд ждать
+    # их генерации и проверки в отдельных git worktree (0 = ждать все)
+    CANDIDATES = int(os.getenv("CANDIDATES", "1"))
+    CANDIDATES_TIME_BUDGET = float(os.getenv("CANDIDATES_TIME_BUDGET", "300"))
+
+    # Прогрев по событиям issues opened/edited и push в ветку по умолчанию: зеркало репозитория и кэши
+    # обновляются в фоне с пониженным приоритетом (WARMUP_NICE); запуск по метке ждет идущий прогрев до WARMUP_WAIT секунд
+    WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+    WARMUP_NICE = int(os.getenv("WARMUP_NICE", "10"))
+    WARMUP_WAIT = float(os.getenv("WARMUP_WAIT", "15"))
+
+    # Пакетный режим: сколько задач одновременно проходят выбор файлов и генерацию;
+    # токен для POST /api/batch (без него эндпоинт отключен)
+    BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+    # Сколько секунд задача пакета ждет генерации остальных перед открытием PR (0 — без ограничения)
+    BATCH_WAIT_TIMEOUT = float(os.getenv("BATCH_WAIT_TIMEOUT", "1800"))
+    BATCH_API_TOKEN = os.getenv("BATCH_API_TOKEN")
+
     # Ограничения
     MAX_ITERATIONS = int(os.getenv("MAX_ITERATIONS", "5"))
+    # Цикл исправлений останавливается, если похожие замечания (сходство термов >= FIX_REVIEW_SIMILARITY)
+    # уже исправлялись FIX_REPEAT_LIMIT раз (0 = не проверять)
+    FIX_REPEAT_LIMIT = int(os.getenv("FIX_REPEAT_LIMIT", "2"))
+    FIX_REVIEW_SIMILARITY = float(os.getenv("FIX_REVIEW_SIMILARITY", "0.8"))
 
     # GitHub App Config
     GITHUB_APP_ID = os.getenv("GITHUB_APP_ID")
     GITHUB_WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET")
     GITHUB_PRIVATE_KEY = os.getenv("GITHUB_PRIVATE_KEY")
 
+    @classmethod
+    def get_llm_route(cls, stage: str | None = None) -> dict:
+        """
+        Возвращает параметры модели для стадии пайплайна:
+        provider (None = автоопределение), model, temperature, max_tokens.
+        """
+        route = {
+            "provider": None,
+            "model": cls.LLM_MODEL,
+            "temperature": cls.LLM_TEMPERATURE,
+            "max_tokens": cls.LLM_MAX_TOKENS,
+        }
+        if stage:
+            overrides = dict(cls._parse_llm_routes().get(stage, {}))
+            # Допускаем написание в стиле YandexGPT API
+            if "maxTokens" in overrides:
+                overrides["max_tokens"] = overrides.pop("maxTokens")
+            route.update({k: v for k, v in overrides.items() if k in route})
+        route["temperature"] = float(route["temperature"])
+        route["max_tokens"] = int(route["max_tokens"])
+        return route
+
+    @classmethod
+    def _parse_llm_routes(cls) -> dict:
+        if not cls.LLM_ROUTES:
+            return {}
+        try:
+            routes = json.loads(cls.LLM_ROUTES)
+        except json.JSONDecodeError as e:
+            print(f"ВНИМАНИЕ: LLM_ROUTES содержит некорректный JSON ({e}). Маршрутизация отключена.")
+            return {}
+        if not isinstance(routes, dict):
+            print("ВНИМАНИЕ: LLM_ROUTES должен быть JSON-объектом вида {stage: {...}}.")
+            return {}
+        return {stage: route for stage, route in routes.items() if isinstance(route, dict)}
+
     @classmethod
     def validate(cls):
         """
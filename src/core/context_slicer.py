@@ -0,0 +1,328 @@
+import io
+import os
+import re
+import ast
+import mmap
+import tokenize as py_tokenize
+from dataclasses import dataclass
+from typing import Optional
+from src.core.config import Config
+from src.core.retrieval import tokenize
+
+# Начало блока верхнего уровня для языков, которые RepoMapGenerator разбирает регулярками
+JS_BLOCK_RE = re.compile(
+    r"^(?:export\s+)?(?:default\s+)?(?:async\s+)?(?:function\s*\*?\s*(\w+)|class\s+(\w+)|"
+    r"(?:const|let|var)\s+(\w+)\s*=\s*(?:async\s*)?(?:\([^)]*\)|\w+)\s*=>)"
+)
+GO_BLOCK_RE = re.compile(r"^(?:func\s+(?:\([^)]*\)\s*)?(\w+)|type\s+(\w+)\s+(?:struct|interface))")
+BLOCK_COMMENT_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+LINE_COMMENT_RE = re.compile(r"^\s*//.*$")
+
+# Сколько строк вне функций/классов подряд оставлять без сокращения
+MAX_LOOSE_LINES = 20
+# Символ попадает в срез целиком, если его релевантность не ниже этой доли от лучшей
+RELATIVE_SCORE_THRESHOLD = 0.5
+
+
+@dataclass
+class SourceFile:
+    path: str
+    text: str
+    truncated: bool = False
+
+
+def read_source(path: str, max_bytes: Optional[int] = None) -> Optional[SourceFile]:
+    """
+    Читает текстовый файл для контекста. Бинарные файлы пропускаются (None).
+    Большие файлы (> 1MB) читаются через mmap, при превышении max_bytes берется только начало.
+    """
+    max_bytes = max_bytes or Config.CONTEXT_MAX_FILE_BYTES
+    try:
+        size = os.path.getsize(path)
+        if size == 0:
+            return SourceFile(path, "")
+        with open(path, "rb") as f:
+            if size > 1024 * 1024:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    if b"\0" in mm[:8192]:
+                        return None
+                    data = mm[:max_bytes]
+            else:
+                data = f.read(max_bytes)
+                if b"\0" in data[:8192]:
+                    return None
+    except (OSError, ValueError):
+        return None
+    text = data.decode("utf-8", errors="ignore")
+    if size > max_bytes:
+        # Не оставляем оборванную последнюю строку
+        text = text[:text.rfind("\n") + 1]
+    return SourceFile(path, text, truncated=size > max_bytes)
+
+
+def _comment(path: str) -> str:
+    return "#" if path.endswith(".py") else "//"
+
+
+def _score(terms: set[str], name: str, body: str) -> int:
+    """
+    Релевантность символа задаче: совпадения в имени весят больше, чем в теле.
+    """
+    return 3 * len(terms & set(tokenize(name))) + len(terms & set(tokenize(body)))
+
+
+def _select(scored: list[tuple], budget: int) -> set:
+    """
+    Самые релевантные символы целиком, пока хватает бюджета (лучший берется всегда).
+    scored: [(score, size, key)].
+    """
+    top = max((score for score, _, _ in scored), default=0)
+    selected, used = set(), 0
+    for score, size, key in sorted(scored, key=lambda s: (-s[0], s[1])):
+        if score < top * RELATIVE_SCORE_THRESHOLD or (used + size > budget and selected):
+            continue
+        selected.add(key)
+        used += size
+    return selected
+
+
+# --- Python ---
+
+def _node_start(node: ast.AST) -> int:
+    decorators = getattr(node, "decorator_list", [])
+    return min([node.lineno] + [d.lineno for d in decorators])
+
+
+def _python_signature(lines: list[str], node: ast.AST) -> list[str]:
+    """
+    Заголовок def/class (с декораторами и многострочной сигнатурой) без тела.
+    """
+    start = _node_start(node)
+    first = node.body[0]
+    if first.lineno == node.lineno:
+        # Однострочное определение
+        return lines[start - 1:node.end_lineno]
+    indent = lines[first.lineno - 1][:len(lines[first.lineno - 1]) - len(lines[first.lineno - 1].lstrip())]
+    return lines[start - 1:first.lineno - 1] + [f"{indent}...\n"]
+
+
+def _slice_python(text: str, terms: set[str], budget: int) -> Optional[str]:
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return None
+    lines = text.splitlines(keepends=True)
+
+    def source(node):
+        return "".join(lines[_node_start(node) - 1:node.end_lineno])
+
+    # Кандидаты: функции верхнего уровня и методы; класс без методов (dataclass, enum) — как единое целое
+    functions = (ast.FunctionDef, ast.AsyncFunctionDef)
+    candidates = []
+    for node in tree.body:
+        if isinstance(node, functions):
+            candidates.append(node)
+        elif isinstance(node, ast.ClassDef):
+            methods = [item for item in node.body if isinstance(item, functions)]
+            candidates += methods or [node]
+    scored = []
+    for node in candidates:
+        body = source(node)
+        score = _score(terms, node.name, body)
+        if score:
+            scored.append((score, len(body), node))
+    selected = _select(scored, budget)
+
+    out: list[str] = []
+    for node in tree.body:
+        start = _node_start(node)
+        if start > 1 and not lines[start - 2].strip():
+            out.append("\n")
+        if node in selected:
+            out.append(source(node))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            out += _python_signature(lines, node)
+        elif isinstance(node, ast.ClassDef):
+            out += _python_class(lines, node, selected)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)) or node.end_lineno - node.lineno < MAX_LOOSE_LINES:
+            out.append(source(node))
+        else:
+            out.append(f"# ... {node.end_lineno - node.lineno + 1} lines omitted\n")
+    return "".join(out)
+
+
+def _python_class(lines: list[str], node: ast.ClassDef, selected: set) -> list[str]:
+    header = _python_signature(lines, node)[:-1]
+    if not header:
+        return lines[_node_start(node) - 1:node.end_lineno]
+    out = list(header)
+    for item in node.body:
+        start, end = _node_start(item), item.end_lineno
+        if item in selected:
+            out += lines[start - 1:end]
+        elif isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            out += _python_signature(lines, item)
+        elif isinstance(item, ast.Expr) and isinstance(getattr(item, "value", None), ast.Constant):
+            continue  # docstring класса
+        elif end - start < MAX_LOOSE_LINES:
+            out += lines[start - 1:end]
+    return out
+
+
+# --- JS/TS/Go ---
+
+def _block_end(lines: list[str], start: int) -> int:
+    """
+    Индекс последней строки блока: по балансу фигурных скобок от первой открывающей.
+    """
+    depth, opened = 0, False
+    for i in range(start, len(lines)):
+        for ch in lines[i]:
+            if ch == "{":
+                depth += 1
+                opened = True
+            elif ch == "}":
+                depth -= 1
+        if opened and depth <= 0:
+            return i
+        if not opened and i > start and lines[i].rstrip().endswith(";"):
+            return i
+    return len(lines) - 1
+
+
+def _slice_braces(text: str, terms: set[str], budget: int, block_re: re.Pattern) -> str:
+    lines = text.splitlines(keepends=True)
+    blocks = []
+    i = 0
+    while i < len(lines):
+        match = block_re.match(lines[i])
+        if match:
+            end = _block_end(lines, i)
+            name = next(g for g in match.groups() if g) if any(match.groups()) else ""
+            blocks.append((i, end, name))
+            i = end + 1
+        else:
+            i += 1
+
+    scored = []
+    for start, end, name in blocks:
+        body = "".join(lines[start:end + 1])
+        score = _score(terms, name, body)
+        if score:
+            scored.append((score, len(body), start))
+    selected = _select(scored, budget)
+
+    out: list[str] = []
+    cursor = 0
+    for start, end, name in blocks + [(len(lines), len(lines), "")]:
+        loose = lines[cursor:start]
+        if len(loose) > MAX_LOOSE_LINES:
+            out += loose[:MAX_LOOSE_LINES] + [f"// ... {len(loose) - MAX_LOOSE_LINES} lines omitted\n"]
+        else:
+            out += loose
+        if start >= len(lines):
+            break
+        if start in selected or end == start:
+            out += lines[start:end + 1]
+        elif "{" in lines[start]:
+            out.append(lines[start].rstrip("\n") + " ... }\n")
+        else:
+            out += [lines[start], f"// ... {end - start} lines omitted\n"]
+        cursor = end + 1
+    return "".join(out)
+
+
+# --- Минификация ---
+
+def minify(path: str, text: str) -> str:
+    """
+    Убирает комментарии, docstrings и пустые строки. Остальные строки сохраняются дословно,
+    чтобы фрагменты из контекста оставались узнаваемыми в исходном файле.
+    """
+    if path.endswith(".py"):
+        minified = _minify_python(text)
+        if minified is not None:
+            return minified
+    elif path.endswith((".js", ".ts", ".jsx", ".tsx", ".go", ".java", ".c", ".cpp", ".h", ".rs")):
+        text = BLOCK_COMMENT_RE.sub("", text)
+        return "".join(l for l in text.splitlines(keepends=True) if l.strip() and not LINE_COMMENT_RE.match(l))
+    return text
+
+
+def _minify_python(text: str) -> Optional[str]:
+    try:
+        tokens = list(py_tokenize.generate_tokens(io.StringIO(text).readline))
+    except (py_tokenize.TokenError, IndentationError, SyntaxError):
+        return None
+    lines = text.splitlines(keepends=True)
+    drop: dict[int, list[tuple[int, int]]] = {}  # строка -> вырезаемые интервалы колонок
+    dropped_lines: set[int] = set()
+    prev = None
+    depth = 0
+    for tok in tokens:
+        if tok.type == py_tokenize.OP and tok.string in "([{":
+            depth += 1
+        elif tok.type == py_tokenize.OP and tok.string in ")]}":
+            depth -= 1
+        if tok.type == py_tokenize.COMMENT:
+            drop.setdefault(tok.start[0], []).append((tok.start[1], len(lines[tok.start[0] - 1].rstrip("\r\n"))))
+        elif tok.type == py_tokenize.STRING and depth == 0 and (
+                prev is None or prev.type in (py_tokenize.INDENT, py_tokenize.NEWLINE, py_tokenize.DEDENT)):
+            # Строка-выражение в начале оператора — docstring
+            if tok.start[1] == len(lines[tok.start[0] - 1]) - len(lines[tok.start[0] - 1].lstrip()):
+                dropped_lines.update(range(tok.start[0], tok.end[0] + 1))
+        if tok.type not in (py_tokenize.COMMENT, py_tokenize.NL):
+            prev = tok
+
+    out = []
+    for number, line in enumerate(lines, 1):
+        if number in dropped_lines:
+            continue
+        for start, end in sorted(drop.get(number, []), reverse=True):
+            line = line[:start].rstrip() + line[end:]
+        if line.strip():
+            out.append(line if line.endswith("\n") else line + "\n")
+    return "".join(out)
+
+
+# --- Точка входа ---
+
+def render_context_file(path: str, query: str, editable: bool = True) -> Optional[str]:
+    """
+    Текст файла для промпта.
+    Файлы длиннее CONTEXT_SLICE_LINES режутся до символов (классов/функций), релевантных задаче:
+    они приводятся целиком, у остальных остаются только сигнатуры, импорты сохраняются.
+    Редактируемые файлы при EDIT_FORMAT=whole не режутся: модель переписывает файл целиком
+    и вернула бы его без пропущенных тел.
+    Файлы, которые агент не будет править, при CONTEXT_MINIFY отдаются без комментариев и docstrings.
+    Возвращает None для бинарных и нечитаемых файлов.
+    """
+    source = read_source(path)
+    if source is None:
+        return None
+    text = source.text
+    notes = []
+
+    whole_rewrite = editable and Config.EDIT_FORMAT == "whole"
+    if text.count("\n") > Config.CONTEXT_SLICE_LINES and not whole_rewrite:
+        terms = set(tokenize(query))
+        budget = Config.CONTEXT_SLICE_BYTES
+        sliced = None
+        if path.endswith(".py"):
+            sliced = _slice_python(text, terms, budget)
+        elif path.endswith((".js", ".ts", ".jsx", ".tsx")):
+            sliced = _slice_braces(text, terms, budget, JS_BLOCK_RE)
+        elif path.endswith(".go"):
+            sliced = _slice_braces(text, terms, budget, GO_BLOCK_RE)
+        if sliced is not None and len(sliced) < len(text):
+            notes.append(f"{text.count(chr(10))} lines, showing symbols relevant to the task; others as signatures")
+            text = sliced
+    if not editable and Config.CONTEXT_MINIFY:
+        text = minify(path, text)
+        notes.append("read-only, comments stripped")
+    if source.truncated:
+        notes.append(f"truncated to first {Config.CONTEXT_MAX_FILE_BYTES} bytes")
+
+    if notes:
+        text = f"{_comment(path)} [{'; '.join(notes)}]\n{text}"
+    return text
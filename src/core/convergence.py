@@ -0,0 +1,105 @@
+import hashlib
+from typing import Optional
+from src.core.retrieval import tokenize
+
+VERDICT_MARKERS = ("[REQUEST_CHANGES]", "[APPROVE]")
+COMMANDS = ("/fix", "/retry")
+# Начала комментариев, которые публикует сам агент (если он работает под токеном пользователя,
+# а не GitHub App, автор комментария не отличается от человека)
+AGENT_COMMENT_PREFIXES = ("❌ Code Agent", "⏸️ Code Agent", "⚠️ Code Agent", "❌ **Task Rejected**",
+                          "⚠️ **Task Completed", "🚀 **Task Completed")
+# Сколько термов замечаний хранить в отпечатке итерации
+REVIEW_FINGERPRINT_TERMS = 200
+
+STOP_MESSAGES = {
+    "repeated_review": "ревьюер повторяет замечания, которые уже исправлялись на прошлых итерациях",
+    "no_progress": "сгенерированные исправления не меняют код",
+    "cycle": "исправления возвращают код к состоянию одной из прошлых итераций",
+}
+
+
+def review_fingerprint(comments: list[dict]) -> list[str]:
+    """
+    Отпечаток замечаний ревьюера: множество нормализованных термов (формулировки меняются от запуска к запуску,
+    поэтому замечания сравниваются по сходству, а не по точному хэшу).
+    """
+    terms = set()
+    for comment in comments:
+        body = comment["body"]
+        if "[REQUEST_CHANGES]" in body or comment.get("kind") == "review":
+            for marker in VERDICT_MARKERS:
+                body = body.replace(marker, "")
+            terms.update(tokenize(body))
+    return sorted(terms)[:REVIEW_FINGERPRINT_TERMS]
+
+
+def is_agent_comment(comment: dict) -> bool:
+    """
+    Комментарий опубликован агентом: автор — GitHub App (`name[bot]`) или текст — сообщение агента.
+    """
+    author = comment.get("author") or ""
+    return author.endswith("[bot]") or comment["body"].lstrip().startswith(AGENT_COMMENT_PREFIXES)
+
+
+def is_command(body: str) -> bool:
+    """
+    Комментарий — голая команда (/fix, /retry) без текста.
+    """
+    for command in COMMANDS:
+        body = body.replace(command, "")
+    return not tokenize(body)
+
+
+def has_guidance(comments: list[dict]) -> bool:
+    """
+    Есть ли среди комментариев указания человека (не вердикт ревьюера, не голая команда /fix
+    и не сообщение самого агента, например об остановке цикла исправлений).
+    """
+    for comment in comments:
+        body = comment["body"]
+        if comment.get("kind") == "review" or any(marker in body for marker in VERDICT_MARKERS) \
+                or is_agent_comment(comment):
+            continue
+        if not is_command(body):
+            return True
+    return False
+
+
+def similarity(a: list[str], b: list[str]) -> float:
+    a, b = set(a), set(b)
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def repeated_reviews(iterations: list[dict], fingerprint: list[str], threshold: float) -> int:
+    """
+    Сколько прошлых итераций отвечали на замечания, похожие на текущие.
+    """
+    return sum(1 for it in iterations if similarity(it.get("review_fp", []), fingerprint) >= threshold)
+
+
+def file_state_fingerprint(paths: list[str]) -> str:
+    """
+    Хэш содержимого файлов (отсутствующие файлы тоже учитываются): одинаковый отпечаток означает одинаковый код.
+    """
+    digest = hashlib.sha256()
+    for path in sorted(set(paths)):
+        digest.update(path.encode("utf-8"))
+        try:
+            with open(path, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+        except OSError:
+            digest.update(b"missing")
+    return digest.hexdigest()[:32]
+
+
+def check_progress(iterations: list[dict], before: str, after: str) -> Optional[str]:
+    """
+    Причина остановки по результату применения правок: "no_progress", "cycle" или None.
+    """
+    if before == after:
+        return "no_progress"
+    if any(it.get("state_fp") == after for it in iterations):
+        return "cycle"
+    return None
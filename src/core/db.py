@@ -173,3 +173,87 @@ def get_recent_events(limit: int = 50, repo_name: str = None) -> List[Dict[str,
         return events
     except Exception:
         return []
+
+# Ключи группировки для статистики использования LLM -> выражение SQLite
+USAGE_GROUP_KEYS = {
+    "repo": "repo_name",
+    "stage": "json_extract(details, '$.stage')",
+    "model": "json_extract(details, '$.model')",
+    "run": "json_extract(details, '$.run_id')",
+    "run_kind": "json_extract(details, '$.run_kind')",
+}
+
+def get_usage_stats(repo_name: str = None, group_by: List[str] = ("repo", "stage")) -> List[Dict[str, Any]]:
+    """
+    Aggregates `llm_usage` events: calls, tokens in/out, latency, TTFT, cache hits and cost
+    per group (repo / stage / model / run / run_kind). Sorted by total tokens, heaviest first.
+    """
+    group_by = [g for g in group_by if g in USAGE_GROUP_KEYS] or ["stage"]
+
+    # 1. S3: aggregate in Python over the stored events
+    if S3_BUCKET:
+        events = [e for e in get_recent_events(limit=1000, repo_name=repo_name) if e.get("event_type") == "llm_usage"]
+        return _aggregate_usage(events, group_by)
+
+    # 2. Local SQLite: aggregate with json_extract
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        conn.row_factory = sqlite3.Row
+        c = conn.cursor()
+
+        columns = ", ".join(f"{USAGE_GROUP_KEYS[g]} AS {g}" for g in group_by)
+        query = f"""
+            SELECT {columns},
+                COUNT(*) AS calls,
+                SUM(CASE WHEN json_extract(details, '$.ok') THEN 0 ELSE 1 END) AS errors,
+                COALESCE(SUM(json_extract(details, '$.tokens_in')), 0) AS tokens_in,
+                COALESCE(SUM(json_extract(details, '$.tokens_out')), 0) AS tokens_out,
+                COALESCE(SUM(json_extract(details, '$.latency')), 0) AS latency,
+                AVG(json_extract(details, '$.latency')) AS avg_latency,
+                AVG(json_extract(details, '$.ttft')) AS avg_ttft,
+                SUM(CASE WHEN json_extract(details, '$.cache_hit') THEN 1 ELSE 0 END) AS cache_hits,
+                SUM(json_extract(details, '$.cost')) AS cost
+            FROM events WHERE event_type = 'llm_usage'
+        """
+        params = []
+        if repo_name:
+            query += " AND repo_name = ?"
+            params.append(repo_name)
+        query += f" GROUP BY {', '.join(group_by)} ORDER BY tokens_in + tokens_out DESC"
+
+        c.execute(query, tuple(params))
+        rows = [dict(row) for row in c.fetchall()]
+        conn.close()
+        return rows
+    except Exception as e:
+        print(f"DB Usage Stats Error: {e}")
+        return []
+
+def _aggregate_usage(events: List[Dict[str, Any]], group_by: List[str]) -> List[Dict[str, Any]]:
+    groups: Dict[tuple, Dict[str, Any]] = {}
+    for event in events:
+        d = event.get("details", {})
+        values = {"repo": event.get("repo_name"), "stage": d.get("stage"), "model": d.get("model"),
+                  "run": d.get("run_id"), "run_kind": d.get("run_kind")}
+        key = tuple(values[g] for g in group_by)
+        row = groups.setdefault(key, {**{g: values[g] for g in group_by}, "calls": 0, "errors": 0,
+                                      "tokens_in": 0, "tokens_out": 0, "latency": 0.0, "_ttft": [],
+                                      "cache_hits": 0, "cost": None})
+        row["calls"] += 1
+        row["errors"] += 0 if d.get("ok", True) else 1
+        row["tokens_in"] += d.get("tokens_in", 0)
+        row["tokens_out"] += d.get("tokens_out", 0)
+        row["latency"] += d.get("latency", 0.0)
+        row["cache_hits"] += 1 if d.get("cache_hit") else 0
+        if d.get("ttft") is not None:
+            row["_ttft"].append(d["ttft"])
+        if d.get("cost") is not None:
+            row["cost"] = (row["cost"] or 0) + d["cost"]
+
+    rows = []
+    for row in groups.values():
+        ttft = row.pop("_ttft")
+        row["avg_latency"] = row["latency"] / row["calls"]
+        row["avg_ttft"] = sum(ttft) / len(ttft) if ttft else None
+        rows.append(row)
+    return sorted(rows, key=lambda r: r["tokens_in"] + r["tokens_out"], reverse=True)
@@ -156,39 +156,83 @@ class GitProvider:
         """
         if not self.gh:
             return "Mock Comments"
-            
+        return self.format_comments(self.get_pr_comment_list(pr_url))
+
+    def get_pr_comment_list(self, pr_url: str) -> List[dict]:
+        """
+        Комментарии к PR с идентификаторами: review comments (на код) и общие комментарии.
+        Каждый элемент: {"id", "kind", "author", "path", "line", "body"}.
+        """
+        if not self.gh:
+            return []
+
         repo_name, number = self._parse_issue_url(pr_url)
         repo = self.gh.get_repo(repo_name)
         pr = repo.get_pull(number)
-        
-        comments_text = ""
-        # Review comments (на код)
+
+        comments = []
         for comment in pr.get_review_comments():
-            comments_text += f"[Review Comment] {comment.path}:{comment.position}\n{comment.body}\n---\n"
-            
-        # Issue comments (общие)
+            comments.append({"id": f"review:{comment.id}", "kind": "review", "author": comment.user.login,
+                             "path": comment.path, "line": comment.position, "body": comment.body})
         for comment in pr.get_issue_comments():
-             comments_text += f"[General Comment] {comment.user.login}: {comment.body}\n---\n"
-             
+            comments.append({"id": f"issue:{comment.id}", "kind": "general", "author": comment.user.login,
+                             "path": None, "line": None, "body": comment.body})
+        return comments
+
+    def get_pr_comment_count(self, pr_url: str) -> Optional[int]:
+        """
+        Число комментариев PR (review и общих) по счетчикам самого PR — один запрос без обхода списка.
+        """
+        if not self.gh:
+            return None
+
+        repo_name, number = self._parse_issue_url(pr_url)
+        pr = self.gh.get_repo(repo_name).get_pull(number)
+        return pr.comments + pr.review_comments
+
+    @staticmethod
+    def format_comments(comments: List[dict]) -> str:
+        comments_text = ""
+        for comment in comments:
+            if comment["kind"] == "review":
+                comments_text += f"[Review Comment] {comment['path']}:{comment['line']}\n{comment['body']}\n---\n"
+            else:
+                comments_text += f"[General Comment] {comment['author']}: {comment['body']}\n---\n"
         return comments_text
 
+    def get_pr_files(self, pr_url: str) -> List[str]:
+        """
+        Пути файлов, измененных в Pull Request.
+        """
+        if not self.gh:
+            return []
+        repo_name, number = self._parse_issue_url(pr_url)
+        pr = self.gh.get_repo(repo_name).get_pull(number)
+        return [f.filename for f in pr.get_files()]
+
     def get_issue_comments(self, issue_url: str) -> str:
         """
         Получает текст комментариев к Issue (исключая комментарии самого бота, если нужно).
         """
+        return self.format_issue_comments(self.get_issue_comment_list(issue_url))
+
+    def get_issue_comment_list(self, issue_url: str) -> List[dict]:
+        """
+        Комментарии к Issue в том же виде, что get_pr_comment_list: {"id", "kind", "author", "path", "line", "body"}.
+        """
         if not self.gh:
-             return ""
-             
+             return []
+
         repo_name, number = self._parse_issue_url(issue_url)
         repo = self.gh.get_repo(repo_name)
         issue = repo.get_issue(number)
-        
-        comments_text = ""
-        for comment in issue.get_comments():
-            # Skip bot rejections to avoid confusion? Or keep them context?
-            # Keeping them allows LLM to see "I rejected this previously".
-            comments_text += f"Comment by {comment.user.login}:\n{comment.body}\n---\n"
-        return comments_text
+        # Keeping bot comments allows LLM to see "I rejected this previously".
+        return [{"id": f"issue:{comment.id}", "kind": "general", "author": comment.user.login,
+                 "path": None, "line": None, "body": comment.body} for comment in issue.get_comments()]
+
+    @staticmethod
+    def format_issue_comments(comments: List[dict]) -> str:
+        return "".join(f"Comment by {comment['author']}:\n{comment['body']}\n---\n" for comment in comments)
 
     def checkout_pr(self, pr_url: str):
         """
@@ -0,0 +1,248 @@
+import os
+import json
+import math
+import time
+import argparse
+import subprocess
+import threading
+from collections import Counter, defaultdict
+from typing import Optional
+from src.core.config import Config
+from src.core.repo_files import repo_cache_dir, file_lock
+from src.core.retrieval import tokenize
+
+HISTORY_VERSION = 1
+COMMIT_SEP = "\x1e"
+FIELD_SEP = "\x1f"
+
+
+class HistoryIndex:
+    """
+    Индекс истории изменений репозитория, построенный по `git log`.
+
+    Хранит:
+    - сколько коммитов затронули каждый файл и сколько раз пары файлов менялись вместе (co-change);
+    - термы сообщений коммитов -> файлы, которые менялись в этих коммитах.
+
+    По нему агент без вызовов LLM добирает к выбранным файлам их обычных «спутников»
+    (тесты, конфиги) и находит файлы, которые менялись под похожие задачи.
+    Индекс хранится компактно (пути заменены номерами) в кэше репозитория и обновляется
+    инкрементально, начиная с последнего проиндексированного коммита.
+    """
+    def __init__(self, root: str = ".", cache_dir: Optional[str] = None):
+        self.root = root
+        self.cache_dir = cache_dir or repo_cache_dir(root, "history")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.head: Optional[str] = None
+        self.commits = 0
+        self.paths: list[str] = []
+        self.ids: dict[str, int] = {}
+        self.file_commits: list[int] = []
+        self.pairs: dict[int, Counter] = defaultdict(Counter)
+        self.terms: dict[str, Counter] = defaultdict(Counter)
+        self._loaded_mtime: Optional[int] = None
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def _path(self) -> str:
+        return os.path.join(self.cache_dir, "cochange.json")
+
+    # --- Построение ---
+
+    def update(self) -> dict:
+        """
+        Индексирует коммиты, появившиеся после последнего обновления.
+        Если прежний HEAD больше не является предком текущего (rebase, force-push), индекс строится заново.
+        """
+        with self._lock, file_lock(self._path + ".lock"):
+            start = time.perf_counter()
+            # Другой процесс мог обновить общий индекс за это время
+            self._load()
+            head = self._git("rev-parse", "HEAD")
+            if not head:
+                return {"commits": 0, "new": 0, "seconds": 0.0}
+            head = head.strip()
+            if head == self.head:
+                return {"commits": self.commits, "new": 0, "seconds": round(time.perf_counter() - start, 3)}
+
+            rev_range = head
+            if self.head and self._git("merge-base", "--is-ancestor", self.head, head) is not None:
+                rev_range = f"{self.head}..{head}"
+            else:
+                self._reset()
+
+            log = self._git("log", "--no-merges", "--name-only", f"--format={COMMIT_SEP}%H{FIELD_SEP}%B{FIELD_SEP}",
+                            rev_range) or ""
+            new = 0
+            for chunk in log.split(COMMIT_SEP):
+                parts = chunk.split(FIELD_SEP)
+                if len(parts) < 3:
+                    continue
+                files = [line.strip() for line in parts[2].splitlines() if line.strip()]
+                if files:
+                    self._add_commit(parts[1], files)
+                    new += 1
+
+            self.head = head
+            self._save()
+            return {"commits": self.commits, "new": new, "seconds": round(time.perf_counter() - start, 3)}
+
+    def _add_commit(self, message: str, files: list[str]):
+        self.commits += 1
+        ids = [self._id(path) for path in dict.fromkeys(files)]
+        for i in ids:
+            self.file_commits[i] += 1
+        # Массовые коммиты (форматирование, переименования) не говорят о связи файлов
+        if len(ids) <= Config.HISTORY_MAX_COMMIT_FILES:
+            for i in ids:
+                for j in ids:
+                    if i != j:
+                        self.pairs[i][j] += 1
+            for term in set(tokenize(message)):
+                for i in ids:
+                    self.terms[term][i] += 1
+
+    def _id(self, path: str) -> int:
+        if path not in self.ids:
+            self.ids[path] = len(self.paths)
+            self.paths.append(path)
+            self.file_commits.append(0)
+        return self.ids[path]
+
+    def _reset(self):
+        self.head = None
+        self.commits = 0
+        self.paths, self.ids, self.file_commits = [], {}, []
+        self.pairs = defaultdict(Counter)
+        self.terms = defaultdict(Counter)
+
+    def _git(self, *args: str) -> Optional[str]:
+        try:
+            result = subprocess.run(["git", *args], cwd=self.root, capture_output=True, text=True, check=True)
+            return result.stdout
+        except (subprocess.CalledProcessError, FileNotFoundError):
+            return None
+
+    # --- Хранение ---
+
+    def _save(self):
+        data = {
+            "version": HISTORY_VERSION,
+            "head": self.head,
+            "commits": self.commits,
+            "paths": self.paths,
+            "file_commits": self.file_commits,
+            "pairs": {i: dict(c) for i, c in self.pairs.items()},
+            "terms": {t: dict(c) for t, c in self.terms.items()},
+        }
+        tmp_path = f"{self._path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self._path)
+        self._loaded_mtime = os.stat(self._path).st_mtime_ns
+
+    def _load(self):
+        try:
+            mtime = os.stat(self._path).st_mtime_ns
+            if mtime == self._loaded_mtime:
+                return
+            with open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        if data.get("version") != HISTORY_VERSION:
+            return
+        self._reset()
+        self._loaded_mtime = mtime
+        self.head = data["head"]
+        self.commits = data["commits"]
+        self.paths = data["paths"]
+        self.ids = {path: i for i, path in enumerate(self.paths)}
+        self.file_commits = data["file_commits"]
+        for i, row in data["pairs"].items():
+            self.pairs[int(i)] = Counter({int(j): n for j, n in row.items()})
+        for term, row in data["terms"].items():
+            self.terms[term] = Counter({int(i): n for i, n in row.items()})
+
+    # --- Запросы ---
+
+    def companions(self, paths: list[str], k: int = 3, min_support: Optional[int] = None,
+                   min_confidence: Optional[float] = None) -> list[tuple[str, float]]:
+        """
+        Файлы, которые обычно меняются вместе с данными: [(path, confidence)] по убыванию.
+        confidence(a -> b) = совместные коммиты / коммиты с a; учитываются пары с support >= min_support.
+        Возвращаются только существующие сейчас файлы, не входящие в paths.
+        """
+        min_support = Config.HISTORY_MIN_SUPPORT if min_support is None else min_support
+        min_confidence = Config.HISTORY_MIN_CONFIDENCE if min_confidence is None else min_confidence
+        with self._lock:
+            seeds = {self.ids[p] for p in paths if p in self.ids}
+            scores: dict[int, float] = {}
+            for seed in seeds:
+                total = self.file_commits[seed]
+                for other, together in self.pairs.get(seed, {}).items():
+                    if other in seeds or together < min_support:
+                        continue
+                    confidence = together / total
+                    if confidence >= min_confidence:
+                        scores[other] = max(scores.get(other, 0.0), confidence)
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], self.paths[item[0]]))
+            return [(self.paths[i], round(score, 3)) for i, score in ranked
+                    if os.path.isfile(os.path.join(self.root, self.paths[i]))][:k]
+
+    def similar_files(self, query: str, k: int = 10) -> list[tuple[str, float]]:
+        """
+        Файлы, которые менялись в коммитах с похожими сообщениями (TF-IDF по термам сообщений).
+        """
+        with self._lock:
+            scores: dict[int, float] = defaultdict(float)
+            for term in set(tokenize(query)):
+                files = self.terms.get(term)
+                if not files:
+                    continue
+                idf = math.log(1 + len(self.paths) / len(files))
+                for i, n in files.items():
+                    scores[i] += idf * (1 + math.log(n))
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], self.paths[item[0]]))
+            return [(self.paths[i], round(score, 3)) for i, score in ranked
+                    if os.path.isfile(os.path.join(self.root, self.paths[i]))][:k]
+
+
+_indexes: dict[str, HistoryIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_history_index(root: str = ".") -> HistoryIndex:
+    """
+    Индекс истории репозитория, общий для процесса; при каждом вызове дочитывает новые коммиты.
+    """
+    key = os.path.abspath(root)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = HistoryIndex(root)
+    index.update()
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Индекс совместных изменений файлов по git log")
+    parser.add_argument("root", nargs="?", default=".")
+    parser.add_argument("--files", nargs="*", default=[], help="Показать спутников для файлов")
+    parser.add_argument("--query", help="Файлы, менявшиеся под похожие задачи")
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    index = HistoryIndex(args.root)
+    print(f"History: {index.update()}")
+    if args.files:
+        for path, confidence in index.companions(args.files, args.k):
+            print(f"  {confidence:5.2f}  {path}")
+    if args.query:
+        for path, score in index.similar_files(args.query, args.k):
+            print(f"  {score:6.2f}  {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+from src.core.config import Config
+from src.core.repo_files import list_repo_files, repo_cache_dir
+from src.core.repo_scanner import RepoMapGenerator
+
+GRAPH_VERSION = 1
+# Оценка длительности тестового файла, для которого еще нет замеров (секунды)
+DEFAULT_TEST_SECONDS = 1.0
+# Сколько последних строк вывода pytest сохранять для упавшего файла
+FAILURE_OUTPUT_LINES = 40
+# Пакеты с этими корнями импортируются и без префикса (src-layout)
+SOURCE_ROOTS = ("src", "lib")
+
+
+def is_test_file(path: str) -> bool:
+    name = os.path.basename(path)
+    return name.endswith(".py") and (name.startswith("test_") or name.endswith("_test.py"))
+
+
+def _module_names(path: str) -> list[str]:
+    parts = path[:-3].split("/")
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    if not parts or not all(p.isidentifier() for p in parts):
+        return []
+    names = [".".join(parts)]
+    if len(parts) > 1 and parts[0] in SOURCE_ROOTS:
+        names.append(".".join(parts[1:]))
+    return names
+
+
+@dataclass
+class TestRunResult:
+    passed: list[str] = field(default_factory=list)
+    failed: dict[str, str] = field(default_factory=dict)  # тестовый файл -> хвост вывода pytest
+    skipped: list[str] = field(default_factory=list)  # не успели запуститься в пределах бюджета
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+
+class ImportGraph:
+    """
+    Граф импортов Python-файлов репозитория для анализа влияния изменений на тесты.
+
+    Импорты извлекаются тем же проходом AST, что строит карту репозитория (RepoMapGenerator.scan_python_file),
+    и кэшируются по git blob SHA файла: при обновлении заново разбираются только измененные файлы.
+    В том же кэше хранятся замеренные длительности тестовых файлов (для распределения по процессам).
+    """
+    def __init__(self, root: str = ".", cache_dir: Optional[str] = None):
+        self.root = root
+        self.cache_dir = cache_dir or repo_cache_dir(root, "imports")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.files: dict[str, dict] = {}  # path -> {"sig", "imports"}
+        self.durations: dict[str, float] = {}
+        self._modules: dict[str, str] = {}
+        self._dependents: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def _path(self) -> str:
+        return os.path.join(self.cache_dir, "graph.json")
+
+    def refresh(self) -> dict:
+        with self._lock:
+            start = time.perf_counter()
+            current = {p: sig for p, sig in list_repo_files(self.root).items() if p.endswith(".py")}
+            parsed = 0
+            for path in list(self.files):
+                if path not in current:
+                    del self.files[path]
+            for path, sig in current.items():
+                entry = self.files.get(path)
+                if entry is None or entry["sig"] != sig:
+                    _, imports = RepoMapGenerator.scan_python_file(os.path.join(self.root, path))
+                    self.files[path] = {"sig": sig, "imports": imports}
+                    parsed += 1
+            self._build()
+            if parsed:
+                self._save()
+            return {"files": len(self.files), "parsed": parsed, "seconds": round(time.perf_counter() - start, 3)}
+
+    def _build(self):
+        self._modules = {}
+        for path in self.files:
+            for name in _module_names(path):
+                self._modules.setdefault(name, path)
+        self._dependents = {}
+        for path, entry in self.files.items():
+            for target in self._resolve(path, entry["imports"]):
+                if target != path:
+                    self._dependents.setdefault(target, set()).add(path)
+
+    def _resolve(self, path: str, imports: list[str]) -> set[str]:
+        """
+        Файлы репозитория, от которых зависит path: модуль импорта и все его пакеты (их __init__ тоже исполняется).
+        """
+        package = path.split("/")[:-1]
+        targets = set()
+        for name in imports:
+            level = len(name) - len(name.lstrip("."))
+            if level:
+                base = package[:len(package) - (level - 1)] if level - 1 <= len(package) else []
+                name = ".".join(base + [name.lstrip(".")]) if name.lstrip(".") else ".".join(base)
+            parts = name.split(".")
+            for i in range(len(parts), 0, -1):
+                target = self._modules.get(".".join(parts[:i]))
+                if target:
+                    targets.add(target)
+        return targets
+
+    def dependents(self, paths: list[str]) -> set[str]:
+        """
+        Все файлы, транзитивно импортирующие любой из paths (включая сами paths).
+        """
+        with self._lock:
+            seen = set(paths)
+            stack = list(paths)
+            while stack:
+                for dependent in self._dependents.get(stack.pop(), ()):
+                    if dependent not in seen:
+                        seen.add(dependent)
+                        stack.append(dependent)
+            return seen
+
+    def impacted_tests(self, changed: list[str]) -> list[str]:
+        """
+        Тестовые файлы, которые транзитивно импортируют измененные модули, и сами измененные тесты.
+        Изменение conftest.py затрагивает все тесты в его каталоге. Не-Python файлы не учитываются.
+        """
+        python = [p for p in changed if p.endswith(".py")]
+        affected = self.dependents(python)
+        for conftest in (p for p in python if os.path.basename(p) == "conftest.py"):
+            prefix = os.path.dirname(conftest)
+            affected.update(p for p in self.files if not prefix or p.startswith(prefix + "/"))
+        return sorted(p for p in affected if is_test_file(p) and p in self.files)
+
+    def run_tests(self, tests: list[str], workers: int = 0, budget: Optional[float] = None) -> TestRunResult:
+        """
+        Запускает тестовые файлы параллельно (по процессу pytest на файл). Самые долгие по прошлым замерам
+        стартуют первыми; файлы, которые не успели начаться до исчерпания бюджета, пропускаются.
+        """
+        workers = workers or Config.TEST_WORKERS or os.cpu_count() or 2
+        budget = Config.VALIDATION_TIMEOUT if budget is None else budget
+        deadline = time.monotonic() + budget
+        ordered = sorted(tests, key=lambda t: -self.durations.get(t, DEFAULT_TEST_SECONDS))
+        result = TestRunResult()
+        start = time.perf_counter()
+
+        def run(test: str):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                result.skipped.append(test)
+                return
+            began = time.perf_counter()
+            try:
+                proc = subprocess.run([sys.executable, "-m", "pytest", "-q", "-x", "-p", "no:cacheprovider", test],
+                                      cwd=self.root, capture_output=True, text=True, timeout=remaining)
+            except subprocess.TimeoutExpired:
+                result.failed[test] = f"timed out (time budget {budget}s exhausted)"
+                return
+            self.durations[test] = round(time.perf_counter() - began, 3)
+            # 5 — в файле нет тестов
+            if proc.returncode in (0, 5):
+                result.passed.append(test)
+            else:
+                output = (proc.stdout + proc.stderr).strip().splitlines()
+                result.failed[test] = "\n".join(output[-FAILURE_OUTPUT_LINES:])
+
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(ordered) or 1)),
+                                thread_name_prefix="tests") as pool:
+            list(pool.map(run, ordered))
+        result.seconds = round(time.perf_counter() - start, 3)
+        with self._lock:
+            self._save()
+        return result
+
+    def _save(self):
+        data = {"version": GRAPH_VERSION, "files": self.files, "durations": self.durations}
+        # Копии репозитория (кандидаты решений) делят кэш: у каждого писателя свой временный файл
+        tmp_path = f"{self._path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, self._path)
+        except OSError as e:
+            print(f"Import graph save error: {e}")
+
+    def _load(self):
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        if data.get("version") == GRAPH_VERSION:
+            self.files = data["files"]
+            self.durations = data.get("durations", {})
+
+
+_graphs: dict[str, ImportGraph] = {}
+_graphs_lock = threading.Lock()
+
+
+def get_import_graph(root: str = ".") -> ImportGraph:
+    """
+    Граф импортов репозитория, общий для процесса; при каждом вызове дочитывает измененные файлы.
+    """
+    key = os.path.abspath(root)
+    with _graphs_lock:
+        graph = _graphs.get(key)
+        if graph is None:
+            graph = _graphs[key] = ImportGraph(root)
+    graph.refresh()
+    return graph
+
+
+def _changed_since(root: str, ref: str) -> list[str]:
+    try:
+        out = subprocess.run(["git", "diff", "--name-only", ref], cwd=root, capture_output=True, text=True,
+                             check=True).stdout
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return []
+    return [line.strip() for line in out.splitlines() if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Тесты, затронутые изменениями (по графу импортов)")
+    parser.add_argument("root", nargs="?", default=".")
+    parser.add_argument("--changed", nargs="*", default=[], help="Измененные файлы")
+    parser.add_argument("--since", help="Взять измененные файлы из git diff относительно ref (например, HEAD)")
+    parser.add_argument("--run", action="store_true", help="Запустить выбранные тесты")
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--budget", type=float, default=None, help="Бюджет времени на тесты, секунды")
+    args = parser.parse_args()
+
+    graph = ImportGraph(args.root)
+    print(f"Import graph: {graph.refresh()}")
+    changed = args.changed + (_changed_since(args.root, args.since) if args.since else [])
+    tests = graph.impacted_tests(changed)
+    print(f"Impacted tests ({len(tests)}):")
+    for test in tests:
+        print(f"  {test}")
+    if args.run and tests:
+        result = graph.run_tests(tests, args.workers, args.budget)
+        print(f"Passed {len(result.passed)}, failed {len(result.failed)}, skipped {len(result.skipped)} "
+              f"in {result.seconds}s")
+        for test, output in result.failed.items():
+            print(f"\n--- {test}\n{output}")
+        sys.exit(0 if result.ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,93 @@
+import json
+import math
+import time
+import email.utils
+import threading
+import contextvars
 from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from dataclasses import dataclass
 from typing import Optional
 import requests
+from requests.adapters import HTTPAdapter
 from src.core.config import Config
+from src.core.rate_limiter import get_rate_limiter
+from src.core.operation_poller import OperationPoller, OperationTimeout
+from src.core.telemetry import UsageRecord, record_usage
+
+# Стадии пайплайна, для каждой из которых можно задать свою модель (см. Config.LLM_ROUTES)
+STAGE_SELECTION = "selection"
+STAGE_GENERATION = "generation"
+STAGE_FIX = "fix"
+STAGE_REVIEW = "review"
+LLM_STAGES = (STAGE_SELECTION, STAGE_GENERATION, STAGE_FIX, STAGE_REVIEW)
+# Запас сверх YC_ASYNC_TIMEOUT на ожидание результата асинхронной операции (секунды)
+POLL_RESULT_GRACE = 60
+# Верхний предел паузы по Retry-After (секунды): ошибочный заголовок не должен надолго останавливать агента
+MAX_RETRY_AFTER = 300.0
+
+
+class LLMError(Exception):
+    """
+    Ошибка вызова LLM (HTTP-ошибка, некорректный ответ API).
+    """
+    pass
+
+
+class RateLimitError(LLMError):
+    """
+    Провайдер отклонил запрос из-за превышения квоты (HTTP 429).
+    """
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str], default: float = 1.0) -> float:
+    """
+    Пауза из заголовка Retry-After в секундах: число секунд или HTTP-дата (RFC 7231),
+    не больше MAX_RETRY_AFTER. Непонятное или нечисловое (nan, inf) значение или его отсутствие — default.
+    """
+    if not value:
+        return default
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            moment = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return default
+        if moment.tzinfo is None:
+            return default
+        seconds = moment.timestamp() - time.time()
+    if not math.isfinite(seconds):
+        return default
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+@dataclass
+class LLMResponse:
+    """
+    Результат одного вызова модели вместе с данными об использовании.
+    """
+    text: str
+    tokens_in: int = 0
+    tokens_out: int = 0
+    cached_tokens: int = 0
+    ttft: Optional[float] = None
+
+
+@dataclass
+class BatchResult:
+    """
+    Результат одного элемента generate_many: текст или ошибка.
+    """
+    text: str = ""
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
 
 
 class LLMProvider(ABC):
@@ -9,108 +95,427 @@ class LLMProvider(ABC):
     Абстрактный базовый класс для провайдеров LLM.
     Определяет единый интерфейс взаимодействия с различными языковыми моделями.
     """
-    @abstractmethod
+    name = "llm"
+    stage: str | None = None
+    model: str = ""
+
     def generate(self, system_prompt: str, user_prompt: str) -> str:
         """
         Генерирует текстовый ответ на основе системного и пользовательского промптов.
+        Возвращает пустую строку в случае ошибки API. Каждый вызов учитывается в телеметрии.
+        """
+        try:
+            return self._call(system_prompt, user_prompt)
+        except Exception as e:
+            print(f"Ошибка {self.name}: {e}")
+            return ""
+
+    def generate_many(self, prompts: list[tuple[str, str]], max_concurrency: int | None = None) -> list[BatchResult]:
+        """
+        Выполняет несколько запросов (system_prompt, user_prompt) параллельно.
+        Результаты возвращаются в порядке входных промптов; ошибка одного элемента
+        не прерывает остальные. Общий лимитер провайдера гарантирует, что батч
+        не превысит квоты (LLM_RPM / LLM_MAX_CONCURRENCY).
+        """
+        if not prompts:
+            return []
+        workers = min(max_concurrency or self._limiter().max_concurrency, len(prompts))
+
+        def run_one(prompt: tuple[str, str]) -> BatchResult:
+            try:
+                return BatchResult(text=self._call(*prompt))
+            except Exception as e:
+                print(f"Ошибка {self.name} (batch): {e}")
+                return BatchResult(error=str(e))
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm-batch") as pool:
+            # Контекст (текущий запуск телеметрии) копируется в каждый поток
+            futures = [pool.submit(contextvars.copy_context().run, run_one, p) for p in prompts]
+            return [f.result() for f in futures]
+
+    def _call(self, system_prompt: str, user_prompt: str) -> str:
+        """
+        Один вызов модели через лимитер провайдера с повтором при 429.
+        Пишет запись в телеметрию, ошибки пробрасывает.
+        """
+        limiter = self._limiter()
+        for attempt in range(Config.LLM_RETRIES + 1):
+            start = time.perf_counter()
+            try:
+                with limiter.slot():
+                    started = self._start(system_prompt, user_prompt)
+                result = self._finish(started)
+            except RateLimitError as e:
+                self._record(time.perf_counter() - start, error=str(e))
+                limiter.penalize(e.retry_after)
+                if attempt == Config.LLM_RETRIES:
+                    raise
+                print(f"{self.name}: превышена квота, повтор через {e.retry_after:.1f}s")
+                continue
+            except Exception as e:
+                self._record(time.perf_counter() - start, error=str(e))
+                raise
+            self._record(time.perf_counter() - start, result)
+            return result.text
+
+    def _limiter(self):
+        return get_rate_limiter(self.name)
+
+    def _start(self, system_prompt: str, user_prompt: str):
+        """
+        Часть вызова, которая занимает слот лимитера (запрос к API). По умолчанию — весь вызов.
+        """
+        return self._complete(system_prompt, user_prompt)
+
+    def _finish(self, started) -> LLMResponse:
+        """
+        Ожидание результата после освобождения слота (например, опрос асинхронной операции).
+        """
+        return started
+
+    @abstractmethod
+    def _complete(self, system_prompt: str, user_prompt: str) -> LLMResponse:
+        """
+        Выполняет запрос к модели. Ошибки пробрасываются как исключения.
         """
         pass
 
+    def _record(self, latency: float, result: Optional[LLMResponse] = None, error: str = ""):
+        record_usage(UsageRecord(
+            stage=self.stage or "default",
+            model=self.model,
+            provider=self.name,
+            tokens_in=result.tokens_in if result else 0,
+            tokens_out=result.tokens_out if result else 0,
+            cached_tokens=result.cached_tokens if result else 0,
+            latency=round(latency, 3),
+            ttft=round(result.ttft, 3) if result and result.ttft is not None else None,
+            cache_hit=bool(result and result.cached_tokens),
+            ok=not error,
+            error=error[:500],
+        ))
+
 class OpenAILLM(LLMProvider):
     """
     Реализация провайдера для работы с OpenAI API.
     """
-    def __init__(self):
+    name = "OpenAI"
+
+    def __init__(self, model: str | None = None, temperature: float | None = None, max_tokens: int | None = None):
         try:
             import openai
         except ImportError:
             raise ImportError("Модуль 'openai' не установлен. Пожалуйста, добавьте его через 'poetry add openai' или используйте YandexGPT.")
             
+        self._openai = openai
         self.client = openai.OpenAI(
             api_key=Config.OPENAI_API_KEY,
             base_url=Config.LLM_BASE_URL
         )
-        self.model = Config.LLM_MODEL
+        self.model = model or Config.LLM_MODEL
+        self.temperature = Config.LLM_TEMPERATURE if temperature is None else temperature
+        self.max_tokens = max_tokens or Config.LLM_MAX_TOKENS
 
-    def generate(self, system_prompt: str, user_prompt: str) -> str:
+    def _complete(self, system_prompt: str, user_prompt: str) -> LLMResponse:
         """
-        Отправляет запрос к модели OpenAI и возвращает содержимое ответа.
-        Возвращает пустую строку в случае ошибки API.
+        Отправляет запрос к модели OpenAI и возвращает содержимое ответа с данными usage.
         """
+        params = dict(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=self.temperature,
+            max_tokens=self.max_tokens
+        )
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ]
-            )
-            return response.choices[0].message.content or ""
-        except Exception as e:
-            print(f"Ошибка OpenAI: {e}")
-            return ""
+            if Config.LLM_STREAM:
+                return self._complete_stream(params)
+            response = self.client.chat.completions.create(**params)
+        except self._openai.RateLimitError as e:
+            retry_after = e.response.headers.get("retry-after") if getattr(e, "response", None) is not None else None
+            raise RateLimitError(str(e), parse_retry_after(retry_after))
+
+        result = LLMResponse(text=response.choices[0].message.content or "")
+        self._apply_usage(result, response.usage)
+        return result
+
+    def _complete_stream(self, params: dict) -> LLMResponse:
+        start = time.perf_counter()
+        result = LLMResponse(text="")
+        parts = []
+        stream = self.client.chat.completions.create(**params, stream=True, stream_options={"include_usage": True})
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                if result.ttft is None:
+                    result.ttft = time.perf_counter() - start
+                parts.append(chunk.choices[0].delta.content)
+            if getattr(chunk, "usage", None):
+                self._apply_usage(result, chunk.usage)
+        result.text = "".join(parts)
+        return result
+
+    @staticmethod
+    def _apply_usage(result: LLMResponse, usage):
+        if not usage:
+            return
+        result.tokens_in = usage.prompt_tokens or 0
+        result.tokens_out = usage.completion_tokens or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        result.cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """
+    Общий HTTP-пул соединений для REST-провайдеров (keep-alive, до LLM_MAX_CONCURRENCY соединений на хост).
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(Config.LLM_MAX_CONCURRENCY, 1))
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
 
 class YandexGPTLLM(LLMProvider):
     """
     Реализация провайдера для работы с YandexGPT через REST API.
     """
-    def __init__(self):
+    name = "YandexGPT"
+    DEFAULT_MODEL = "yandexgpt/latest"
+
+    def __init__(self, model: str | None = None, temperature: float | None = None, max_tokens: int | None = None):
         self.api_key = Config.OPENAI_API_KEY
         self.folder_id = Config.YC_FOLDER_ID
-        self.url = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
-        # modelUri формируется как: "gpt://<folder_id>/yandexgpt/latest"
-        self.model_uri = f"gpt://{self.folder_id}/yandexgpt/latest"
+        self.url = f"{Config.YC_API_URL.rstrip('/')}/completion"
+        self.async_url = f"{Config.YC_API_URL.rstrip('/')}/completionAsync"
+        self.async_mode = Config.YC_COMPLETION_MODE.lower() == "async"
+        self.model_uri = self._build_model_uri(model)
+        self.model = self.model_uri
+        self.temperature = Config.LLM_TEMPERATURE if temperature is None else temperature
+        self.max_tokens = max_tokens or Config.LLM_MAX_TOKENS
 
-    def generate(self, system_prompt: str, user_prompt: str) -> str:
+    def _build_model_uri(self, model: str | None) -> str:
         """
-        Отправляет POST-запрос к API YandexGPT и возвращает сгенерированный текст.
-        Использует синхронный режим генерации.
+        modelUri формируется как: "gpt://<folder_id>/<model>", например "gpt://<folder_id>/yandexgpt-lite/latest".
+        Имена моделей OpenAI (gpt-4o, ...) игнорируются — используется YandexGPT по умолчанию.
         """
-        headers = {
+        if model and model.startswith("gpt://"):
+            return model
+        if not model or model.startswith("gpt-"):
+            model = self.DEFAULT_MODEL
+        if "/" not in model:
+            model = f"{model}/latest"
+        return f"gpt://{self.folder_id}/{model}"
+
+    def _headers(self) -> dict:
+        return {
             "Authorization": f"Api-Key {self.api_key}",
             "x-folder-id": self.folder_id or ""
         }
-        
-        prompt = {
+
+    def _build_request(self, system_prompt: str, user_prompt: str, stream: bool = False) -> dict:
+        return {
             "modelUri": self.model_uri,
             "completionOptions": {
-                "stream": False,
-                "temperature": 0.3,
-                "maxTokens": "8000"
+                "stream": stream,
+                "temperature": self.temperature,
+                "maxTokens": str(self.max_tokens)
             },
             "messages": [
                 {"role": "system", "text": system_prompt},
                 {"role": "user", "text": user_prompt}
             ]
         }
+
+    def _complete(self, system_prompt: str, user_prompt: str) -> LLMResponse:
+        """
+        Отправляет POST-запрос к API YandexGPT и возвращает сгенерированный текст с данными usage.
+        Использует синхронный режим генерации (потоковый, если включен LLM_STREAM)
+        или асинхронную операцию при YC_COMPLETION_MODE=async.
+        """
+        if self.async_mode:
+            return self._finish(self._submit(system_prompt, user_prompt))
+
+        headers = self._headers()
+        prompt = self._build_request(system_prompt, user_prompt, stream=Config.LLM_STREAM)
         
+        start = time.perf_counter()
+        response = get_http_session().post(self.url, headers=headers, json=prompt, stream=Config.LLM_STREAM)
+        if response.status_code == 429:
+            raise RateLimitError(response.text, parse_retry_after(response.headers.get("Retry-After")))
+        if response.status_code != 200:
+            raise LLMError(response.text)
+
+        if not Config.LLM_STREAM:
+            return self._parse_result(response.json().get("result", {}))
+
+        # В потоковом режиме каждая строка — JSON с накопленным текстом альтернативы
+        result, ttft = LLMResponse(text=""), None
+        for line in response.iter_lines():
+            if not line:
+                continue
+            result = self._parse_result(json.loads(line).get("result", {}))
+            if ttft is None and result.text:
+                ttft = time.perf_counter() - start
+        result.ttft = ttft
+        return result
+
+    def _start(self, system_prompt: str, user_prompt: str):
+        # В асинхронном режиме слот лимитера занят только на создание операции, не на её опрос
+        if self.async_mode:
+            return self._submit(system_prompt, user_prompt)
+        return self._complete(system_prompt, user_prompt)
+
+    def _finish(self, started) -> LLMResponse:
+        if isinstance(started, Future):
+            return self._parse_result(self._wait(started))
+        return started
+
+    @staticmethod
+    def _wait(future: Future) -> dict:
+        """
+        Результат операции. Поллер сам завершает её по YC_ASYNC_TIMEOUT; таймаут ожидания —
+        страховка на случай, если поток опроса остановился.
+        """
         try:
-            response = requests.post(self.url, headers=headers, json=prompt)
-            if response.status_code != 200:
-                print(f"Ошибка YandexGPT: {response.text}")
-                return ""
-            
-            result = response.json()
-            return result.get("result", {}).get("alternatives", [{}])[0].get("message", {}).get("text", "")
-        except Exception as e:
-            print(f"Исключение YandexGPT: {e}")
-            return ""
+            return future.result(timeout=Config.YC_ASYNC_TIMEOUT + POLL_RESULT_GRACE)
+        except FutureTimeout:
+            raise OperationTimeout(f"No result from the operation poller in {Config.YC_ASYNC_TIMEOUT}s")
+
+    def _submit(self, system_prompt: str, user_prompt: str) -> Future:
+        """
+        Создает асинхронную операцию completionAsync и ставит её на общий опрос.
+        Future завершается телом ответа операции (alternatives / usage).
+        """
+        response = get_http_session().post(self.async_url, headers=self._headers(),
+                                           json=self._build_request(system_prompt, user_prompt))
+        if response.status_code == 429:
+            raise RateLimitError(response.text, parse_retry_after(response.headers.get("Retry-After")))
+        if response.status_code != 200:
+            raise LLMError(response.text)
+        operation = response.json()
+        if operation.get("done"):
+            future: Future = Future()
+            future.set_result(operation.get("response", {}))
+            return future
+        # Заголовки передаются с операцией: у провайдеров разных стадий могут быть разные ключи
+        return get_operation_poller().submit(operation["id"], headers=self._headers())
+
+    def generate_many(self, prompts: list[tuple[str, str]], max_concurrency: int | None = None) -> list[BatchResult]:
+        """
+        В асинхронном режиме все операции создаются сразу (с учетом лимитера),
+        а ожидание результатов мультиплексируется одним потоком опроса.
+        """
+        if not self.async_mode:
+            return super().generate_many(prompts, max_concurrency)
 
-def get_llm() -> LLMProvider:
+        submitted = []
+        for system_prompt, user_prompt in prompts:
+            start = time.perf_counter()
+            try:
+                with self._limiter().slot():
+                    future = self._submit(system_prompt, user_prompt)
+            except Exception as e:
+                self._record(time.perf_counter() - start, error=str(e))
+                submitted.append((start, None, e))
+                continue
+            done_at = {}
+            future.add_done_callback(lambda f, d=done_at: d.setdefault("t", time.perf_counter()))
+            submitted.append((start, (future, done_at), None))
+
+        results = []
+        for start, pending, error in submitted:
+            if pending:
+                future, done_at = pending
+                try:
+                    result = self._parse_result(self._wait(future))
+                    self._record(done_at.get("t", time.perf_counter()) - start, result)
+                    results.append(BatchResult(text=result.text))
+                    continue
+                except Exception as e:
+                    self._record(time.perf_counter() - start, error=str(e))
+                    error = e
+            print(f"Ошибка {self.name} (batch): {error}")
+            results.append(BatchResult(error=str(error)))
+        return results
+
+    @staticmethod
+    def _parse_result(result: dict) -> LLMResponse:
+        text = result.get("alternatives", [{}])[0].get("message", {}).get("text", "")
+        usage = result.get("usage", {})
+        return LLMResponse(
+            text=text,
+            tokens_in=int(usage.get("inputTextTokens", 0)),
+            tokens_out=int(usage.get("completionTokens", 0)),
+        )
+
+_poller: OperationPoller | None = None
+_poller_lock = threading.Lock()
+
+
+def get_operation_poller() -> OperationPoller:
+    """
+    Общий для процесса поток опроса операций YandexGPT.
+    """
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            def fetch(operation_id: str, headers: Optional[dict]) -> dict:
+                response = get_http_session().get(f"{Config.YC_OPERATIONS_URL.rstrip('/')}/{operation_id}",
+                                                  headers=headers, timeout=30)
+                response.raise_for_status()
+                return response.json()
+            _poller = OperationPoller(fetch)
+        return _poller
+
+
+def get_llm(stage: str | None = None) -> LLMProvider:
     """
     Фабричная функция для получения экземпляра LLM провайдера.
+    Если указана стадия пайплайна, применяются её настройки из Config.LLM_ROUTES.
     """
+    route = Config.get_llm_route(stage)
+    params = {"model": route["model"], "temperature": route["temperature"], "max_tokens": route["max_tokens"]}
+    provider = (route["provider"] or "").lower()
+
+    if provider in ("yandex", "yandexgpt"):
+        llm = YandexGPTLLM(**params)
+    elif provider == "openai":
+        llm = OpenAILLM(**params)
     # 1. Check for YandexGPT
-    if Config.YC_FOLDER_ID or "api.cloud.yandex" in Config.LLM_BASE_URL:
-        return YandexGPTLLM()
-    
+    elif Config.YC_FOLDER_ID or "api.cloud.yandex" in Config.LLM_BASE_URL:
+        llm = YandexGPTLLM(**params)
     # 2. Check for OpenAI
-    if Config.OPENAI_API_KEY:
+    elif Config.OPENAI_API_KEY:
         # Only try to instantiate if key is present
-        return OpenAILLM()
-        
-    # 3. No config found
-    raise ValueError(
-        "CRITICAL ERROR: No LLM configuration found!\n"
-        "Please set env vars/secrets: 'YC_FOLDER_ID' (for Yandex) or 'OPENAI_API_KEY' (for OpenAI)."
-    )
+        llm = OpenAILLM(**params)
+    else:
+        # 3. No config found
+        raise ValueError(
+            "CRITICAL ERROR: No LLM configuration found!\n"
+            "Please set env vars/secrets: 'YC_FOLDER_ID' (for Yandex) or 'OPENAI_API_KEY' (for OpenAI)."
+        )
+
+    llm.stage = stage
+    return llm
+
+
+class LLMRouter:
+    """
+    Выдает провайдера LLM для каждой стадии пайплайна.
+    Провайдеры создаются лениво и переиспользуются в рамках одного агента.
+    """
+    def __init__(self):
+        self._providers: dict[str, LLMProvider] = {}
+
+    def get(self, stage: str) -> LLMProvider:
+        if stage not in self._providers:
+            self._providers[stage] = get_llm(stage)
+        return self._providers[stage]
@@ -0,0 +1,341 @@
+"""
+Локальный mock-сервер LLM для офлайн-тестов и нагрузочного тестирования.
+Говорит на двух протоколах:
+  - OpenAI:    POST /v1/chat/completions (в т.ч. stream=true, SSE)
+  - YandexGPT: POST /foundationModels/v1/completion (в т.ч. stream=true),
+               POST /foundationModels/v1/completionAsync + GET /operations/{id}
+
+Запуск:
+    python -m src.core.mock_llm_server --port 8089 --latency lognormal:0.5,0.4 --tps 60 \\
+        --error-rate 0.01 --rate-limit-rate 0.05 --script responses.json
+
+Настройка агента на него:
+    OpenAI:    LLM_BASE_URL=http://127.0.0.1:8089/v1 LLM_API_KEY=mock
+    YandexGPT: YC_FOLDER_ID=mock YC_API_URL=http://127.0.0.1:8089/foundationModels/v1
+               YC_OPERATIONS_URL=http://127.0.0.1:8089/operations
+
+Файл сценария — JSON-список правил, проверяемых по порядку (regex по system+user промпту):
+    [{"pattern": "Return JSON list", "response": "[\\"src/main.py\\"]"},
+     {"pattern": "factorial", "response": "File: `math_lib.py`\\n```python\\n...\\n```"}]
+"""
+import re
+import json
+import math
+import time
+import uuid
+import random
+import argparse
+import threading
+from typing import Callable, Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def parse_latency(spec: str | float, rng: random.Random) -> Callable[[], float]:
+    """
+    Распределение задержки до первого токена:
+      "0.5" — фиксированная; "uniform:a,b"; "normal:mean,stddev"; "lognormal:median,sigma".
+    """
+    if isinstance(spec, (int, float)):
+        return lambda: float(spec)
+    kind, _, params = str(spec).partition(":")
+    if not params:
+        value = float(kind)
+        return lambda: value
+    args = [float(p) for p in params.split(",")]
+    if kind == "uniform":
+        return lambda: rng.uniform(args[0], args[1])
+    if kind == "normal":
+        return lambda: max(0.0, rng.gauss(args[0], args[1]))
+    if kind == "lognormal":
+        return lambda: rng.lognormvariate(math.log(args[0]), args[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class MockLLMServer:
+    """
+    HTTP-сервер, имитирующий OpenAI и YandexGPT.
+    Время ответа = задержка (latency) + tokens_out / tokens_per_sec (0 = мгновенно).
+    error_rate / rate_limit_rate — доля запросов, завершающихся 500 / 429.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: str | float = 0.0,
+                 tokens_per_sec: float = 0.0, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 script: Optional[list[dict]] = None, seed: Optional[int] = None):
+        self._rng = random.Random(seed)
+        self._sample_latency = parse_latency(latency, self._rng)
+        self.tokens_per_sec = tokens_per_sec
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.script = [(re.compile(rule["pattern"], re.IGNORECASE | re.DOTALL), rule["response"])
+                       for rule in (script or [])]
+        self.operations: dict[str, tuple[float, dict]] = {}
+        self.stats = {"requests": 0, "completed": 0, "errors": 0, "rate_limited": 0, "polls": 0}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread: threading.Thread | None = None
+
+    @property
+    def requests_count(self) -> int:
+        return self.stats["requests"]
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def serve_forever(self):
+        print(f"Mock LLM server listening on {self.url}")
+        self._httpd.serve_forever()
+
+    # ------------------------------------------------------------------
+    # Генерация
+    # ------------------------------------------------------------------
+
+    def complete(self, messages: list[dict]) -> tuple[str, int, int]:
+        """
+        Возвращает (text, tokens_in, tokens_out): ответ первого подходящего правила сценария
+        или эхо последнего пользовательского сообщения.
+        """
+        texts = [m.get("text") or m.get("content") or "" for m in messages]
+        prompt = "\n".join(texts)
+        text = next((response for pattern, response in self.script if pattern.search(prompt)), None)
+        if text is None:
+            user_text = next((t for m, t in zip(reversed(messages), reversed(texts)) if m.get("role") == "user"), "")
+            text = f"Mock response to: {user_text.strip()[:80]}"
+        return text, self._count_tokens(prompt), self._count_tokens(text)
+
+    @staticmethod
+    def _count_tokens(text: str) -> int:
+        return max(1, len(text) // 4) if text else 0
+
+    def _chunks(self, text: str) -> list[str]:
+        # Отдаем ответ кусками примерно по токену
+        return re.findall(r"\S*\s*", text)[:-1] or [text]
+
+    def _generation_time(self, tokens_out: int) -> float:
+        return tokens_out / self.tokens_per_sec if self.tokens_per_sec > 0 else 0.0
+
+    def _latency(self) -> float:
+        with self._lock:
+            return self._sample_latency()
+
+    def _inject_failure(self) -> Optional[int]:
+        with self._lock:
+            self.stats["requests"] += 1
+            roll = self._rng.random()
+            if roll < self.rate_limit_rate:
+                self.stats["rate_limited"] += 1
+                return 429
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.stats["errors"] += 1
+                return 500
+        return None
+
+    def _count_completed(self):
+        with self._lock:
+            self.stats["completed"] += 1
+
+    # ------------------------------------------------------------------
+    # Протоколы
+    # ------------------------------------------------------------------
+
+    def _yandex_result(self, text: str, tokens_in: int, tokens_out: int, final: bool = True) -> dict:
+        status = "ALTERNATIVE_STATUS_FINAL" if final else "ALTERNATIVE_STATUS_PARTIAL"
+        return {
+            "alternatives": [{"message": {"role": "assistant", "text": text}, "status": status}],
+            "usage": {"inputTextTokens": str(tokens_in), "completionTokens": str(tokens_out),
+                      "totalTokens": str(tokens_in + tokens_out)},
+            "modelVersion": "mock",
+        }
+
+    def _openai_completion(self, model: str, text: str, tokens_in: int, tokens_out: int) -> dict:
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": tokens_in, "completion_tokens": tokens_out,
+                      "total_tokens": tokens_in + tokens_out},
+        }
+
+    def _openai_chunk(self, chunk_id: str, model: str, delta: dict, finish_reason=None, usage=None) -> dict:
+        return {
+            "id": chunk_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            "usage": usage,
+        }
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, payload: dict, headers: Optional[dict] = None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _start_stream(self, content_type: str):
+                # Без Content-Length: клиент читает до закрытия соединения
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+
+            def _stream_pieces(self, text: str):
+                """
+                Выдает накопленный текст по кускам в темпе tokens_per_sec.
+                """
+                delay = 1.0 / server.tokens_per_sec if server.tokens_per_sec > 0 else 0.0
+                for piece in server._chunks(text):
+                    if delay:
+                        time.sleep(delay)
+                    yield piece
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+
+                failure = server._inject_failure()
+                if failure == 429:
+                    return self._send(429, {"error": {"message": "Rate limit exceeded (injected)"}}, {"Retry-After": "1"})
+                if failure == 500:
+                    return self._send(500, {"error": {"message": "Internal error (injected)"}})
+
+                if self.path.endswith("/chat/completions"):
+                    return self._openai(body)
+                if self.path.endswith("/completion"):
+                    return self._yandex(body)
+                if self.path.endswith("/completionAsync"):
+                    return self._yandex_async(body)
+                self._send(404, {"error": f"Unknown path {self.path}"})
+
+            def do_GET(self):
+                if self.path.startswith("/operations/"):
+                    operation_id = self.path.rsplit("/", 1)[-1]
+                    with server._lock:
+                        server.stats["polls"] += 1
+                        operation = server.operations.get(operation_id)
+                    if not operation:
+                        return self._send(404, {"error": "Operation not found"})
+                    ready_at, response = operation
+                    if time.monotonic() < ready_at:
+                        return self._send(200, {"id": operation_id, "done": False})
+                    return self._send(200, {"id": operation_id, "done": True, "response": response})
+                if self.path == "/stats":
+                    with server._lock:
+                        return self._send(200, dict(server.stats))
+                self._send(404, {"error": f"Unknown path {self.path}"})
+
+            def _openai(self, body: dict):
+                model = body.get("model", "mock")
+                text, tokens_in, tokens_out = server.complete(body.get("messages", []))
+                time.sleep(server._latency())
+
+                if not body.get("stream"):
+                    time.sleep(server._generation_time(tokens_out))
+                    server._count_completed()
+                    return self._send(200, server._openai_completion(model, text, tokens_in, tokens_out))
+
+                chunk_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+                self._start_stream("text/event-stream")
+                events = [server._openai_chunk(chunk_id, model, {"role": "assistant", "content": ""})]
+                self._write_sse(events)
+                for piece in self._stream_pieces(text):
+                    self._write_sse([server._openai_chunk(chunk_id, model, {"content": piece})])
+                events = [server._openai_chunk(chunk_id, model, {}, finish_reason="stop")]
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    usage = {"prompt_tokens": tokens_in, "completion_tokens": tokens_out,
+                             "total_tokens": tokens_in + tokens_out}
+                    events.append(server._openai_chunk(chunk_id, model, {}, usage=usage))
+                self._write_sse(events)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                server._count_completed()
+
+            def _write_sse(self, events: list[dict]):
+                for event in events:
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            def _yandex(self, body: dict):
+                text, tokens_in, tokens_out = server.complete(body.get("messages", []))
+                time.sleep(server._latency())
+
+                if not (body.get("completionOptions") or {}).get("stream"):
+                    time.sleep(server._generation_time(tokens_out))
+                    server._count_completed()
+                    return self._send(200, {"result": server._yandex_result(text, tokens_in, tokens_out)})
+
+                self._start_stream("application/json")
+                accumulated = ""
+                for piece in self._stream_pieces(text):
+                    accumulated += piece
+                    partial = server._yandex_result(accumulated, tokens_in, server._count_tokens(accumulated), False)
+                    self.wfile.write((json.dumps({"result": partial}) + "\n").encode("utf-8"))
+                    self.wfile.flush()
+                final = server._yandex_result(text, tokens_in, tokens_out)
+                self.wfile.write((json.dumps({"result": final}) + "\n").encode("utf-8"))
+                self.wfile.flush()
+                server._count_completed()
+
+            def _yandex_async(self, body: dict):
+                text, tokens_in, tokens_out = server.complete(body.get("messages", []))
+                operation_id = uuid.uuid4().hex
+                ready_at = time.monotonic() + server._latency() + server._generation_time(tokens_out)
+                with server._lock:
+                    server.operations[operation_id] = (ready_at, server._yandex_result(text, tokens_in, tokens_out))
+                    server.stats["completed"] += 1
+                self._send(200, {"id": operation_id, "done": False, "description": "Async GPT Completion"})
+
+        return Handler
+
+
+def load_script(path: str) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        rules = json.load(f)
+    if not isinstance(rules, list):
+        raise ValueError("Script must be a JSON list of {pattern, response} rules")
+    return rules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI / YandexGPT server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", default="1.0",
+                        help="Задержка до первого токена: 0.5 | uniform:a,b | normal:mean,sd | lognormal:median,sigma")
+    parser.add_argument("--tps", type=float, default=0.0, help="Скорость генерации, токенов/сек (0 = мгновенно)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Доля ответов 429")
+    parser.add_argument("--script", help="JSON-файл со сценарием ответов")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    MockLLMServer(args.host, args.port, args.latency, args.tps, args.error_rate, args.rate_limit_rate,
+                  load_script(args.script) if args.script else None, args.seed).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import time
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
+from src.core.config import Config
+
+
+class OperationTimeout(Exception):
+    """
+    Асинхронная операция не завершилась за отведенное время.
+    """
+    pass
+
+
+class _Pending:
+    def __init__(self, operation_id: str, future: Future, deadline: float, headers: Optional[dict] = None):
+        self.operation_id = operation_id
+        self.future = future
+        self.deadline = deadline
+        self.headers = headers
+        self.interval = Config.YC_POLL_MIN_INTERVAL
+        self.polls = 0
+
+
+class OperationPoller:
+    """
+    Опрашивает долгие операции (YandexGPT completionAsync) из одного фонового потока.
+    Каждой операции соответствует Future; интервал опроса растет экспоненциально
+    (от YC_POLL_MIN_INTERVAL до YC_POLL_MAX_INTERVAL), поэтому десятки ожидающих
+    генераций не занимают по потоку и не заваливают API запросами.
+
+    fetch(operation_id, headers) -> dict: возвращает JSON операции ({"done": bool, "response"/"error": ...});
+    headers — заголовки авторизации, переданные вместе с операцией в submit.
+    """
+    BACKOFF = 1.5
+
+    def __init__(self, fetch: Callable[[str, Optional[dict]], dict]):
+        self.fetch = fetch
+        self._queue: list[tuple[float, int, _Pending]] = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, operation_id: str, timeout: Optional[float] = None, headers: Optional[dict] = None) -> Future:
+        """
+        Ставит операцию на опрос. Future получает тело "response" или исключение.
+        """
+        future: Future = Future()
+        deadline = time.monotonic() + (timeout or Config.YC_ASYNC_TIMEOUT)
+        pending = _Pending(operation_id, future, deadline, headers)
+        with self._cond:
+            self._push(time.monotonic() + pending.interval, pending)
+            self._ensure_thread()
+            self._cond.notify()
+        return future
+
+    @property
+    def pending_count(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+    def _push(self, at: float, pending: _Pending):
+        heapq.heappush(self._queue, (at, next(self._counter), pending))
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="llm-operation-poller", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                at, _, pending = self._queue[0]
+                delay = at - time.monotonic()
+                if delay > 0:
+                    # Просыпаемся раньше, если пришла новая операция с более ранним сроком
+                    self._cond.wait(timeout=delay)
+                    continue
+                heapq.heappop(self._queue)
+            self._poll(pending)
+
+    def _poll(self, pending: _Pending):
+        pending.polls += 1
+        try:
+            operation = self.fetch(pending.operation_id, pending.headers)
+        except Exception as e:
+            # Сетевые ошибки опроса не фатальны: повторим на следующем интервале
+            print(f"Operation {pending.operation_id}: poll error {e}")
+            operation = {"done": False}
+
+        if operation.get("done"):
+            if "error" in operation:
+                error = operation["error"]
+                pending.future.set_exception(RuntimeError(f"Operation {pending.operation_id} failed: {error}"))
+            else:
+                pending.future.set_result(operation.get("response", {}))
+            return
+
+        now = time.monotonic()
+        if now >= pending.deadline:
+            pending.future.set_exception(OperationTimeout(f"Operation {pending.operation_id} timed out"))
+            return
+        pending.interval = min(pending.interval * self.BACKOFF, Config.YC_POLL_MAX_INTERVAL)
+        with self._cond:
+            self._push(min(now + pending.interval, pending.deadline), pending)
@@ -0,0 +1,220 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Optional
+from src.core.config import Config
+
+# Сколько предыдущих итераций показывать в промпте исправлений
+SUMMARY_ITERATIONS = 5
+# Сколько замечаний и символов на замечание сохранять в сводке итерации
+SUMMARY_COMMENTS = 5
+SUMMARY_COMMENT_CHARS = 160
+# "Closes #12" / "Fixes #12" в описании PR — связанная задача
+LINKED_ISSUE_RE = re.compile(r"\b(?:close[sd]?|fix(?:e[sd])?|resolve[sd]?)\s+#(\d+)", re.IGNORECASE)
+
+_lock = threading.Lock()
+
+
+def summarize_comment(comment: dict) -> str:
+    """
+    Первая содержательная строка замечания (без вердикта ревьюера) с путем файла.
+    """
+    lines = [l.strip() for l in comment["body"].splitlines() if l.strip() and not l.strip().startswith("[")]
+    text = lines[0] if lines else comment["body"].strip()
+    where = f"{comment['path']}: " if comment.get("path") else ""
+    return f"{where}{text[:SUMMARY_COMMENT_CHARS]}"
+
+
+@dataclass
+class PRState:
+    """
+    Состояние цикла исправлений Pull Request, переносимое между запусками агента:
+    какие файлы затронуты PR, какие комментарии уже обработаны и что делалось на прошлых итерациях.
+
+    Webhook-сервер дополняет запись по событиям GitHub (head SHA, связанная задача, новые комментарии),
+    поэтому проверка лимита итераций и поиск новых замечаний не требуют полного обхода комментариев через API.
+    comments_synced означает, что в comments есть вся история комментариев PR; агент сверяет это
+    с числом комментариев в API перед каждой итерацией.
+    """
+    pr_url: str
+    issue_url: str = ""
+    head_sha: str = ""
+    last_reviewed_sha: str = ""
+    last_fixed_sha: str = ""
+    comments: list[dict] = field(default_factory=list)
+    comments_synced: bool = False
+    touched_files: list[str] = field(default_factory=list)
+    processed_comment_ids: list[str] = field(default_factory=list)
+    iterations: list[dict] = field(default_factory=list)
+
+    @property
+    def request_changes_count(self) -> int:
+        return sum(c["body"].count("[REQUEST_CHANGES]") for c in self.comments)
+
+    @property
+    def iteration_count(self) -> int:
+        return len(self.iterations)
+
+    def upsert_comment(self, comment: dict):
+        for i, existing in enumerate(self.comments):
+            if existing["id"] == comment["id"]:
+                self.comments[i] = comment
+                return
+        self.comments.append(comment)
+
+    def sync_comments(self, comments: list[dict]):
+        """
+        Полный список комментариев из API (разовая синхронизация, если webhooks пропущены).
+        Заменяет сохраненные комментарии: удаленные в PR, о которых не пришел webhook, тоже уходят.
+        Дальше история считается полной, только если PR отслеживается webhook-сервером (head_sha
+        приходит лишь из событий GitHub); без него каждый запуск перечитывает комментарии через API.
+        Пропущенный webhook обнаруживается по расхождению числа комментариев с API.
+        """
+        self.comments = []
+        for comment in comments:
+            self.upsert_comment(comment)
+        self.comments_synced = bool(self.head_sha)
+
+    def new_comments(self, comments: list[dict]) -> list[dict]:
+        processed = set(self.processed_comment_ids)
+        return [c for c in comments if c["id"] not in processed]
+
+    def record_iteration(self, comments: list[dict], files: list[str], state_fp: str = "",
+                         review_fp: Optional[list[str]] = None):
+        """
+        Запоминает итерацию: сжатую сводку замечаний, на которые она отвечала, и измененные файлы.
+        state_fp / review_fp — отпечатки кода после правок и замечаний ревьюера для проверки сходимости цикла.
+        """
+        addressed = [summarize_comment(c) for c in comments[:SUMMARY_COMMENTS]]
+        self.iterations.append({"ts": time.time(), "comments": addressed, "files": files,
+                                "state_fp": state_fp, "review_fp": review_fp or []})
+        self.processed_comment_ids.extend(c["id"] for c in comments if c["id"] not in self.processed_comment_ids)
+        self.touched_files.extend(f for f in files if f not in self.touched_files)
+
+    def summary(self) -> str:
+        lines = []
+        start = max(len(self.iterations) - SUMMARY_ITERATIONS, 0)
+        for number, iteration in enumerate(self.iterations[start:], start + 1):
+            lines.append(f"Итерация {number}: изменены {', '.join(iteration['files']) or '—'}")
+            lines += [f"  - {c}" for c in iteration["comments"]]
+        return "\n".join(lines)
+
+
+@contextmanager
+def _connect():
+    os.makedirs(Config.AGENT_CACHE_DIR, exist_ok=True)
+    with _lock:
+        conn = sqlite3.connect(os.path.join(Config.AGENT_CACHE_DIR, "agent_state.db"), timeout=10)
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pr_state (
+                    pr_url TEXT PRIMARY KEY,
+                    data TEXT,
+                    updated_at REAL
+                )
+            """)
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def _read(conn: sqlite3.Connection, pr_url: str) -> PRState:
+    row = conn.execute("SELECT data FROM pr_state WHERE pr_url = ?", (pr_url,)).fetchone()
+    if not row:
+        return PRState(pr_url)
+    data = json.loads(row[0])
+    return PRState(**{k: v for k, v in data.items() if k in PRState.__dataclass_fields__})
+
+
+def _write(conn: sqlite3.Connection, state: PRState):
+    conn.execute(
+        "INSERT OR REPLACE INTO pr_state (pr_url, data, updated_at) VALUES (?, ?, ?)",
+        (state.pr_url, json.dumps(asdict(state), ensure_ascii=False), time.time()),
+    )
+
+
+def load_pr_state(pr_url: str) -> PRState:
+    """
+    Состояние PR из локального хранилища (AGENT_CACHE_DIR/agent_state.db); новое, если записи нет.
+    """
+    try:
+        with _connect() as conn:
+            return _read(conn, pr_url)
+    except sqlite3.Error as e:
+        print(f"PR state load error: {e}")
+        return PRState(pr_url)
+
+
+def save_pr_state(state: PRState):
+    try:
+        with _connect() as conn:
+            _write(conn, state)
+    except sqlite3.Error as e:
+        print(f"PR state save error: {e}")
+
+
+def update_pr_state(pr_url: str, change: Callable[[PRState], None]) -> Optional[PRState]:
+    """
+    Атомарно читает, изменяет и сохраняет запись (webhook-сервер и агент пишут в одно хранилище).
+    """
+    try:
+        with _connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            state = _read(conn, pr_url)
+            change(state)
+            _write(conn, state)
+            return state
+    except sqlite3.Error as e:
+        print(f"PR state update error: {e}")
+        return None
+
+
+def apply_webhook(event_type: str, payload: dict) -> Optional[PRState]:
+    """
+    Обновляет состояние PR по событию GitHub. Возвращает обновленную запись или None, если событие не о PR.
+    """
+    action = payload.get("action")
+    repo_name = payload.get("repository", {}).get("full_name", "")
+
+    if event_type == "pull_request":
+        pr = payload.get("pull_request", {})
+
+        def change(state: PRState):
+            state.head_sha = pr.get("head", {}).get("sha") or state.head_sha
+            linked = LINKED_ISSUE_RE.search(pr.get("body") or "")
+            if linked and repo_name:
+                state.issue_url = f"https://github.com/{repo_name}/issues/{linked.group(1)}"
+            if action == "opened":
+                # PR только что создан: вся история комментариев будет приходить через webhooks
+                state.comments_synced = True
+        return update_pr_state(pr["html_url"], change) if pr.get("html_url") else None
+
+    if event_type == "issue_comment" and "pull_request" in payload.get("issue", {}):
+        pr_url = payload["issue"]["pull_request"].get("html_url") or payload["issue"].get("html_url")
+        comment = payload.get("comment", {})
+        entry = {"id": f"issue:{comment.get('id')}", "kind": "general",
+                 "author": comment.get("user", {}).get("login"), "path": None, "line": None,
+                 "body": comment.get("body") or ""}
+    elif event_type == "pull_request_review_comment":
+        pr_url = payload.get("pull_request", {}).get("html_url")
+        comment = payload.get("comment", {})
+        entry = {"id": f"review:{comment.get('id')}", "kind": "review",
+                 "author": comment.get("user", {}).get("login"), "path": comment.get("path"),
+                 "line": comment.get("position"), "body": comment.get("body") or ""}
+    else:
+        return None
+    if not pr_url:
+        return None
+
+    def change(state: PRState):
+        if action == "deleted":
+            state.comments = [c for c in state.comments if c["id"] != entry["id"]]
+        else:
+            state.upsert_comment(entry)
+    return update_pr_state(pr_url, change)
@@ -0,0 +1,226 @@
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Optional
+from src.core.config import Config
+
+# Размер контекстного окна по префиксу имени модели (в токенах)
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4.1": 1_000_000,
+    "gpt-4o": 128_000,
+    "gpt-4-turbo": 128_000,
+    "gpt-3.5": 16_000,
+    "yandexgpt": 32_000,
+    "llama": 8_000,
+}
+DEFAULT_CONTEXT_WINDOW = 32_000
+
+# Заголовок блока файла в контексте и в diff: "File: `path`" / "File: path"
+FILE_BLOCK_RE = re.compile(r"^File: `?([^`\n]+)`?", re.MULTILINE)
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Считает токены текста для модели. Использует tiktoken, если он установлен,
+    иначе консервативную оценку по размеру в байтах (≈3.5 байта на токен).
+    """
+    if not text:
+        return 0
+    if model and not model.startswith("gpt://"):
+        encoding = _get_encoding(model)
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+    return int(len(text.encode("utf-8")) / 3.5) + 1
+
+
+def get_context_window(model: Optional[str]) -> int:
+    """
+    Размер контекстного окна модели. Config.LLM_CONTEXT_TOKENS имеет приоритет над таблицей.
+    """
+    if Config.LLM_CONTEXT_TOKENS:
+        return Config.LLM_CONTEXT_TOKENS
+    name = (model or "").split("/")[-2] if (model or "").startswith("gpt://") else (model or "")
+    for prefix, size in sorted(MODEL_CONTEXT_WINDOWS.items(), key=lambda kv: -len(kv[0])):
+        if name.startswith(prefix):
+            return size
+    return DEFAULT_CONTEXT_WINDOW
+
+
+@dataclass
+class PromptSection:
+    """
+    Часть промпта. priority: чем выше, тем позже секция урезается.
+    strategy:
+      "tail"   — сохраняется начало, обрезается конец;
+      "head"   — сохраняется конец (свежие комментарии), обрезается начало;
+      "blocks" — секция из блоков "File: ...", блоки отбрасываются целиком с конца,
+                 вместо них остается список пропущенных файлов.
+    """
+    name: str
+    text: str
+    priority: int
+    strategy: str = "tail"
+    min_tokens: int = 0
+
+
+@dataclass
+class SectionReport:
+    name: str
+    tokens: int
+    kept_tokens: int
+    dropped: list[str] = field(default_factory=list)
+
+    @property
+    def truncated(self) -> bool:
+        return self.kept_tokens < self.tokens
+
+
+class PromptBuilder:
+    """
+    Собирает промпт по шаблону с плейсхолдерами {name}, распределяя бюджет токенов
+    между секциями по приоритету. Урезание детерминировано: одинаковые входные данные
+    всегда дают одинаковый промпт. Что было урезано — в self.report.
+    """
+    SAFETY_MARGIN = 0.05
+
+    def __init__(self, template: str, budget_tokens: int, model: Optional[str] = None):
+        self.template = template
+        self.budget_tokens = budget_tokens
+        self.model = model
+        self.sections: list[PromptSection] = []
+        self.report: list[SectionReport] = []
+
+    @classmethod
+    def for_llm(cls, llm, template: str, system_prompt: str = "") -> "PromptBuilder":
+        """
+        Бюджет = контекстное окно модели - max_tokens ответа - системный промпт - запас.
+        """
+        model = getattr(llm, "model", None)
+        model = model if isinstance(model, str) else None
+        max_tokens = getattr(llm, "max_tokens", None)
+        max_tokens = max_tokens if isinstance(max_tokens, int) else Config.LLM_MAX_TOKENS
+        window = get_context_window(model)
+        budget = int(window * (1 - cls.SAFETY_MARGIN)) - max_tokens - count_tokens(system_prompt, model)
+        return cls(template, max(budget, 0), model)
+
+    def add(self, name: str, text: str, priority: int, strategy: str = "tail", min_tokens: int = 0) -> "PromptBuilder":
+        self.sections.append(PromptSection(name, text or "", priority, strategy, min_tokens))
+        return self
+
+    def replace(self, name: str, text: str) -> "PromptBuilder":
+        """
+        Заменяет текст секции name (приоритет и стратегия сохраняются). KeyError, если секции нет.
+        """
+        for section in self.sections:
+            if section.name == name:
+                section.text = text or ""
+                return self
+        raise KeyError(name)
+
+    def build(self) -> str:
+        """
+        Возвращает промпт, который укладывается в бюджет.
+        """
+        overhead = count_tokens(self.template.format_map({s.name: "" for s in self.sections}), self.model)
+        available = max(self.budget_tokens - overhead, 0)
+        sizes = {s.name: count_tokens(s.text, self.model) for s in self.sections}
+
+        # 1. Минимальные доли, затем остаток — по убыванию приоритета
+        order = sorted(self.sections, key=lambda s: -s.priority)
+        allocation = {}
+        for section in order:
+            allocation[section.name] = min(sizes[section.name], section.min_tokens, available)
+            available -= allocation[section.name]
+        for section in order:
+            extra = min(sizes[section.name] - allocation[section.name], available)
+            allocation[section.name] += extra
+            available -= extra
+
+        # 2. Урезание секций, не поместившихся целиком
+        rendered = {}
+        self.report = []
+        for section in self.sections:
+            size, limit = sizes[section.name], allocation[section.name]
+            if size <= limit:
+                rendered[section.name] = section.text
+                self.report.append(SectionReport(section.name, size, size))
+                continue
+            text, dropped = self._truncate(section, limit)
+            rendered[section.name] = text
+            self.report.append(SectionReport(section.name, size, count_tokens(text, self.model), dropped))
+
+        return self.template.format_map(rendered)
+
+    def summary(self) -> str:
+        """
+        Краткое описание урезанных секций для логов ("" если все поместилось).
+        """
+        parts = []
+        for r in self.report:
+            if not r.truncated:
+                continue
+            part = f"{r.name}: {r.kept_tokens}/{r.tokens} tokens"
+            if r.dropped:
+                part += f", dropped {len(r.dropped)} files"
+            parts.append(part)
+        return "; ".join(parts)
+
+    def _truncate(self, section: PromptSection, limit: int) -> tuple[str, list[str]]:
+        if section.strategy == "blocks":
+            return self._truncate_blocks(section.text, limit)
+        marker = f"\n... [{section.name}: truncated to fit the token budget] ...\n"
+        limit = max(limit - count_tokens(marker, self.model), 0)
+        lines = section.text.splitlines(keepends=True)
+        if section.strategy == "head":
+            kept = self._fit_lines(lines[::-1], limit)[::-1]
+            return marker + "".join(kept), []
+        return "".join(self._fit_lines(lines, limit)) + marker, []
+
+    def _truncate_blocks(self, text: str, limit: int) -> tuple[str, list[str]]:
+        starts = [m.start() for m in FILE_BLOCK_RE.finditer(text)]
+        if not starts:
+            return self._truncate(PromptSection("text", text, 0), limit)[0], []
+        preamble = text[:starts[0]]
+        blocks = [text[a:b] for a, b in zip(starts, starts[1:] + [len(text)])]
+
+        kept, dropped = [preamble], []
+        used = count_tokens(preamble, self.model)
+        for block in blocks:
+            path = FILE_BLOCK_RE.match(block).group(1).strip()
+            tokens = count_tokens(block, self.model)
+            # Резервируем место под строку об отброшенном файле
+            reserve = count_tokens(f"- {path} (~{tokens} tokens)\n", self.model) * (len(dropped) + 1) + 20
+            if not dropped and used + tokens + reserve <= limit:
+                kept.append(block)
+                used += tokens
+            else:
+                dropped.append(f"{path} (~{tokens} tokens)")
+
+        if dropped:
+            kept.append("\n[Omitted to fit the token budget]:\n" + "".join(f"- {d}\n" for d in dropped))
+        return "".join(kept), [d.split(" (~")[0] for d in dropped]
+
+    def _fit_lines(self, lines: list[str], limit: int) -> list[str]:
+        """
+        Максимальный префикс строк, укладывающийся в limit токенов (бинарный поиск).
+        """
+        lo, hi = 0, len(lines)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if count_tokens("".join(lines[:mid]), self.model) <= limit:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lines[:lo]
@@ -0,0 +1,59 @@
+import time
+import threading
+from contextlib import contextmanager
+from src.core.config import Config
+
+
+class RateLimiter:
+    """
+    Ограничивает обращения к провайдеру LLM: не более max_concurrency запросов одновременно
+    и не чаще rpm запросов в минуту (равномерно, без всплесков).
+    Один экземпляр на провайдера разделяется всеми агентами и батчами процесса.
+    """
+    def __init__(self, rpm: int = 0, max_concurrency: int = 4):
+        self.interval = 60.0 / rpm if rpm > 0 else 0.0
+        self.max_concurrency = max(max_concurrency, 1)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+
+    @contextmanager
+    def slot(self):
+        """
+        Занимает слот на время запроса. Блокирует, пока квота не позволит начать.
+        """
+        self._slots.acquire()
+        try:
+            self._wait_turn()
+            yield
+        finally:
+            self._slots.release()
+
+    def penalize(self, delay: float):
+        """
+        Сдвигает ближайший разрешенный запуск (ответ 429 / Retry-After от провайдера).
+        """
+        with self._lock:
+            self._next_at = max(self._next_at, time.monotonic() + delay)
+
+    def _wait_turn(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_at)
+            self._next_at = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+_limiters: dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str) -> RateLimiter:
+    """
+    Возвращает общий для процесса лимитер провайдера (настройки из Config.LLM_RPM / LLM_MAX_CONCURRENCY).
+    """
+    with _limiters_lock:
+        if provider not in _limiters:
+            _limiters[provider] = RateLimiter(Config.LLM_RPM, Config.LLM_MAX_CONCURRENCY)
+        return _limiters[provider]
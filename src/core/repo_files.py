@@ -0,0 +1,136 @@
+import os
+import re
+import fnmatch
+import hashlib
+import subprocess
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from src.core.config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка между процессами недоступна
+    fcntl = None
+
+EXCLUDE_DIRS = {'.git', '.venv', '__pycache__', 'venv', 'env', 'node_modules', 'dist', 'build'}
+
+
+def _git(root: str, *args: str) -> Optional[str]:
+    try:
+        result = subprocess.run(["git", *args], cwd=root, capture_output=True, text=True, check=True)
+        return result.stdout
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+
+def _stat_signature(path: str) -> str:
+    st = os.stat(path)
+    return f"stat:{int(st.st_mtime_ns)}:{st.st_size}"
+
+
+def list_repo_files(root: str = ".") -> dict[str, str]:
+    """
+    Returns {relative_path: signature} for the repository files.
+    Inside a git work tree the signature is the blob SHA from `git ls-files -s`
+    (stable across fresh clones); modified and untracked files fall back to mtime+size.
+    Outside git, the tree is walked with the default excluded directories.
+    """
+    staged = _git(root, "ls-files", "-s", "-z")
+    if staged is None:
+        return _walk_files(root)
+
+    files: dict[str, str] = {}
+    for entry in staged.split("\0"):
+        if not entry:
+            continue
+        meta, _, path = entry.partition("\t")
+        mode, sha = meta.split()[:2]
+        if mode == "160000":  # submodule
+            continue
+        files[path] = sha
+
+    modified = _git(root, "ls-files", "-m", "-z") or ""
+    untracked = _git(root, "ls-files", "-o", "--exclude-standard", "-z") or ""
+    for path in (modified + untracked).split("\0"):
+        if path and os.path.isfile(os.path.join(root, path)):
+            files[path] = _stat_signature(os.path.join(root, path))
+
+    # Удаленные из рабочей копии, но еще не из индекса
+    return {p: sig for p, sig in files.items() if os.path.isfile(os.path.join(root, p))}
+
+
+def matches_any(path: str, patterns: list[str]) -> bool:
+    """
+    Glob match against the whole relative path; a pattern also matches below any directory
+    (`node_modules/*` excludes `web/node_modules/x.js`).
+    """
+    return any(fnmatch.fnmatch(path, p) or fnmatch.fnmatch(path, f"*/{p}") for p in patterns)
+
+
+def source_files(root: str = ".") -> dict[str, str]:
+    """
+    `list_repo_files` (tracked files plus untracked ones not ignored by .gitignore) narrowed to the source tree:
+    REPO_INCLUDE_GLOBS (if set) and minus REPO_EXCLUDE_GLOBS (vendored code, build outputs, generated files).
+    Binary and oversized files are filtered later by content, see `is_binary` / REPO_MAX_FILE_BYTES.
+    """
+    include, exclude = Config.REPO_INCLUDE_GLOBS, Config.REPO_EXCLUDE_GLOBS
+    return {path: sig for path, sig in list_repo_files(root).items()
+            if (not include or matches_any(path, include)) and not matches_any(path, exclude)}
+
+
+def is_binary(path: str, sniff_bytes: int = 8192) -> bool:
+    """
+    Binary sniffing on the first bytes of the file (a NUL byte), as git does.
+    """
+    try:
+        with open(path, "rb") as f:
+            return b"\0" in f.read(sniff_bytes)
+    except OSError:
+        return True
+
+
+def _walk_files(root: str) -> dict[str, str]:
+    files = {}
+    for dirpath, dirs, names in os.walk(root):
+        dirs[:] = [d for d in dirs if d not in EXCLUDE_DIRS]
+        for name in names:
+            path = os.path.join(dirpath, name)
+            files[os.path.relpath(path, root)] = _stat_signature(path)
+    return files
+
+
+def repo_cache_dir(root: str = ".", *parts: str) -> str:
+    """
+    Persistent per-repository cache directory under Config.AGENT_CACHE_DIR.
+    Keyed by the origin remote (so fresh clones of the same repo share it), else by absolute path.
+    """
+    remote = (_git(root, "config", "--get", "remote.origin.url") or "").strip()
+    # Токен в URL не должен попадать в ключ; клоны с токеном и без него должны совпадать
+    remote = re.sub(r"^[a-z+]+://", "", remote)
+    if "@" in remote:
+        remote = remote.split("@", 1)[1]
+    path = os.path.join(Config.AGENT_CACHE_DIR, _cache_key(remote or os.path.abspath(root)), *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _cache_key(key_source: str) -> str:
+    name = os.path.basename(key_source.rstrip("/")).removesuffix(".git") or "repo"
+    return f"{name}-{hashlib.sha1(key_source.encode('utf-8')).hexdigest()[:10]}"
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Exclusive advisory lock on `path` (created if missing), held across processes sharing a cache directory.
+    A no-op where fcntl is unavailable.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,239 @@
+import os
+import re
+import threading
+from typing import Optional
+from src.core.prompt_builder import count_tokens
+from src.core.repo_scanner import RepoMapCache, get_repo_map
+from src.core.impact_analysis import ImportGraph, get_import_graph
+from src.core.retrieval import MENTION_RE, tokenize, _normalize
+
+DAMPING = 0.85
+MAX_ITERATIONS = 50
+TOLERANCE = 1e-6
+# Имя, определенное в большем числе файлов, слишком общее (run, get, main) и связей не дает
+MAX_DEFINERS = 5
+IMPORT_WEIGHT = 1.0
+# Веса персонализации PageRank: файл упомянут в задаче, в задаче названо имя символа файла,
+# терм задачи есть в пути файла, файл среди кандидатов локального индекса
+MENTION_WEIGHT = 10.0
+SYMBOL_WEIGHT = 2.0
+PATH_TERM_WEIGHT = 1.0
+CANDIDATE_WEIGHT = 3.0
+# Во сколько раз строка символа, названного в задаче, важнее остальных строк того же файла
+SYMBOL_BOOST = 3.0
+DEFINITION_RE = re.compile(r"^\s*(?:class|def|function|const|func|type)\s+(\w+)")
+
+
+def defined_names(structure: str) -> list[str]:
+    """
+    Имена символов, определенных в файле, по строкам его структуры в карте.
+    """
+    return [m.group(1) for m in map(DEFINITION_RE.match, structure.splitlines()) if m]
+
+
+def pagerank(edges: dict[str, dict[str, float]], personalization: dict[str, float]) -> dict[str, float]:
+    """
+    Персонализированный PageRank степенным методом по взвешенным ребрам src -> {dst: вес}.
+    Телепортация и ранг висячих вершин (без исходящих ребер) распределяются по personalization,
+    поэтому ранг получают только файлы, достижимые из затравки.
+    """
+    total = sum(w for w in personalization.values() if w > 0)
+    teleport = {n: w / total for n, w in personalization.items() if w > 0} if total else {}
+    if not teleport:
+        return {}
+    out = {src: (sum(targets.values()), targets) for src, targets in edges.items() if targets}
+    rank = dict(teleport)
+    for _ in range(MAX_ITERATIONS):
+        dangling = 1.0 - sum(r for n, r in rank.items() if n in out)
+        following = {n: (1 - DAMPING + DAMPING * dangling) * w for n, w in teleport.items()}
+        for src, r in rank.items():
+            if src not in out:
+                continue
+            weight, targets = out[src]
+            share = DAMPING * r / weight
+            for dst, w in targets.items():
+                following[dst] = following.get(dst, 0.0) + share * w
+        delta = sum(abs(following.get(n, 0.0) - rank.get(n, 0.0)) for n in following.keys() | rank.keys())
+        rank = following
+        if delta < TOLERANCE:
+            break
+    return rank
+
+
+class RepoGraph:
+    """
+    Граф ссылок между файлами репозитория для ранжирования карты.
+
+    Ребра: импорты (ImportGraph) и использования идентификаторов — файл ссылается на символ,
+    определенный в другом файле (имена и ссылки берутся из кэша карты, без повторного разбора).
+    Карта для задачи строится персонализированным PageRank от упомянутых в задаче файлов, символов
+    и терминов и заполняется символами самых важных файлов, пока не исчерпан бюджет токенов.
+    """
+    def __init__(self, repo_map: RepoMapCache, imports: Optional[ImportGraph] = None):
+        self.repo_map = repo_map
+        self.imports = imports
+        self.entries: dict[str, list] = {}
+        self.edges: dict[str, dict[str, float]] = {}
+        self._symbols: dict[str, list[str]] = {}  # нормализованное имя символа -> файлы, где он определен
+        self._path_terms: dict[str, set[str]] = {}
+        self._built_for: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def build(self):
+        """
+        Перестраивает ребра, если карта изменилась. Импорты меняются только вместе с файлами,
+        а любое изменение файлов пересохраняет кэш карты, поэтому ключом служит его версия.
+        """
+        with self.repo_map._lock:
+            version = self.repo_map._loaded_mtime
+            if version == self._built_for and self.entries:
+                return
+            entries = dict(self.repo_map.entries)
+
+        definitions: dict[str, list[str]] = {}
+        for path, entry in entries.items():
+            for name in defined_names(entry[1]):
+                definitions.setdefault(name, []).append(path)
+
+        edges: dict[str, dict[str, float]] = {}
+
+        def link(src: str, dst: str, weight: float):
+            if src != dst:
+                targets = edges.setdefault(src, {})
+                targets[dst] = targets.get(dst, 0.0) + weight
+
+        for path, entry in entries.items():
+            for name in entry[3] if len(entry) > 3 else ():
+                definers = definitions.get(name)
+                if definers and len(definers) <= MAX_DEFINERS:
+                    for definer in definers:
+                        link(path, definer, 1.0 / len(definers))
+        if self.imports is not None:
+            with self.imports._lock:
+                dependents = {target: set(importers) for target, importers in self.imports._dependents.items()}
+            for target, importers in dependents.items():
+                if target in entries:
+                    for importer in importers:
+                        if importer in entries:
+                            link(importer, target, IMPORT_WEIGHT)
+
+        symbols: dict[str, list[str]] = {}
+        for name, definers in definitions.items():
+            symbols.setdefault(_normalize(name), []).extend(definers)
+        self.entries, self.edges, self._symbols = entries, edges, symbols
+        self._path_terms = {path: set(tokenize(os.path.splitext(path)[0])) for path in entries}
+        self._built_for = version
+
+    def personalization(self, issue: str, candidates: Optional[list[str]] = None) -> dict[str, float]:
+        """
+        Затравка PageRank: файлы, упомянутые в задаче, определяющие названные в ней символы,
+        с терминами задачи в пути, и кандидаты локального индекса (по убыванию их места).
+        """
+        terms = set(tokenize(issue))
+        words = {w.strip("./") for w in MENTION_RE.findall(issue)}
+        weights: dict[str, float] = {}
+
+        def add(path: str, weight: float):
+            weights[path] = weights.get(path, 0.0) + weight
+
+        for path, path_terms in self._path_terms.items():
+            name = os.path.basename(path)
+            if path in words or ("." in name and name in words):
+                add(path, MENTION_WEIGHT)
+            matched = len(terms & path_terms)
+            if matched:
+                add(path, PATH_TERM_WEIGHT * matched)
+        for term in terms:
+            for path in self._symbols.get(term, ()):
+                add(path, SYMBOL_WEIGHT)
+        for i, path in enumerate(candidates or []):
+            if path in self.entries:
+                add(path, CANDIDATE_WEIGHT / (1 + i))
+        return weights
+
+    def rank(self, issue: str, candidates: Optional[list[str]] = None) -> dict[str, float]:
+        with self._lock:
+            self.build()
+            weights = self.personalization(issue, candidates)
+            # Задача ни с чем не связана: ранжирование по общей важности файлов
+            return pagerank(self.edges, weights or {path: 1.0 for path in self.entries})
+
+    def render(self, issue: str, budget: int, candidates: Optional[list[str]] = None,
+               only: Optional[list[str]] = None, model: Optional[str] = None) -> str:
+        """
+        Карта для задачи не длиннее budget токенов: строки структуры в порядке ранга их файла
+        (символы, названные в задаче, — выше), каждая вместе с путем файла и объемлющим классом.
+        Формат тот же, что у полной карты: `path:` со структурой или путь без структуры.
+        only — показывать только эти файлы (кандидаты индекса в режиме hybrid).
+        """
+        rank = self.rank(issue, candidates)
+        terms = set(tokenize(issue))
+        allowed = set(only) if only is not None else None
+        items = []
+        structures: dict[str, list[str]] = {}
+        for path, entry in self.entries.items():
+            if allowed is not None and path not in allowed:
+                continue
+            score = rank.get(path, 0.0)
+            lines = structures[path] = entry[1].splitlines() if entry[1] else []
+            items.append((-score, path, -1))
+            for i, line in enumerate(lines):
+                match = DEFINITION_RE.match(line)
+                boost = SYMBOL_BOOST if match and _normalize(match.group(1)) in terms else 1.0
+                items.append((-score * boost, path, i))
+        items.sort()
+
+        selected: dict[str, set[int]] = {}
+        used = 0
+        for _, path, i in items:
+            lines = structures[path]
+            needed = [] if path in selected else [-1]
+            if i >= 0 and i not in selected.get(path, ()):
+                needed += [p for p in _parents(lines, i) if p not in selected.get(path, ())] + [i]
+            cost = sum(count_tokens((path if n < 0 else lines[n]) + "\n", model) for n in needed)
+            if used + cost > budget:
+                break
+            used += cost
+            selected.setdefault(path, set()).update(n for n in needed if n >= 0)
+
+        output = []
+        for path, indexes in selected.items():
+            lines = structures[path]
+            output.append("\n".join([f"{path}:"] + [lines[i] for i in sorted(indexes)]) if indexes else path)
+        return "\n".join(output)
+
+
+def _parents(lines: list[str], i: int) -> list[int]:
+    """
+    Строки объемлющих определений (класс метода): ближайшие выше строки с меньшим отступом.
+    """
+    parents = []
+    indent = len(lines[i]) - len(lines[i].lstrip())
+    for j in range(i - 1, -1, -1):
+        line_indent = len(lines[j]) - len(lines[j].lstrip())
+        if line_indent < indent:
+            parents.append(j)
+            indent = line_indent
+    return parents[::-1]
+
+
+_graphs: dict[str, RepoGraph] = {}
+_graphs_lock = threading.Lock()
+
+
+def get_repo_graph(root: str = ".") -> RepoGraph:
+    """
+    Граф ссылок репозитория, общий для процесса; при каждом вызове обновляет кэши карты и импортов.
+    """
+    repo_map = get_repo_map(root)
+    try:
+        imports = get_import_graph(root)
+    except Exception as e:
+        print(f"Import graph unavailable, ranking by identifier references only: {e}")
+        imports = None
+    key = os.path.abspath(root)
+    with _graphs_lock:
+        graph = _graphs.get(key)
+        if graph is None or graph.repo_map is not repo_map or graph.imports is not imports:
+            graph = _graphs[key] = RepoGraph(repo_map, imports)
+    return graph
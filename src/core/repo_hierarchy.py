@@ -0,0 +1,147 @@
+import os
+import json
+import hashlib
+import threading
+from collections import defaultdict
+from typing import Optional
+from src.core.config import Config
+from src.core.repo_files import repo_cache_dir, file_lock
+from src.core.repo_graph import DEFINITION_RE
+
+DIGEST_VERSION = 1
+# Сколько файлов и символов перечислять в сводке поддерева
+DIGEST_FILES = 8
+DIGEST_SYMBOLS = 15
+
+
+def partition(paths: list[str], max_files: int) -> dict[str, list[str]]:
+    """
+    Делит файлы репозитория на поддеревья не больше max_files файлов, поднимаясь как можно выше:
+    каталог, все поддерево которого помещается в лимит, — одна единица `dir/`. Больший каталог
+    раскладывается на подкаталоги, а его собственные файлы становятся единицей `dir/*`
+    (`dir/*2`, `dir/*3`... — продолжение, если их больше max_files). Корень называется `./`.
+    """
+    units: dict[str, list[str]] = {}
+
+    def split(prefix: str, files: list[str]):
+        name = prefix or "./"
+        if len(files) <= max_files:
+            units[name] = files
+            return
+        direct, children = [], defaultdict(list)
+        for path in files:
+            rest = path[len(prefix):]
+            if "/" in rest:
+                children[prefix + rest.split("/", 1)[0] + "/"].append(path)
+            else:
+                direct.append(path)
+        for i in range(0, len(direct), max_files):
+            units[f"{name}*{i // max_files + 1 if i else ''}"] = direct[i:i + max_files]
+        for child in sorted(children):
+            split(child, children[child])
+
+    split("", sorted(paths))
+    return units
+
+
+def digest(name: str, files: list[str], entries: dict[str, list]) -> str:
+    """
+    Сводка поддерева для первого этапа выбора: число файлов, самые содержательные файлы
+    (по числу определений) и публичные классы/типы, затем функции.
+    """
+    names: dict[str, list[str]] = {}
+    for path in files:
+        structure = entries[path][1] if path in entries else ""
+        names[path] = [m.group(1) for m in map(DEFINITION_RE.match, structure.splitlines()) if m]
+    base = name.split("*")[0].removeprefix("./")
+    top = sorted(files, key=lambda p: (-len(names[p]), p))[:DIGEST_FILES]
+    listed = ", ".join(p[len(base):] for p in top)
+    if len(files) > len(top):
+        listed += f", +{len(files) - len(top)} more"
+
+    symbols: dict[str, None] = {}
+    for kinds in (("class", "type"), ("def", "function", "func", "const")):
+        for path in top + [p for p in files if p not in top]:
+            structure = entries[path][1] if path in entries else ""
+            for line in structure.splitlines():
+                match = DEFINITION_RE.match(line)
+                # Только верхний уровень: методы классов в сводку не попадают
+                if match and line.startswith("  ") and not line.startswith("   ") \
+                        and line.split()[0] in kinds and not match.group(1).startswith("_"):
+                    symbols[match.group(1)] = None
+            if len(symbols) >= DIGEST_SYMBOLS:
+                break
+    summary = f"{name} ({len(files)} files): {listed}"
+    if symbols:
+        summary += " | " + ", ".join(list(symbols)[:DIGEST_SYMBOLS])
+    return summary
+
+
+class DirectoryDigests:
+    """
+    Кэш сводок поддеревьев. Сводка пересчитывается, только если изменился состав поддерева
+    или сигнатура (git blob SHA) хотя бы одного его файла.
+    """
+    def __init__(self, root: str = ".", cache_dir: Optional[str] = None):
+        self.cache_dir = cache_dir or repo_cache_dir(root, "hierarchy")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.digests: dict[str, dict] = {}  # имя поддерева -> {"key", "digest"}
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def _path(self) -> str:
+        return os.path.join(self.cache_dir, "digests.json")
+
+    def get(self, units: dict[str, list[str]], entries: dict[str, list]) -> tuple[dict[str, str], int]:
+        """
+        Сводки всех поддеревьев и сколько из них пришлось пересчитать.
+        """
+        with self._lock:
+            result, built = {}, 0
+            for name, files in units.items():
+                key = hashlib.sha1("\n".join(f"{p}\0{entries[p][0] if p in entries else ''}"
+                                             for p in files).encode("utf-8")).hexdigest()
+                cached = self.digests.get(name)
+                if cached is None or cached["key"] != key:
+                    cached = self.digests[name] = {"key": key, "digest": digest(name, files, entries)}
+                    built += 1
+                result[name] = cached["digest"]
+            stale = self.digests.keys() - units.keys()
+            for name in stale:
+                del self.digests[name]
+            if built or stale:
+                self._save()
+            return result, built
+
+    def _save(self):
+        data = {"version": DIGEST_VERSION, "digests": self.digests}
+        tmp_path = f"{self._path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with file_lock(self._path + ".lock"):
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+                os.replace(tmp_path, self._path)
+        except OSError as e:
+            print(f"Directory digests save error: {e}")
+
+    def _load(self):
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        if data.get("version") == DIGEST_VERSION:
+            self.digests = data["digests"]
+
+
+def warm_digests(root: str = ".") -> dict:
+    """
+    Обновляет сводки поддеревьев по кэшу карты (для прогрева).
+    """
+    from src.core.repo_scanner import RepoMapCache
+    cache = RepoMapCache(root)
+    cache.refresh()
+    units = partition(list(cache.entries), Config.HIERARCHY_UNIT_FILES)
+    _, built = DirectoryDigests(root).get(units, cache.entries)
+    return {"subtrees": len(units), "built": built}
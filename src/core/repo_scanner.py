@@ -64,6 +64,22 @@ class RepoScanner:
 import os
 import ast
 import re
+import gzip
+import json
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+from src.core.config import Config
+from src.core.repo_files import source_files, is_binary, repo_cache_dir, file_lock
+
+MAP_CACHE_VERSION = 3
+# Identifiers a file uses: call sites `name(` and CapitalizedNames (classes, types, components)
+REFERENCE_RE = re.compile(r"\b([A-Za-z_]\w{2,})\s*\(|\b([A-Z][a-z0-9]\w+)\b")
+MAX_REFERENCES = 300
+
 
 class RepoMapGenerator:
     """
@@ -75,67 +91,108 @@ class RepoMapGenerator:
     def generate_map(root_path: str, max_depth: int = 4) -> str:
         """
         Scans the repository and returns a string representation of the structure.
+        Per-file structure comes from the persistent map cache, so only new or changed files are parsed.
         """
-        repo_map = []
-        exclude_dirs = {'.git', '.venv', '__pycache__', 'venv', 'env', 'node_modules', 'dist', 'build'}
-        
-        for root, dirs, files in os.walk(root_path):
-            dirs[:] = [d for d in dirs if d not in exclude_dirs]
-            
-            # Check depth
-            rel_path = os.path.relpath(root, root_path)
-            if rel_path == ".":
-                depth = 0
-            else:
-                depth = rel_path.count(os.sep) + 1
-            
-            if depth > max_depth:
-                del dirs[:]
-                continue
-                
-            for file in files:
-                file_path = os.path.join(root, file)
-                rel_file_path = os.path.join(rel_path, file) if rel_path != "." else file
-                
-                # Identify Type
-                if file.endswith(".py"):
-                    structure = RepoMapGenerator._scan_python(file_path)
-                elif file.endswith((".js", ".ts", ".jsx", ".tsx")):
-                    structure = RepoMapGenerator._scan_js(file_path)
-                elif file.endswith(".go"):
-                    structure = RepoMapGenerator._scan_go(file_path)
-                else:
-                    structure = "" # Just filename
-                
-                if structure:
-                    repo_map.append(f"{rel_file_path}:\n{structure}")
-                else:
-                    repo_map.append(f"{rel_file_path}")
-                    
-        return "\n".join(repo_map)
+        return get_repo_map(root_path).render(max_depth)
+
+    @staticmethod
+    def scan_file(path: str) -> tuple[str, list[str], list[str]]:
+        """
+        Map structure of a file by its extension, imported modules for Python files and
+        the identifiers the file references (for ranking the map by the reference graph).
+        Binary and oversized (REPO_MAX_FILE_BYTES) files are not read: they are listed by name only.
+        """
+        if not path.endswith((".py", ".js", ".ts", ".jsx", ".tsx", ".go")):
+            return "", [], []  # Just filename
+        try:
+            if os.path.getsize(path) > Config.REPO_MAX_FILE_BYTES or is_binary(path):
+                return "", [], []
+        except OSError:
+            return "", [], []
+        references = RepoMapGenerator.scan_references(path)
+        if path.endswith(".py"):
+            return (*RepoMapGenerator.scan_python_file(path), references)
+        if path.endswith((".js", ".ts", ".jsx", ".tsx")):
+            return RepoMapGenerator._scan_js(path), [], references
+        return RepoMapGenerator._scan_go(path), [], references
+
+    @staticmethod
+    def scan_references(path: str) -> list[str]:
+        """
+        Distinct identifiers used in the file (call sites and CapitalizedNames), in order of first use,
+        at most MAX_REFERENCES. A cheap language-agnostic regex: the names are later matched only
+        against symbols defined in the map, so keywords and noise drop out there.
+        """
+        try:
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                content = f.read()
+        except OSError:
+            return []
+        names: dict[str, None] = {}
+        for match in REFERENCE_RE.finditer(content):
+            names[match.group(1) or match.group(2)] = None
+            if len(names) >= MAX_REFERENCES:
+                break
+        return list(names)
+
+    @staticmethod
+    def filter_map(repo_map: str, paths: list[str]) -> str:
+        """
+        Keeps only the map entries for the given files (in the given order).
+        Files missing from the map (e.g. deeper than max_depth) are listed by name.
+        """
+        entries = {}
+        current = None
+        for line in repo_map.splitlines():
+            if line and not line[0].isspace():
+                current = line[:-1] if line.endswith(":") else line
+                entries[current] = [line]
+            elif current is not None:
+                entries[current].append(line)
+        return "\n".join("\n".join(entries.get(path, [path])) for path in paths)
 
     @staticmethod
     def _scan_python(path: str) -> str:
+        return RepoMapGenerator.scan_python_file(path)[0]
+
+    @staticmethod
+    def scan_python_file(path: str) -> tuple[str, list[str]]:
+        """
+        Single AST pass over a Python file: the map structure and the imported module names.
+        `from x import y` is reported as `x.y` (y may be a submodule), relative imports keep their leading dots.
+        """
         try:
             with open(path, "r", encoding="utf-8") as f:
                 content = f.read()
             tree = ast.parse(content)
-            
-            output = []
-            for node in tree.body:
-                if isinstance(node, ast.ClassDef):
-                    output.append(f"  class {node.name}:")
-                    for item in node.body:
-                         if isinstance(item, ast.FunctionDef):
-                             args = [a.arg for a in item.args.args]
-                             output.append(f"    def {item.name}({', '.join(args)}): ...")
-                elif isinstance(node, ast.FunctionDef):
-                    args = [a.arg for a in node.args.args]
-                    output.append(f"  def {node.name}({', '.join(args)}): ...")
-            
-            return "\n".join(output)
         except Exception:
-            return "  (Parser Error)"
+            return "  (Parser Error)", []
+
+        imports = []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                imports += [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom):
+                base = "." * node.level + (node.module or "")
+                sep = "." if node.module else ""
+                imports += [f"{base}{sep}{alias.name}" for alias in node.names if alias.name != "*"] or [base]
+        return RepoMapGenerator._python_structure(tree), list(dict.fromkeys(imports))
+
+    @staticmethod
+    def _python_structure(tree: ast.Module) -> str:
+        output = []
+        for node in tree.body:
+            if isinstance(node, ast.ClassDef):
+                output.append(f"  class {node.name}:")
+                for item in node.body:
+                     if isinstance(item, ast.FunctionDef):
+                         args = [a.arg for a in item.args.args]
+                         output.append(f"    def {item.name}({', '.join(args)}): ...")
+            elif isinstance(node, ast.FunctionDef):
+                args = [a.arg for a in node.args.args]
+                output.append(f"  def {node.name}({', '.join(args)}): ...")
+        
+        return "\n".join(output)
 
     @staticmethod
     def _scan_js(path: str) -> str:
@@ -184,3 +241,131 @@ class RepoMapGenerator:
             return "\n".join(output)
         except:
             return ""
+
+
+class RepoMapCache:
+    """
+    Persistent per-repository cache of map entries for `source_files` (the git file list with .gitignore
+    and REPO_*_GLOBS applied), keyed by the file signature: git blob SHA, or mtime+size for
+    modified/untracked files and outside git.
+
+    Only new or changed files are re-parsed on refresh. The cache is a gzip-compressed JSON file in the
+    repository cache directory, so code, fix and review runs (and fresh clones) of the same repo share it.
+    """
+    def __init__(self, root: str = ".", cache_dir: Optional[str] = None):
+        self.root = root
+        self.cache_dir = cache_dir or repo_cache_dir(root, "repo_map")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # path -> [signature, structure, imports, references]
+        self.entries: dict[str, list] = {}
+        self._loaded_mtime: Optional[int] = None
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def _path(self) -> str:
+        return os.path.join(self.cache_dir, "map.json.gz")
+
+    def refresh(self) -> dict:
+        """
+        Synchronises the cache with the working tree. Returns update statistics.
+        """
+        with self._lock, file_lock(self._path + ".lock"):
+            start = time.perf_counter()
+            # Another process may have refreshed the shared cache meanwhile
+            self._load()
+            files = source_files(self.root)
+            removed = [p for p in self.entries if p not in files]
+            changed = [p for p, sig in files.items() if p not in self.entries or self.entries[p][0] != sig]
+            for path in removed:
+                del self.entries[path]
+            for path, scanned in zip(changed, scan_files(self.root, changed)):
+                self.entries[path] = [files[path], *scanned]
+            if removed or changed:
+                self._save()
+            return {"files": len(self.entries), "parsed": len(changed), "removed": len(removed),
+                    "seconds": round(time.perf_counter() - start, 3)}
+
+    def render(self, max_depth: int = 4, paths: Optional[list[str]] = None) -> str:
+        """
+        Map text: `path:` followed by indented structure, or the bare path. Files in directories
+        nested deeper than max_depth are omitted; `paths` limits the map to the given files.
+        """
+        lines = []
+        with self._lock:
+            for path in sorted(self.entries if paths is None else set(paths) & self.entries.keys()):
+                if path.count("/") > max_depth:
+                    continue
+                structure = self.entries[path][1]
+                lines.append(f"{path}:\n{structure}" if structure else path)
+        return "\n".join(lines)
+
+    def _save(self):
+        data = {"version": MAP_CACHE_VERSION, "files": self.entries}
+        tmp_path = f"{self._path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=1) as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self._path)
+            self._loaded_mtime = os.stat(self._path).st_mtime_ns
+        except OSError as e:
+            print(f"Repo map cache save error: {e}")
+
+    def _load(self):
+        try:
+            mtime = os.stat(self._path).st_mtime_ns
+            if mtime == self._loaded_mtime:
+                return
+            with gzip.open(self._path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, EOFError, json.JSONDecodeError):
+            return
+        if data.get("version") == MAP_CACHE_VERSION:
+            self.entries = data["files"]
+            self._loaded_mtime = mtime
+
+
+def _scan_chunk(root: str, paths: list[str]) -> list[tuple[str, list[str], list[str]]]:
+    return [RepoMapGenerator.scan_file(os.path.join(root, path)) for path in paths]
+
+
+def scan_files(root: str, paths: list[str], workers: Optional[int] = None):
+    """
+    Scans files for the map, yielding results in the order of `paths`.
+    Large batches (REPO_MAP_PARALLEL_MIN files or more) are parsed in chunks by a process pool,
+    since ast.parse is CPU-bound; small ones, and any pool failure, fall back to a serial scan.
+    """
+    workers = workers or Config.REPO_MAP_WORKERS or os.cpu_count() or 1
+    if workers < 2 or len(paths) < Config.REPO_MAP_PARALLEL_MIN:
+        yield from _scan_chunk(root, paths)
+        return
+    # Several chunks per worker balance uneven file sizes; capped to keep result streaming granular
+    size = max(16, min(256, len(paths) // (workers * 4) or 1))
+    chunks = [paths[i:i + size] for i in range(0, len(paths), size)]
+    done = 0
+    try:
+        # spawn: the agent process has running threads, forking them is unsafe
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            for results in pool.map(_scan_chunk, [root] * len(chunks), chunks):
+                done += 1
+                yield from results
+    except (OSError, BrokenProcessPool) as e:
+        print(f"Parallel map scan failed ({e}), continuing serially")
+        yield from _scan_chunk(root, [p for chunk in chunks[done:] for p in chunk])
+
+
+_maps: dict[str, RepoMapCache] = {}
+_maps_lock = threading.Lock()
+
+
+def get_repo_map(root: str = ".") -> RepoMapCache:
+    """
+    Map cache of the repository, shared within the process and refreshed on every call.
+    """
+    key = os.path.abspath(root)
+    with _maps_lock:
+        cache = _maps.get(key)
+        if cache is None:
+            cache = _maps[key] = RepoMapCache(root)
+    cache.refresh()
+    return cache
@@ -0,0 +1,533 @@
+import os
+import re
+import ast
+import json
+import math
+import time
+import zlib
+import argparse
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Optional
+from src.core.config import Config
+from src.core.repo_files import source_files, repo_cache_dir, file_lock
+
+try:
+    import numpy as np
+except ImportError:  # векторная часть индекса опциональна, BM25 работает и без NumPy
+    np = None
+
+INDEX_VERSION = 1
+SELECTIONS_FILE = "selections.jsonl"
+WORD_RE = re.compile(r"\w+")
+CAMEL_SPLIT_RE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])")
+SYMBOL_RE = re.compile(r"\b(?:def|class|function|func|interface|struct|type|const|fn|trait|enum)\s+(\w+)")
+COMMENT_RE = re.compile(r"(?:#|//)\s?(.*)$", re.MULTILINE)
+MENTION_RE = re.compile(r"[\w./-]+")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+self cls none true false return import def class if else elif while try except pass py
+и в во на не что как по для из к с у о от это так же или но
+""".split())
+
+# Вес терма зависит от того, где он встретился в файле
+FIELD_WEIGHTS = {"path": 3, "symbols": 2, "docs": 1, "identifiers": 1}
+# Повторы терма внутри поля выше этого числа не учитываются (длинные файлы не доминируют)
+FIELD_TF_CAP = 3
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Статистика векторов (df, нормы строк) пересчитывается блоками строк, без копии всей матрицы
+STATS_BLOCK_ROWS = 4096
+# Доля косинусной близости (TF-IDF) в итоговом скоре, остальное — BM25
+VECTOR_WEIGHT = 0.3
+# Бонус файлу, путь или имя которого прямо упомянуты в задаче
+MENTION_BONUS = 1.0
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Разбивает текст на термы: идентификатор целиком плюс его части snake_case/camelCase, в нижнем регистре.
+    """
+    tokens = []
+    for word in WORD_RE.findall(text):
+        parts = [p for chunk in word.split("_") for p in CAMEL_SPLIT_RE.split(chunk) if p]
+        if len(parts) > 1:
+            tokens.append(_normalize(word))
+        tokens.extend(_normalize(p) for p in parts)
+    return [t for t in tokens if len(t) > 1 and t not in STOPWORDS and not t.isdigit()]
+
+
+def _normalize(term: str) -> str:
+    term = term.lower()
+    # Простейшее приведение множественного числа: files -> file
+    if len(term) > 4 and term.endswith("s") and not term.endswith("ss"):
+        term = term[:-1]
+    return term
+
+
+def extract_fields(path: str, content: str) -> dict[str, str]:
+    """
+    Извлекает из файла текст по полям: путь, имена символов, docstrings/комментарии, идентификаторы.
+    """
+    fields = {"path": path, "symbols": "", "docs": "", "identifiers": ""}
+    if not content:
+        return fields
+    if path.endswith(".py"):
+        try:
+            fields.update(_python_fields(content))
+            return fields
+        except (SyntaxError, ValueError):
+            pass
+    if path.endswith((".md", ".rst", ".txt")):
+        fields["docs"] = content
+        return fields
+    fields["symbols"] = " ".join(SYMBOL_RE.findall(content))
+    fields["docs"] = "\n".join(COMMENT_RE.findall(content))
+    fields["identifiers"] = content
+    return fields
+
+
+def _python_fields(content: str) -> dict[str, str]:
+    tree = ast.parse(content)
+    symbols, docs, identifiers = [], [], []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            symbols.append(node.name)
+        if isinstance(node, (ast.Module, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            doc = ast.get_docstring(node)
+            if doc:
+                docs.append(doc)
+        elif isinstance(node, ast.Name):
+            identifiers.append(node.id)
+        elif isinstance(node, ast.Attribute):
+            identifiers.append(node.attr)
+        elif isinstance(node, ast.arg):
+            identifiers.append(node.arg)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            identifiers.extend(alias.name for alias in node.names)
+            identifiers.append(getattr(node, "module", None) or "")
+    docs.extend(COMMENT_RE.findall(content))
+    return {"symbols": " ".join(symbols), "docs": "\n".join(docs), "identifiers": " ".join(identifiers)}
+
+
+def term_counts(path: str, content: str) -> dict[str, int]:
+    counts: Counter = Counter()
+    for field, text in extract_fields(path, content).items():
+        for term, n in Counter(tokenize(text)).items():
+            counts[term] += min(n, FIELD_TF_CAP) * FIELD_WEIGHTS[field]
+    return dict(counts)
+
+
+def _read_text(path: str) -> str:
+    """
+    Читает начало файла (не больше RETRIEVAL_MAX_FILE_BYTES). Бинарные файлы индексируются только по пути.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read(Config.RETRIEVAL_MAX_FILE_BYTES)
+    except OSError:
+        return ""
+    if b"\0" in data[:8192]:
+        return ""
+    return data.decode("utf-8", errors="ignore")
+
+
+@dataclass
+class _Doc:
+    path: str
+    signature: str
+    terms: dict[str, int]
+    length: int
+
+
+class RetrievalIndex:
+    """
+    Локальный индекс файлов репозитория для выбора контекста без обращения к LLM.
+
+    Индексирует пути, имена символов, docstrings/комментарии и идентификаторы:
+    - BM25 по инвертированному индексу термов;
+    - (если установлен NumPy) матрица хэшированных TF-векторов, к которой на запросе
+      применяется IDF и считается косинусная близость. Матрица хранится в .npy и открывается через memmap.
+
+    Индекс лежит в кэше репозитория (AGENT_CACHE_DIR) и обновляется инкрементально:
+    переиндексируются только файлы, у которых изменилась сигнатура (git blob SHA или mtime+size).
+    Кэш общий для процессов: обновление идет под файловой блокировкой, а матрица векторов
+    открывается только на чтение и при изменении целиком подменяется новой копией, поэтому
+    memmap, уже открытые другими процессами, продолжают видеть согласованный старый файл.
+    """
+    def __init__(self, root: str = ".", cache_dir: Optional[str] = None, dim: Optional[int] = None):
+        self.root = root
+        self.cache_dir = cache_dir or repo_cache_dir(root, "retrieval")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.dim = dim or Config.RETRIEVAL_VECTOR_DIM
+        self.docs: list[Optional[_Doc]] = []
+        self.rows: dict[str, int] = {}
+        self.postings: dict[str, dict[int, int]] = defaultdict(dict)
+        self.vectors = None
+        # df по измерениям, idf и нормы строк с весами idf: считаются при обновлении, запрос их только читает
+        self._df = self._idf = self._norms = None
+        self._free_rows: list[int] = []
+        self._total_length = 0
+        self._vectors_tmp: Optional[str] = None
+        self._loaded_mtime: Optional[int] = None
+        self._lock = threading.Lock()
+        with file_lock(self._lock_path):
+            self._load()
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.cache_dir, "index.json")
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.cache_dir, "vectors.npy")
+
+    @property
+    def _stats_path(self) -> str:
+        return os.path.join(self.cache_dir, "vector_stats.npz")
+
+    @property
+    def _lock_path(self) -> str:
+        return os.path.join(self.cache_dir, "index.lock")
+
+    def _tmp_path(self, path: str) -> str:
+        return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    # --- Построение и обновление ---
+
+    def refresh(self) -> dict:
+        """
+        Синхронизирует индекс с рабочей копией. Возвращает статистику обновления.
+        """
+        with self._lock, file_lock(self._lock_path):
+            start = time.perf_counter()
+            # Другой процесс мог обновить общий индекс за это время
+            self._load()
+            files = source_files(self.root)
+            removed = [p for p in self.rows if p not in files]
+            changed = [p for p, sig in files.items()
+                       if p not in self.rows or self.docs[self.rows[p]].signature != sig]
+            if (removed or changed) and np is not None:
+                # Строк станет не больше, чем сейчас плюс все измененные файлы
+                self._writable_vectors(len(self.docs) + len(changed))
+            for path in removed:
+                self._remove(path)
+            for path in changed:
+                self._remove(path)
+                self._add(path, files[path])
+            if removed or changed:
+                if self.vectors is not None:
+                    self._update_stats()
+                self._save()
+            return {"files": len(self.rows), "updated": len(changed), "removed": len(removed),
+                    "seconds": round(time.perf_counter() - start, 3)}
+
+    def _add(self, path: str, signature: str):
+        terms = term_counts(path, _read_text(os.path.join(self.root, path)))
+        doc = _Doc(path, signature, terms, sum(terms.values()))
+        row = self._free_row()
+        self.docs[row] = doc
+        self.rows[path] = row
+        self._total_length += doc.length
+        for term, tf in terms.items():
+            self.postings[term][row] = tf
+        if self.vectors is not None:
+            self.vectors[row] = self._vector(terms)
+
+    def _remove(self, path: str):
+        row = self.rows.pop(path, None)
+        if row is None:
+            return
+        doc = self.docs[row]
+        self.docs[row] = None
+        self._free_rows.append(row)
+        self._total_length -= doc.length
+        for term in doc.terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(row, None)
+                if not posting:
+                    del self.postings[term]
+        if self.vectors is not None:
+            self.vectors[row] = 0
+
+    def _free_row(self) -> int:
+        if self._free_rows:
+            return self._free_rows.pop()
+        self.docs.append(None)
+        return len(self.docs) - 1
+
+    def _vector(self, terms: dict[str, int]):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for term, tf in terms.items():
+            vector[zlib.crc32(term.encode("utf-8")) % self.dim] += 1.0 + math.log(tf)
+        return vector
+
+    def _writable_vectors(self, rows: int):
+        """
+        Копия матрицы для изменения во временном файле процесса (не меньше rows строк,
+        рост удвоением); _save атомарно подменяет ею общий файл.
+        """
+        current = self.vectors.shape[0] if self.vectors is not None else 0
+        capacity = current if current >= rows else max(rows, 2 * current, 64)
+        self._vectors_tmp = self._tmp_path(self._vectors_path)
+        copy = np.lib.format.open_memmap(self._vectors_tmp, mode="w+", dtype=np.float32,
+                                         shape=(capacity, self.dim))
+        if self.vectors is not None:
+            copy[:current] = self.vectors
+        self.vectors = copy
+
+    def _update_stats(self):
+        """
+        Пересчитывает df, idf и нормы строк матрицы (O(N·dim), только при изменении индекса).
+        """
+        rows = len(self.docs)
+        df = np.zeros(self.dim, dtype=np.int64)
+        for start in range(0, rows, STATS_BLOCK_ROWS):
+            df += np.count_nonzero(self.vectors[start:min(start + STATS_BLOCK_ROWS, rows)], axis=0)
+        self._df = df
+        self._idf = self._idf_from(df)
+        norms = np.zeros(rows, dtype=np.float32)
+        for start in range(0, rows, STATS_BLOCK_ROWS):
+            end = min(start + STATS_BLOCK_ROWS, rows)
+            norms[start:end] = np.linalg.norm(self.vectors[start:end] * self._idf, axis=1)
+        self._norms = norms
+
+    def _idf_from(self, df):
+        return (np.log((len(self.rows) + 1) / (df + 1)) + 1.0).astype(np.float32)
+
+    # --- Хранение ---
+
+    def _save(self):
+        """
+        Сохраняет индекс; вызывается под файловой блокировкой. Матрица подменяется раньше
+        метаданных: читатель, загрузивший новые метаданные, всегда найдет согласованные векторы.
+        """
+        if self._vectors_tmp is not None:
+            self.vectors.flush()
+            os.replace(self._vectors_tmp, self._vectors_path)
+            self._vectors_tmp = None
+            self.vectors = np.load(self._vectors_path, mmap_mode="r")
+        if self.vectors is not None:
+            tmp_path = self._tmp_path(self._stats_path)
+            with open(tmp_path, "wb") as f:
+                np.savez(f, df=self._df, norms=self._norms)
+            os.replace(tmp_path, self._stats_path)
+        meta = {
+            "version": INDEX_VERSION,
+            "dim": self.dim,
+            "vectors": self.vectors is not None,
+            "docs": [[d.path, d.signature, d.terms] if d else None for d in self.docs],
+        }
+        tmp_path = self._tmp_path(self._meta_path)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self._meta_path)
+        self._loaded_mtime = os.stat(self._meta_path).st_mtime_ns
+
+    def _load(self):
+        """
+        Читает индекс с диска, если его сохранили после последней загрузки (вызывается
+        под файловой блокировкой).
+        """
+        try:
+            mtime = os.stat(self._meta_path).st_mtime_ns
+            if mtime == self._loaded_mtime:
+                return
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        if meta.get("version") != INDEX_VERSION or meta.get("dim") != self.dim:
+            return
+
+        vectors = None
+        if np is not None and meta.get("vectors"):
+            try:
+                vectors = np.load(self._vectors_path, mmap_mode="r")
+            except (OSError, ValueError):
+                vectors = None
+            if vectors is not None and vectors.shape[0] < len(meta["docs"]):
+                vectors = None
+        if np is not None and vectors is None:
+            # Векторов нет или они не согласованы с метаданными — строим индекс заново
+            return
+
+        self.docs, self.rows, self.postings = [], {}, defaultdict(dict)
+        self._free_rows, self._total_length = [], 0
+        self.vectors = vectors
+        self._loaded_mtime = mtime
+        for row, entry in enumerate(meta["docs"]):
+            if entry is None:
+                self.docs.append(None)
+                self._free_rows.append(row)
+                continue
+            path, signature, terms = entry
+            doc = _Doc(path, signature, terms, sum(terms.values()))
+            self.docs.append(doc)
+            self.rows[path] = row
+            self._total_length += doc.length
+            for term, tf in terms.items():
+                self.postings[term][row] = tf
+        if vectors is not None:
+            self._load_stats()
+
+    def _load_stats(self):
+        try:
+            with np.load(self._stats_path) as stats:
+                df, norms = stats["df"], stats["norms"]
+        except (OSError, KeyError, ValueError):
+            df = norms = None
+        if df is None or df.shape != (self.dim,) or norms.shape[0] < len(self.docs):
+            # Статистики нет (индекс прежней версии) или она не согласована с матрицей
+            self._update_stats()
+            return
+        self._df, self._idf, self._norms = df, self._idf_from(df), norms
+
+    # --- Поиск ---
+
+    def rank(self, query: str, k: int = 10) -> list[tuple[str, float]]:
+        """
+        Возвращает до k файлов, наиболее релевантных тексту задачи: [(path, score)] по убыванию.
+        """
+        with self._lock:
+            if not self.rows:
+                return []
+            query_terms = Counter(tokenize(query))
+            scores = self._bm25(query_terms)
+            top = max(scores.values(), default=0.0)
+            combined = {row: s / top for row, s in scores.items()} if top else {}
+            if self.vectors is not None and query_terms:
+                for row, similarity in self._cosine(query_terms).items():
+                    combined[row] = combined.get(row, 0.0) * (1 - VECTOR_WEIGHT) + VECTOR_WEIGHT * similarity
+            for row in self._mentioned(query):
+                combined[row] = combined.get(row, 0.0) + MENTION_BONUS
+
+            ranked = sorted(combined.items(), key=lambda item: (-item[1], self.docs[item[0]].path))
+            return [(self.docs[row].path, round(score, 4)) for row, score in ranked[:k] if score > 0]
+
+    def _bm25(self, query_terms: Counter) -> dict[int, float]:
+        n_docs = len(self.rows)
+        avg_length = self._total_length / n_docs or 1.0
+        scores: dict[int, float] = defaultdict(float)
+        for term in query_terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for row, tf in posting.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.docs[row].length / avg_length)
+                scores[row] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def _cosine(self, query_terms: Counter) -> dict[int, float]:
+        """
+        Косинус TF-IDF векторов по измерениям запроса: idf и нормы строк посчитаны при обновлении,
+        из матрицы читаются только столбцы, ненулевые в запросе.
+        """
+        query = self._vector(query_terms)
+        dims = np.flatnonzero(query)
+        if not dims.size:
+            return {}
+        rows = len(self.docs)
+        weighted = query[dims] * self._idf[dims]
+        # (строка·idf)·(запрос·idf) = строка·(запрос·idf²)
+        dots = self.vectors[:rows, dims] @ (weighted * self._idf[dims])
+        norms = self._norms[:rows] * np.linalg.norm(weighted)
+        similarity = dots / np.where(norms > 0, norms, 1.0)
+        return {int(row): float(similarity[row]) for row in np.flatnonzero(similarity > 0)}
+
+    def _mentioned(self, query: str) -> list[int]:
+        words = {w.strip("./") for w in MENTION_RE.findall(query)}
+        rows = []
+        for path, row in self.rows.items():
+            name = os.path.basename(path)
+            if path in words or ("." in name and name in words):
+                rows.append(row)
+        return rows
+
+    # --- История выборов и оценка ---
+
+    def load_selections(self) -> list[dict]:
+        try:
+            with open(os.path.join(self.cache_dir, SELECTIONS_FILE), "r", encoding="utf-8") as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except OSError:
+            return []
+
+    def evaluate(self, k: int = 10, history: Optional[list[dict]] = None) -> dict:
+        """
+        Recall@k индекса относительно прошлых выборов: какая доля выбранных файлов
+        (из тех, что еще существуют) попадает в top-k ранжирования.
+        """
+        history = self.load_selections() if history is None else history
+        recalls = []
+        for entry in history:
+            relevant = {p for p in entry.get("selected", []) if p in self.rows}
+            if not relevant:
+                continue
+            found = {path for path, _ in self.rank(entry["query"], k)}
+            recalls.append(len(relevant & found) / len(relevant))
+        return {
+            "queries": len(recalls),
+            "k": k,
+            "recall": round(sum(recalls) / len(recalls), 3) if recalls else None,
+            "full_hits": sum(1 for r in recalls if r == 1.0),
+        }
+
+
+_indexes: dict[str, RetrievalIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_retrieval_index(root: str = ".") -> RetrievalIndex:
+    """
+    Индекс репозитория, общий для процесса. При каждом вызове синхронизируется с рабочей копией
+    (для неизменившегося репозитория это один вызов `git ls-files`).
+    """
+    key = os.path.abspath(root)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = RetrievalIndex(root)
+    index.refresh()
+    return index
+
+
+def record_selection(query: str, selected: list[str], source: str = "llm", root: str = "."):
+    """
+    Запоминает файлы, выбранные для задачи (обычно LLM), чтобы оценивать recall индекса.
+    Не требует загрузки индекса, поэтому пишется и в режиме FILE_SELECTION_MODE=llm.
+    """
+    entry = {"ts": time.time(), "source": source, "query": query[:4000], "selected": selected}
+    path = os.path.join(repo_cache_dir(root, "retrieval"), SELECTIONS_FILE)
+    with _indexes_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный поисковый индекс файлов репозитория")
+    parser.add_argument("root", nargs="?", default=".")
+    parser.add_argument("--query", help="Текст задачи для ранжирования файлов")
+    parser.add_argument("--eval", action="store_true", help="Recall@k относительно прошлых выборов LLM")
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    index = RetrievalIndex(args.root)
+    print(f"Index: {index.refresh()} ({'bm25+vectors' if index.vectors is not None else 'bm25'})")
+    if args.query:
+        start = time.perf_counter()
+        ranked = index.rank(args.query, args.k)
+        print(f"Ranked in {(time.perf_counter() - start) * 1000:.1f}ms:")
+        for path, score in ranked:
+            print(f"  {score:6.3f}  {path}")
+    if args.eval:
+        print(f"Evaluation: {index.evaluate(args.k)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, field
+from typing import Optional
+from src.core.config import Config
+
+
+@dataclass
+class UsageRecord:
+    """
+    Учет одного вызова LLM: стадия, модель, токены и задержки.
+    """
+    stage: str
+    model: str
+    provider: str
+    tokens_in: int = 0
+    tokens_out: int = 0
+    cached_tokens: int = 0
+    latency: float = 0.0
+    ttft: Optional[float] = None
+    cache_hit: bool = False
+    ok: bool = True
+    error: str = ""
+    cost: Optional[float] = None
+    run_id: Optional[str] = None
+    run_kind: Optional[str] = None
+    timestamp: float = field(default_factory=time.time)
+
+
+class RunTelemetry:
+    """
+    Собирает записи об использовании LLM в рамках одного запуска агента
+    (code / fix / review) и пишет их в журнал событий.
+    """
+    def __init__(self, kind: str, repo_name: str, target: str = ""):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.repo_name = repo_name
+        self.target = target
+        self.started_at = time.time()
+        self.records: list[UsageRecord] = []
+        # Исходы запуска помимо вызовов LLM (возобновление с контрольной точки, причина остановки и т.п.)
+        self.attributes: dict = {}
+        self._lock = threading.Lock()
+
+    def annotate(self, **attributes):
+        with self._lock:
+            self.attributes.update(attributes)
+
+    def record(self, usage: UsageRecord):
+        usage.run_id = self.run_id
+        usage.run_kind = self.kind
+        with self._lock:
+            self.records.append(usage)
+        _write_event("llm_usage", self.repo_name, asdict(usage))
+
+    def summary(self) -> dict:
+        with self._lock:
+            records = list(self.records)
+            attributes = dict(self.attributes)
+        by_stage: dict[str, dict] = {}
+        for r in records:
+            stage = by_stage.setdefault(r.stage, {"calls": 0, "tokens_in": 0, "tokens_out": 0, "latency": 0.0})
+            stage["calls"] += 1
+            stage["tokens_in"] += r.tokens_in
+            stage["tokens_out"] += r.tokens_out
+            stage["latency"] = round(stage["latency"] + r.latency, 3)
+        costs = [r.cost for r in records if r.cost is not None]
+        return {
+            "run_id": self.run_id,
+            "kind": self.kind,
+            "target": self.target,
+            "duration": round(time.time() - self.started_at, 3),
+            "llm_calls": len(records),
+            "errors": sum(1 for r in records if not r.ok),
+            "tokens_in": sum(r.tokens_in for r in records),
+            "tokens_out": sum(r.tokens_out for r in records),
+            "llm_latency": round(sum(r.latency for r in records), 3),
+            "cost": round(sum(costs), 6) if costs else None,
+            "stages": by_stage,
+            "attributes": attributes,
+        }
+
+
+_current_run: contextvars.ContextVar[Optional[RunTelemetry]] = contextvars.ContextVar("current_run", default=None)
+
+
+def current_run() -> Optional[RunTelemetry]:
+    return _current_run.get()
+
+
+@contextmanager
+def track_run(kind: str, repo_name: str, target: str = ""):
+    """
+    Открывает запуск: все вызовы LLM внутри блока привязываются к нему,
+    по выходу в журнал пишется событие run_summary.
+    """
+    run = RunTelemetry(kind, repo_name, target)
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+        summary = run.summary()
+        _write_event("run_summary", repo_name, summary)
+        print(f"[📊] LLM: {summary['llm_calls']} calls, {summary['tokens_in']} in / {summary['tokens_out']} out tokens, "
+              f"{summary['llm_latency']}s")
+
+
+def record_usage(usage: UsageRecord):
+    """
+    Регистрирует вызов LLM в текущем запуске (или отдельным событием, если запуск не открыт).
+    """
+    usage.cost = estimate_cost(usage.model, usage.tokens_in, usage.tokens_out)
+    run = current_run()
+    if run:
+        run.record(usage)
+    else:
+        _write_event("llm_usage", "unknown", asdict(usage))
+
+
+def estimate_cost(model: str, tokens_in: int, tokens_out: int) -> Optional[float]:
+    """
+    Стоимость вызова по таблице Config.LLM_PRICING (цены за 1M токенов). None, если цена неизвестна.
+    """
+    if not Config.LLM_PRICING:
+        return None
+    try:
+        pricing = json.loads(Config.LLM_PRICING)
+    except json.JSONDecodeError:
+        return None
+    # Для YandexGPT модель задается как gpt://<folder>/<model>/<version>
+    price = pricing.get(model) or pricing.get(model.split("/")[-2] if model.count("/") >= 2 else model)
+    if not isinstance(price, dict):
+        return None
+    return (tokens_in * price.get("input", 0) + tokens_out * price.get("output", 0)) / 1_000_000
+
+
+def _write_event(event_type: str, repo_name: str, details: dict):
+    try:
+        from src.core.db import log_event
+        log_event(event_type, repo_name, details)
+    except Exception as e:
+        print(f"Telemetry Error: {e}")
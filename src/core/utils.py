@@ -1,42 +1,252 @@
 import re
 import os
+import difflib
+from dataclasses import dataclass, field
+
+# Блок правки в формате SEARCH/REPLACE
+EDIT_BLOCK_RE = re.compile(
+    r"^<{5,9} SEARCH[^\n]*\n(.*?)^={5,9}[ \t]*\n(.*?)^>{5,9} REPLACE[^\n]*$",
+    re.DOTALL | re.MULTILINE,
+)
+FILE_HEADER_RE = re.compile(r"^File: `(.*?)`", re.MULTILINE)
+
+# Минимальное сходство фрагмента SEARCH с кодом файла для нечеткого применения
+FUZZY_THRESHOLD = 0.85
+# Нечеткое совпадение принимается только для блоков от FUZZY_MIN_LINES строк и только если лучшее окно
+# сходнее любого другого (не перекрывающегося с ним) хотя бы на FUZZY_MARGIN: короткие и похожие
+# друг на друга фрагменты (однотипные функции) иначе правятся не в том месте
+FUZZY_MIN_LINES = 3
+FUZZY_MARGIN = 0.1
+
 
 def parse_code_blocks(markdown_text: str) -> list[dict]:
     """
-    Парсит блоки кода из Markdown текста для извлечения изменений файлов.
-    Ожидаемый формат:
+    Парсит изменения файлов из ответа LLM. Поддерживаются два вида блоков:
+
+    1. Полное содержимое файла (для новых файлов):
     File: `src/main.py`
     ```python
     код...
     ```
+
+    2. Точечные правки существующего файла (SEARCH/REPLACE или unified diff):
+    File: `src/main.py`
+    <<<<<<< SEARCH
+    старый фрагмент
+    =======
+    новый фрагмент
+    >>>>>>> REPLACE
+
+    Возвращает [{"path", "content"}] для полных файлов и [{"path", "edits": [(search, replace), ...]}] для правок.
     """
     blocks = []
-    
-    # Паттерн ищет строку 'File: `путь`' и следующий за ней блок кода
-    pattern = r"File: `(.*?)`\s*```.*?\n(.*?)```"
-    matches = re.finditer(pattern, markdown_text, re.DOTALL)
-    
-    for match in matches:
-        path = match.group(1).strip()
-        content = match.group(2)
-        blocks.append({"path": path, "content": content})
-        
+    headers = list(FILE_HEADER_RE.finditer(markdown_text))
+
+    for i, header in enumerate(headers):
+        path = header.group(1).strip()
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(markdown_text)
+        segment = markdown_text[header.end():end]
+
+        edits = [(m.group(1), m.group(2)) for m in EDIT_BLOCK_RE.finditer(segment)]
+        if not edits:
+            diff = re.search(r"```diff\n(.*?)```", segment, re.DOTALL)
+            if diff and "@@" in diff.group(1):
+                edits = _hunks_to_edits(diff.group(1))
+        if edits:
+            blocks.append({"path": path, "edits": edits})
+            continue
+
+        # Паттерн ищет блок кода, следующий сразу за строкой 'File: `путь`'
+        fence = re.match(r"\s*```.*?\n(.*?)```", segment, re.DOTALL)
+        if fence:
+            blocks.append({"path": path, "content": fence.group(1)})
+
     return blocks
 
-def apply_file_changes(changes: list[dict]):
+
+def _hunks_to_edits(diff_text: str) -> list[tuple[str, str]]:
+    """
+    Преобразует hunks unified diff в пары (search, replace) по контексту, номера строк игнорируются.
+    """
+    edits = []
+    search, replace = [], []
+    for line in diff_text.splitlines(keepends=True):
+        if line.startswith(("---", "+++", "\\")):
+            continue
+        if line.startswith("@@"):
+            if search or replace:
+                edits.append(("".join(search), "".join(replace)))
+            search, replace = [], []
+            continue
+        tag, body = line[:1], line[1:]
+        if tag == "-":
+            search.append(body)
+        elif tag == "+":
+            replace.append(body)
+        else:
+            # Контекстная строка (" ..." или пустая)
+            search.append(body if tag == " " else line)
+            replace.append(body if tag == " " else line)
+    if search or replace:
+        edits.append(("".join(search), "".join(replace)))
+    return edits
+
+
+@dataclass
+class EditConflict:
+    path: str
+    search: str
+    reason: str
+
+    def describe(self) -> str:
+        preview = "\n".join(self.search.strip("\n").splitlines()[:5])
+        return f"`{self.path}`: {self.reason}\n```\n{preview}\n```"
+
+
+@dataclass
+class ApplyReport:
+    """
+    Итог применения изменений: какие файлы записаны и какие правки не удалось применить.
+    """
+    written: list[str] = field(default_factory=list)
+    conflicts: list[EditConflict] = field(default_factory=list)
+
+    def summary(self) -> str:
+        if not self.conflicts:
+            return ""
+        return "\n\n".join(c.describe() for c in self.conflicts)
+
+
+def apply_edit(content: str, search: str, replace: str) -> tuple[str | None, str]:
+    """
+    Применяет одну правку SEARCH/REPLACE к тексту файла.
+    Порядок попыток: точное совпадение -> совпадение без учета отступов и хвостовых пробелов ->
+    нечеткое совпадение окна строк (difflib, сходство >= FUZZY_THRESHOLD, см. FUZZY_MIN_LINES / FUZZY_MARGIN).
+    Совпадение должно быть единственным: неоднозначный SEARCH — конфликт, а не правка первого вхождения.
+    Возвращает (новый текст, "") или (None, причина конфликта).
+    """
+    if not search.strip():
+        # Пустой SEARCH — дописать в конец файла
+        separator = "" if not content or content.endswith("\n") else "\n"
+        return content + separator + replace, ""
+
+    occurrences = content.count(search)
+    if occurrences == 1:
+        return content.replace(search, replace, 1), ""
+    if occurrences > 1:
+        return None, f"SEARCH block is ambiguous: it matches {occurrences} places, include more surrounding lines"
+
+    lines = content.splitlines(keepends=True)
+    search_lines = search.strip("\n").splitlines()
+    replace_lines = replace.strip("\n").splitlines()
+    n = len(search_lines)
+    if n == 0 or n > len(lines):
+        return None, "SEARCH block not found"
+
+    # Совпадение с точностью до пробелов: сохраняем отступ файла
+    stripped = [l.strip() for l in search_lines]
+    matches = [i for i in range(len(lines) - n + 1) if [l.strip() for l in lines[i:i + n]] == stripped]
+    if len(matches) > 1:
+        return None, (f"SEARCH block is ambiguous: it matches {len(matches)} places ignoring whitespace, "
+                      f"include more surrounding lines")
+    if matches:
+        i = matches[0]
+        return _splice(lines, i, n, _reindent(replace_lines, search_lines, lines[i:i + n])), ""
+
+    if n < FUZZY_MIN_LINES:
+        return None, "SEARCH block not found"
+
+    # Нечеткое совпадение: окна строк той же длины, похожие достаточно, чтобы принять или помешать принять
+    scored = []
+    target = "\n".join(stripped)
+    for i in range(len(lines) - n + 1):
+        window = "\n".join(l.strip() for l in lines[i:i + n])
+        matcher = difflib.SequenceMatcher(None, target, window, autojunk=False)
+        if matcher.quick_ratio() < FUZZY_THRESHOLD - FUZZY_MARGIN:
+            continue
+        ratio = matcher.ratio()
+        if ratio >= FUZZY_THRESHOLD - FUZZY_MARGIN:
+            scored.append((ratio, i))
+    if not scored:
+        return None, "SEARCH block not found"
+    best_ratio, best_i = max(scored)
+    if best_ratio < FUZZY_THRESHOLD:
+        return None, f"SEARCH block not found (best match {best_ratio:.0%})"
+    # Соседние окна перекрываются с лучшим и почти совпадают с ним, соперники — только отдельные фрагменты
+    rivals = [ratio for ratio, i in scored if abs(i - best_i) >= n]
+    if rivals and best_ratio - max(rivals) < FUZZY_MARGIN:
+        return None, (f"SEARCH block is ambiguous: similar code in several places "
+                      f"({best_ratio:.0%} vs {max(rivals):.0%}), include more surrounding lines")
+    return _splice(lines, best_i, n, _reindent(replace_lines, search_lines, lines[best_i:best_i + n])), ""
+
+
+def _leading(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+
+def _reindent(replace_lines: list[str], search_lines: list[str], file_lines: list[str]) -> list[str]:
     """
-    Применяет список изменений к файловой системе.
-    Создает необходимые директории и перезаписывает файлы.
+    Если модель ошиблась с отступом, сдвигает REPLACE на ту же разницу, что и SEARCH относительно файла.
     """
+    first_search = next((l for l in search_lines if l.strip()), "")
+    first_file = next((l for l in file_lines if l.strip()), "")
+    have, want = _leading(first_search), _leading(first_file.rstrip("\n"))
+    if have == want:
+        return replace_lines
+    result = []
+    for line in replace_lines:
+        if line.startswith(have):
+            result.append(want + line[len(have):])
+        else:
+            result.append(line)
+    return result
+
+
+def _splice(lines: list[str], start: int, count: int, new_lines: list[str]) -> str:
+    tail_newline = lines[start + count - 1].endswith("\n") if count else True
+    replacement = "\n".join(new_lines)
+    if new_lines and tail_newline:
+        replacement += "\n"
+    return "".join(lines[:start]) + replacement + "".join(lines[start + count:])
+
+
+def apply_file_changes(changes: list[dict], root: str = ".") -> ApplyReport:
+    """
+    Применяет список изменений к файловой системе (пути относительно root).
+    Полные файлы создаются/перезаписываются; правки применяются к текущему содержимому.
+    Файл с правками записывается, только если применились все его правки.
+    """
+    report = ApplyReport()
     for change in changes:
         path = change["path"]
-        content = change["content"]
-        
+        target = os.path.join(root, path)
+
+        if "edits" in change:
+            content = ""
+            if os.path.exists(target):
+                with open(target, "r", encoding="utf-8") as f:
+                    content = f.read()
+            failed = False
+            for search, replace in change["edits"]:
+                updated, reason = apply_edit(content, search, replace)
+                if updated is None:
+                    report.conflicts.append(EditConflict(path, search, reason))
+                    failed = True
+                    continue
+                content = updated
+            if failed:
+                print(f"Конфликт правок, файл не изменен: {path}")
+                continue
+        else:
+            content = change["content"]
+
         # Обеспечиваем существование директории
-        dirname = os.path.dirname(path)
+        dirname = os.path.dirname(target)
         if dirname:
             os.makedirs(dirname, exist_ok=True)
-        
-        with open(path, "w") as f:
+
+        with open(target, "w", encoding="utf-8") as f:
             f.write(content)
+        report.written.append(path)
         print(f"Обновлен файл: {path}")
+    return report
@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import tomllib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+from src.core.config import Config
+
+try:
+    import yaml
+except ImportError:  # PyYAML необязателен: без него YAML-файлы не проверяются
+    yaml = None
+
+# Импорт модулей в отдельном интерпретаторе. Отсутствующие сторонние пакеты (зависимости проекта
+# могут быть не установлены в окружении агента) ошибкой не считаются — только модули самого репозитория.
+IMPORT_SMOKE_SCRIPT = r"""
+import importlib, json, os, sys, traceback
+sys.path.insert(0, os.getcwd())
+errors = {}
+for path, module in json.loads(sys.argv[1]).items():
+    try:
+        importlib.import_module(module)
+    except ModuleNotFoundError as e:
+        top = (e.name or "").split(".")[0]
+        if top and (os.path.isdir(top) or os.path.isfile(top + ".py")):
+            errors[path] = f"{type(e).__name__}: {e}"
+    except BaseException as e:
+        errors[path] = "".join(traceback.format_exception_only(type(e), e)).strip()
+print(json.dumps(errors))
+"""
+
+
+@dataclass
+class ValidationError:
+    path: str
+    kind: str  # syntax | import | test
+    message: str
+
+    def describe(self) -> str:
+        return f"`{self.path}` ({self.kind}):\n```\n{self.message}\n```"
+
+
+@dataclass
+class ValidationReport:
+    """
+    Итог локальной проверки измененных файлов перед коммитом.
+    """
+    checked: list[str] = field(default_factory=list)
+    errors: list[ValidationError] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    @property
+    def failed_paths(self) -> list[str]:
+        return list(dict.fromkeys(e.path for e in self.errors))
+
+    def summary(self) -> str:
+        return "\n\n".join(e.describe() for e in self.errors)
+
+
+def check_syntax(path: str) -> Optional[ValidationError]:
+    """
+    Синтаксическая проверка файла по расширению: Python (compile), JSON, TOML, YAML.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        if path.endswith(".py"):
+            compile(text, path, "exec", dont_inherit=True)
+        elif path.endswith(".json"):
+            json.loads(text)
+        elif path.endswith(".toml"):
+            tomllib.loads(text)
+        elif path.endswith((".yml", ".yaml")) and yaml is not None:
+            list(yaml.safe_load_all(text))
+    except SyntaxError as e:
+        return ValidationError(path, "syntax", f"line {e.lineno}: {e.msg}\n{(e.text or '').rstrip()}")
+    except (ValueError, tomllib.TOMLDecodeError) as e:
+        return ValidationError(path, "syntax", str(e))
+    except Exception as e:
+        if yaml is not None and isinstance(e, yaml.YAMLError):
+            return ValidationError(path, "syntax", str(e))
+        raise
+    return None
+
+
+def module_name(path: str) -> Optional[str]:
+    """
+    Имя модуля для импорта по пути файла (None, если путь не может быть модулем).
+    """
+    if not path.endswith(".py"):
+        return None
+    parts = os.path.normpath(path)[:-3].split(os.sep)
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    if not parts or not all(p.isidentifier() for p in parts):
+        return None
+    return ".".join(parts)
+
+
+def import_smoke_test(paths: list[str], root: str = ".") -> list[ValidationError]:
+    modules = {path: module_name(path) for path in paths}
+    modules = {path: name for path, name in modules.items() if name}
+    if not modules:
+        return []
+    try:
+        result = subprocess.run([sys.executable, "-c", IMPORT_SMOKE_SCRIPT, json.dumps(modules)], cwd=root,
+                                capture_output=True, text=True, timeout=Config.VALIDATION_TIMEOUT)
+        errors = json.loads(result.stdout.strip().splitlines()[-1]) if result.stdout.strip() else {}
+    except subprocess.TimeoutExpired:
+        return [ValidationError(path, "import", f"import timed out after {Config.VALIDATION_TIMEOUT}s")
+                for path in modules]
+    except (json.JSONDecodeError, IndexError, OSError) as e:
+        print(f"Import smoke test unavailable: {e}")
+        return []
+    return [ValidationError(path, "import", message) for path, message in errors.items()]
+
+
+def run_impacted_tests(paths: list[str], root: str = ".") -> list[ValidationError]:
+    """
+    Тесты, которые транзитивно импортируют измененные модули (граф импортов), параллельно в пределах VALIDATION_TIMEOUT.
+    """
+    from src.core.impact_analysis import get_import_graph
+    graph = get_import_graph(root)
+    tests = graph.impacted_tests(paths)
+    if not tests:
+        return []
+    result = graph.run_tests(tests, budget=Config.VALIDATION_TIMEOUT)
+    print(f"Impacted tests: {len(result.passed)} passed, {len(result.failed)} failed, "
+          f"{len(result.skipped)} skipped (budget) in {result.seconds}s")
+    return [ValidationError(test, "test", output) for test, output in result.failed.items()]
+
+
+def validate_changes(paths: list[str], root: str = ".", tests: Optional[bool] = None) -> ValidationReport:
+    """
+    Быстрая проверка измененных файлов перед коммитом: синтаксис всех файлов параллельно, затем
+    импорт измененных Python-модулей и (при VALIDATION_TESTS) затронутые тесты — в отдельных процессах одновременно.
+    Импорт запускается только для файлов без синтаксических ошибок.
+    """
+    tests = Config.VALIDATION_TESTS if tests is None else tests
+    existing = [p for p in dict.fromkeys(paths) if os.path.isfile(os.path.join(root, p))]
+    report = ValidationReport(checked=existing)
+    with ThreadPoolExecutor(max_workers=min(8, max(len(existing), 1)), thread_name_prefix="validate") as pool:
+        syntax = list(pool.map(lambda p: check_syntax(os.path.join(root, p)), existing))
+        broken = set()
+        for path, error in zip(existing, syntax):
+            if error:
+                error.path = path
+                report.errors.append(error)
+                broken.add(path)
+        python_files = [p for p in existing if p.endswith(".py") and p not in broken]
+        imports = pool.submit(import_smoke_test, python_files, root)
+        test_errors = pool.submit(run_impacted_tests, python_files, root) if tests and not broken else None
+        report.errors += imports.result()
+        if test_errors is not None:
+            report.errors += test_errors.result()
+    return report
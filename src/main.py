@@ -3,6 +3,7 @@ import sys
 from src.core.config import Config
 from src.agents.code_agent import CodeAgent
 from src.agents.reviewer_agent import ReviewerAgent
+from src.agents.batch_agent import BatchAgent
 
 def main():
     """
@@ -26,6 +27,10 @@ def main():
     fix_parser.add_argument("--pr", required=True, help="URL Pull Request")
     fix_parser.add_argument("--issue", required=True, help="URL оригинального Issue")
 
+    # Пакетный режим: несколько задач одного репозитория за один запуск
+    batch_parser = subparsers.add_parser("batch", help="Запустить Code Agent для нескольких задач")
+    batch_parser.add_argument("--issues", required=True, nargs="+", help="URL GitHub Issues одного репозитория")
+
     args = parser.parse_args()
 
     # Инициализация БД (для локальных логов, даже если они не идут в Cloud Dashboard)
@@ -47,6 +52,11 @@ def main():
         agent = CodeAgent()
         agent.run_fix(args.pr, args.issue)
 
+    elif args.command == "batch":
+        results = BatchAgent().run(args.issues)
+        if not any(r["status"] == "pr" for r in results):
+            sys.exit(1)
+
     elif args.command == "review":
         agent = ReviewerAgent()
         agent.run(args.pr, args.issue)
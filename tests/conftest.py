@@ -0,0 +1,30 @@
+import pytest
+
+from src.core.config import Config
+
+
+class _NullRun:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def make_code_agent(tmp_path, monkeypatch):
+    """Фабрика CodeAgent без телеметрии и журнала шагов, с кэшем во временном каталоге."""
+    from src.agents.code_agent import CodeAgent
+
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(Config, "YC_FOLDER_ID", "folder")
+    monkeypatch.setattr("src.agents.code_agent.track_run", lambda *a: _NullRun())
+
+    def make(git, llm=None):
+        agent = CodeAgent(git_provider=git)
+        monkeypatch.setattr(agent, "_log_step", lambda *a, **k: None)
+        if llm is not None:
+            monkeypatch.setattr(agent.router, "get", lambda stage: llm)
+        return agent
+
+    return make
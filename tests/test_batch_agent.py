@@ -0,0 +1,130 @@
+import re
+import subprocess
+import threading
+import time
+from src.core import db
+from src.core.config import Config
+from src.core.git_provider import GitProvider
+from src.core.llm import LLMRouter
+from src.agents.code_agent import CodeAgent
+from src.agents import batch_agent
+from src.agents.batch_agent import BatchAgent
+
+ISSUES = [f"https://github.com/owner/repo/issues/{n}" for n in (1, 2, 3)]
+
+
+class FakeGit(GitProvider):
+    """
+    Настоящий git (ветки и коммиты в worktree), GitHub API заменен записью вызовов.
+    """
+    prs: list = []
+
+    def get_issue(self, url):
+        n = url.split("/")[-1]
+        return f"Title: Feature {n}\nDescription:\nCreate module feature_{n}.py with a function returning {n}"
+
+    def get_issue_comment_list(self, url):
+        return []
+
+    def create_pr(self, title, body, base="main"):
+        self.prs.append((time.monotonic(), self.repo.active_branch.name))
+        return f"https://github.com/owner/repo/pull/{len(self.prs)}"
+
+    def post_comment(self, url, body):
+        pass
+
+    def _get_repo_name_from_remote(self):
+        return "owner/repo"
+
+
+class ConcurrentLLM:
+    model = "gpt-4o-mini"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = self.peak = 0
+        self.finished = []
+
+    def generate(self, system, user):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.2)
+        n = re.search(r"feature_(\d+)", user).group(1)
+        with self._lock:
+            self.active -= 1
+            self.finished.append(time.monotonic())
+        return f"File: `feature_{n}.py`\n```python\ndef feature():\n    return {n}\n```\n"
+
+
+def _git(root, *args):
+    return subprocess.run(["git", *args], cwd=root, check=True, capture_output=True, text=True).stdout
+
+
+def _setup(tmp_path, monkeypatch):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "calc.py").write_text("def double(x):\n    return 2 * x\n")
+    _git(repo, "init", "-q")
+    _git(repo, "config", "user.email", "a@b")
+    _git(repo, "config", "user.name", "a")
+    _git(repo, "add", ".")
+    _git(repo, "commit", "-qm", "init")
+    monkeypatch.chdir(repo)
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "events.db"))
+    db.init_db()
+    monkeypatch.setattr(Config, "GITHUB_TOKEN", None)
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(Config, "FILE_SELECTION_MODE", "llm")
+    monkeypatch.setattr(Config, "REPO_MAP_TOKENS", 0)
+    monkeypatch.setattr(Config, "HISTORY_COMPANIONS", 0)
+    monkeypatch.setattr(Config, "CANDIDATES", 1)
+
+    llm = ConcurrentLLM()
+    monkeypatch.setattr(LLMRouter, "get", lambda self, stage: llm)
+    maps = []
+    monkeypatch.setattr(CodeAgent, "_build_repo_map", lambda self: maps.append(1) or "calc.py")
+    monkeypatch.setattr(CodeAgent, "_select_relevant_files", lambda self, issue, repo_map: ["calc.py"])
+    monkeypatch.setattr(CodeAgent, "_log_step", lambda self, *a, **k: None)
+    FakeGit.prs = []
+    return repo, llm, maps
+
+
+def test_batch_shares_map_and_opens_one_pr_per_issue(tmp_path, monkeypatch):
+    repo, llm, maps = _setup(tmp_path, monkeypatch)
+    results = BatchAgent(git_provider=FakeGit("."), git_factory=FakeGit).run(ISSUES)
+
+    assert [r["status"] for r in results] == ["pr", "pr", "pr"]
+    assert len(maps) == 1
+    assert llm.peak >= 2
+    # PR открываются после генерации для всех задач, каждая задача — в своей ветке
+    assert min(t for t, _ in FakeGit.prs) >= max(llm.finished)
+    branches = [branch for _, branch in FakeGit.prs]
+    assert sorted(b.split("-")[1] for b in branches) == ["1", "2", "3"]
+    for branch in branches:
+        n = branch.split("-")[1]
+        files = _git(repo, "ls-tree", "--name-only", branch).split()
+        assert sorted(files) == ["calc.py", f"feature_{n}.py"]
+
+    # Основное рабочее дерево не меняется, временные worktree удалены
+    assert not (repo / "feature_1.py").exists()
+    assert len(_git(repo, "worktree", "list").strip().splitlines()) == 1
+
+
+def test_task_failing_before_the_barrier_does_not_block_the_batch(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    monkeypatch.setattr(Config, "BATCH_WAIT_TIMEOUT", 30)
+    track_run = batch_agent.track_run
+
+    def failing_track_run(kind, repo_name, issue_url):
+        if issue_url == ISSUES[1]:
+            raise RuntimeError("telemetry unavailable")
+        return track_run(kind, repo_name, issue_url)
+
+    monkeypatch.setattr(batch_agent, "track_run", failing_track_run)
+    start = time.monotonic()
+    results = BatchAgent(git_provider=FakeGit("."), git_factory=FakeGit).run(ISSUES)
+
+    assert time.monotonic() - start < 10
+    assert [r["status"] for r in results] == ["pr", "failed", "pr"]
+    assert results[1]["error"] == "telemetry unavailable"
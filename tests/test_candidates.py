@@ -0,0 +1,74 @@
+import subprocess
+import threading
+import time
+from src.core import candidates as candidates_module
+from src.core.config import Config
+from src.core.candidates import generate_candidates, select_best
+
+GOOD = "File: `calc.py`\n```python\ndef double(x):\n    return 2 * x\n```\n"
+BROKEN = "File: `calc.py`\n```python\ndef double(x)\n    return 2 * x\n```\n"
+STUB = "File: `calc.py`\n```python\ndef double(x):\n    raise NotImplementedError  # TODO\n```\n"
+
+
+class ScriptedLLM:
+    def __init__(self, responses, delays=None):
+        self.responses = list(responses)
+        self.delays = delays or {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.finished = 0
+
+    def generate(self, system, user):
+        with self._lock:
+            index = self.calls
+            self.calls += 1
+        time.sleep(self.delays.get(index, 0))
+        with self._lock:
+            self.finished += 1
+        return self.responses[index]
+
+
+def _repo(tmp_path):
+    (tmp_path / "calc.py").write_text("def double(x):\n    pass\n")
+    for args in (["init", "-q"], ["add", "."], ["-c", "user.email=a@b", "-c", "user.name=a", "commit", "-qm", "init"]):
+        subprocess.run(["git", *args], cwd=tmp_path, check=True)
+    return str(tmp_path)
+
+
+def test_best_passing_candidate_is_chosen_and_worktrees_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path / "cache"))
+    (tmp_path / "repo").mkdir()
+    root = _repo(tmp_path / "repo")
+    llm = ScriptedLLM([BROKEN, STUB, GOOD])
+
+    candidates = generate_candidates(llm, "sys", "user", 3, budget=60, root=root)
+    assert [c.passed for c in candidates] == [False, True, True]
+    assert candidates[1].issues and not candidates[2].issues
+    assert select_best(candidates).index == 2
+
+    # Кандидаты проверяются в отдельных копиях: основное дерево не тронуто, worktree удалены
+    assert (tmp_path / "repo" / "calc.py").read_text() == "def double(x):\n    pass\n"
+    worktrees = subprocess.run(["git", "worktree", "list"], cwd=root, capture_output=True, text=True).stdout
+    assert len(worktrees.strip().splitlines()) == 1
+
+
+def test_time_budget_keeps_finished_candidates(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path / "cache"))
+    (tmp_path / "repo").mkdir()
+    root = _repo(tmp_path / "repo")
+    llm = ScriptedLLM([GOOD, GOOD], delays={1: 2.5})
+    evaluated = []
+    evaluate = candidates_module.evaluate_candidate
+    monkeypatch.setattr(candidates_module, "evaluate_candidate",
+                        lambda index, *args: evaluated.append(index) or evaluate(index, *args))
+
+    start = time.monotonic()
+    candidates = generate_candidates(llm, "sys", "user", 2, budget=1.5, root=root)
+    assert time.monotonic() - start < 2.5
+    assert [c.index for c in candidates] == [0] and candidates[0].passed
+
+    # Опоздавший ответ после бюджета не применяется и не проверяется
+    while llm.finished < 2 and time.monotonic() - start < 10:
+        time.sleep(0.05)
+    time.sleep(0.2)
+    assert evaluated == [0]
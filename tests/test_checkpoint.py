@@ -0,0 +1,77 @@
+import pytest
+from src.core import db
+from src.core.config import Config
+from src.agents.code_agent import CodeAgent
+
+ISSUE_URL = "https://github.com/owner/repo/issues/4"
+RESPONSE = "File: `calc.py`\n```python\nX = 2\n```\n"
+
+
+class FlakyGit:
+    def __init__(self):
+        self.push_fails = True
+        self.prs = []
+        self.comments = []
+
+    def get_issue(self, url): return "Title: Calc\nDescription:\nUpdate X in calc.py to be equal to two"
+    def get_issue_comment_list(self, url): return list(self.comments)
+    def create_branch(self, name): pass
+    def commit_changes(self, message): pass
+    def post_comment(self, url, body): pass
+    def _get_repo_name_from_remote(self): return "owner/repo"
+
+    def create_pr(self, title, body, base="main"):
+        if self.push_fails:
+            raise RuntimeError("push rejected")
+        self.prs.append(title)
+        return "https://github.com/owner/repo/pull/5"
+
+
+def _comment(i, author, body):
+    return {"id": f"issue:{i}", "kind": "general", "author": author, "path": None, "line": None, "body": body}
+
+
+def test_retry_resumes_after_generation(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "calc.py").write_text("X = 1\n")
+    monkeypatch.delenv("DASHBOARD_API_URL", raising=False)
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "events.db"))
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(Config, "YC_FOLDER_ID", "folder")
+    monkeypatch.setattr(Config, "EDIT_FORMAT", "whole")
+    monkeypatch.setattr(Config, "FILE_SELECTION_MODE", "llm")
+    monkeypatch.setattr(Config, "REPO_MAP_TOKENS", 0)
+    monkeypatch.setattr(Config, "HISTORY_COMPANIONS", 0)
+
+    git = FlakyGit()
+    agent = CodeAgent(git_provider=git)
+    calls = []
+    monkeypatch.setattr(agent, "_log_step", lambda *a, **k: None)
+    monkeypatch.setattr(agent, "_build_repo_map", lambda: "calc.py")
+    monkeypatch.setattr(agent, "_select_relevant_files", lambda issue, repo_map: calls.append("select") or ["calc.py"])
+    monkeypatch.setattr(agent.llm, "generate", lambda system, user: calls.append("generate") or RESPONSE)
+
+    with pytest.raises(RuntimeError):
+        agent.run(ISSUE_URL)
+    assert calls == ["select", "generate"]
+
+    # Повтор по /retry с теми же входными данными: выбор файлов и генерация берутся из контрольной точки,
+    # команда и сообщение самого агента ключ не меняют
+    git.push_fails = False
+    git.comments += [_comment(1, "app[bot]", "⚠️ **Task Completed but PR Failed**\n\npush rejected"),
+                     _comment(2, "alice", "/retry")]
+    agent.run(ISSUE_URL)
+    assert calls == ["select", "generate"]
+    assert git.prs and (tmp_path / "calc.py").read_text() == "X = 2\n"
+    assert agent.last_run.summary()["attributes"]["resumed_from"] == "changes"
+
+    # Успешный запуск удаляет контрольную точку
+    agent.run(ISSUE_URL)
+    assert calls == ["select", "generate"] * 2
+
+
+def test_checkpoints_can_be_disabled(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(Config, "CHECKPOINT_TTL_HOURS", 0)
+    from src.core.checkpoint import load_checkpoint
+    assert load_checkpoint("code", "issue") is None
@@ -0,0 +1,42 @@
+import time
+from src.core.config import Config
+
+
+class SlowGit:
+    def __init__(self):
+        self.calls = []
+
+    def _slow(self, name, value):
+        self.calls.append(name)
+        time.sleep(0.2)
+        return value
+
+    def get_issue(self, url):
+        return self._slow("get_issue", "Title: T\nDescription:\nCreate a helper function in utils.py please")
+
+    def get_issue_comment_list(self, url):
+        return self._slow("get_issue_comment_list", [])
+
+    def _get_repo_name_from_remote(self):
+        return "owner/repo"
+
+
+def test_issue_comments_and_map_are_fetched_concurrently_once(monkeypatch, make_code_agent):
+    monkeypatch.setattr(Config, "FILE_SELECTION_MODE", "llm")
+    monkeypatch.setattr(Config, "REPO_MAP_TOKENS", 0)
+    monkeypatch.setattr(Config, "HISTORY_COMPANIONS", 0)
+    git = SlowGit()
+    agent = make_code_agent(git)
+    monkeypatch.setattr(agent, "_build_repo_map", lambda: git._slow("repo_map", "src/utils.py"))
+    monkeypatch.setattr(agent, "_select_relevant_files", lambda issue, repo_map: [])
+    monkeypatch.setattr(agent.llm, "generate", lambda system, user: "")
+    monkeypatch.setattr(agent, "_apply_and_push", lambda *a, **k: None)
+
+    start = time.monotonic()
+    agent.run("https://github.com/owner/repo/issues/1")
+    elapsed = time.monotonic() - start
+
+    # Три запроса по 0.2s выполняются одной волной, задача не запрашивается повторно в _get_context
+    assert elapsed < 0.5
+    assert git.calls.count("get_issue") == 1
+    assert sorted(git.calls) == ["get_issue", "get_issue_comment_list", "repo_map"]
@@ -0,0 +1,104 @@
+import ast
+from src.core.config import Config
+from src.core.context_slicer import minify, read_source, render_context_file
+
+BIG_MODULE = '''"""Billing module."""
+import os
+from decimal import Decimal
+
+RATE = Decimal("0.2")
+
+
+class InvoiceRenderer:
+    """Renders invoices."""
+
+    def render_pdf(self, invoice):
+        # draw every line
+        return [line for line in invoice.lines]
+
+    def send_email(self, invoice, address):
+        return address
+''' + "".join(f'''
+
+def helper_{i}(value):
+    """Helper {i}."""
+    total = value + {i}
+    return total
+''' for i in range(120))
+
+
+def test_large_python_file_keeps_relevant_symbols_and_signatures(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "CONTEXT_SLICE_LINES", 100)
+    path = tmp_path / "billing.py"
+    path.write_text(BIG_MODULE)
+
+    text = render_context_file(str(path), "Invoice PDF rendering drops lines")
+    assert "return [line for line in invoice.lines]" in text  # релевантный метод целиком
+    assert "    def send_email(self, invoice, address):\n        ..." in text  # сосед — только сигнатура
+    assert "def helper_7(value):\n    ...\n" in text
+    assert "total = value + 7" not in text
+    assert "from decimal import Decimal" in text
+    assert len(text) < len(BIG_MODULE) / 2
+
+
+def test_editable_file_is_not_sliced_in_whole_edit_format(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "CONTEXT_SLICE_LINES", 100)
+    monkeypatch.setattr(Config, "EDIT_FORMAT", "whole")
+    path = tmp_path / "billing.py"
+    path.write_text(BIG_MODULE)
+    # Файл переписывается целиком — модель должна видеть все тела
+    assert render_context_file(str(path), "Invoice PDF rendering drops lines") == BIG_MODULE
+    assert "total = value + 7" not in render_context_file(str(path), "Invoice PDF", editable=False)
+
+
+def test_small_file_is_sent_in_full(tmp_path):
+    path = tmp_path / "small.py"
+    path.write_text("def a():\n    # note\n    return 1\n")
+    assert render_context_file(str(path), "anything") == "def a():\n    # note\n    return 1\n"
+
+
+def test_minify_strips_comments_and_docstrings_only():
+    source = 'def f(x):\n    """Doc."""\n    # comment\n    call(\n        "not a docstring",\n    )\n    return x  # trailing\n'
+    minified = minify("m.py", source)
+    assert minified == 'def f(x):\n    call(\n        "not a docstring",\n    )\n    return x\n'
+    assert minify("a.js", "/* header */\nconst a = 1; \n// note\nfunction f() {}\n") == "const a = 1; \nfunction f() {}\n"
+
+
+def test_read_only_large_file_stays_valid_python(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "CONTEXT_SLICE_LINES", 100)
+    path = tmp_path / "billing.py"
+    path.write_text(BIG_MODULE)
+    text = render_context_file(str(path), "send email", editable=False)
+    assert '"""' not in text and "# draw" not in text
+    ast.parse(text)
+
+
+def test_binary_and_oversized_files(tmp_path):
+    binary = tmp_path / "image.png"
+    binary.write_bytes(b"\x89PNG\x00\x00\x00")
+    assert read_source(str(binary)) is None
+
+    large = tmp_path / "data.txt"
+    large.write_text("line\n" * 1000)
+    source = read_source(str(large), max_bytes=102)
+    assert source.truncated and source.text == "line\n" * 20
+
+
+def test_selection_splits_modify_and_read_only(monkeypatch):
+    from src.agents.code_agent import CodeAgent
+    monkeypatch.setattr(Config, "YC_FOLDER_ID", "folder")
+    agent = CodeAgent(git_provider=object())
+    monkeypatch.setattr(agent, "_log_step", lambda *a, **k: None)
+    prompts = []
+
+    class FakeLLM:
+        model = "gpt-4o-mini"
+
+        def generate(self, system, user):
+            prompts.append(user)
+            return '```json\n{"modify": ["src/a.py"], "read": ["src/b.py", "src/a.py"]}\n```'
+
+    monkeypatch.setattr(agent.router, "get", lambda stage: FakeLLM())
+    assert agent._select_relevant_files("Fix a", "src/a.py\nsrc/b.py") == ["src/a.py", "src/b.py"]
+    assert agent._read_only_files == {"src/b.py"}
+    assert '{"modify": [...], "read": [...]}' in prompts[0]
@@ -0,0 +1,111 @@
+from src.core.utils import parse_code_blocks, apply_edit, apply_file_changes
+
+SOURCE = '''def add(a, b):
+    return a + b
+
+
+class Calculator:
+    def divide(self, a, b):
+        return a / b
+'''
+
+
+def test_parse_mixed_response():
+    response = '''Here is the fix.
+
+File: `calc.py`
+<<<<<<< SEARCH
+        return a / b
+=======
+        if b == 0:
+            raise ValueError("b must not be zero")
+        return a / b
+>>>>>>> REPLACE
+
+File: `tests/test_calc.py`
+```python
+def test_ok():
+    assert True
+```
+'''
+    changes = parse_code_blocks(response)
+    assert changes[0]["path"] == "calc.py"
+    assert len(changes[0]["edits"]) == 1
+    assert changes[1] == {"path": "tests/test_calc.py", "content": "def test_ok():\n    assert True\n"}
+
+
+def test_unified_diff_is_converted_to_edits():
+    response = '''File: `calc.py`
+```diff
+@@ -1,2 +1,2 @@
+ def add(a, b):
+-    return a + b
++    return b + a
+```
+'''
+    [change] = parse_code_blocks(response)
+    updated, reason = apply_edit(SOURCE, *change["edits"][0])
+    assert reason == ""
+    assert "return b + a" in updated
+
+
+def test_apply_edit_tolerates_whitespace_and_small_differences():
+    # Модель потеряла отступ класса
+    updated, _ = apply_edit(SOURCE, "def divide(self, a, b):\n    return a / b\n",
+                            "def divide(self, a, b):\n    return a // b\n")
+    assert "    def divide(self, a, b):\n        return a // b\n" in updated
+
+    # Небольшая опечатка в SEARCH
+    updated, _ = apply_edit(SOURCE, "class Calculator:\n    def divide(self, a, b):\n        return a/b\n",
+                            "class Calculator:\n    def divide(self, a, b):\n        return a // b\n")
+    assert "return a // b" in updated
+    assert "def add(a, b)" in updated
+    # Короткий блок нечетко не применяется
+    updated, reason = apply_edit(SOURCE, "def add(a, b):\n    return a+b\n", "def add(a, b):\n    return sum((a, b))\n")
+    assert updated is None and "not found" in reason
+
+
+TWINS = '''def b(x):
+    total = x + 1
+    return total
+
+
+def c(x):
+    total = x + 2
+    return total
+'''
+
+
+def test_duplicate_exact_text_is_a_conflict(tmp_path):
+    (tmp_path / "twins.py").write_text(TWINS)
+    report = apply_file_changes([{"path": "twins.py", "edits": [("    return total\n", "    return -total\n")]}],
+                                root=str(tmp_path))
+    assert report.written == [] and "matches 2 places" in report.conflicts[0].reason
+    assert (tmp_path / "twins.py").read_text() == TWINS
+
+    # Без учета отступов — тоже
+    updated, reason = apply_edit(TWINS, "  return total", "  return -total")
+    assert updated is None and "ambiguous" in reason
+
+
+def test_fuzzy_match_does_not_edit_a_similar_symbol():
+    # Модель ошиблась в теле c: окно b похоже не меньше, чем окно c
+    search = "def c(x):\n    total = x + 1\n    return total\n"
+    updated, reason = apply_edit(TWINS, search, "def c(x):\n    total = x + 3\n    return total\n")
+    assert updated is None and "ambiguous" in reason
+    # Даже почти точная копия c не отличается от b с нужным запасом: правка требует больше контекста
+    updated, reason = apply_edit(TWINS, "def c(x):\n    total = x+2\n    return total\n", "")
+    assert updated is None and "ambiguous" in reason
+
+
+def test_conflicts_are_reported_and_file_is_untouched(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "calc.py").write_text(SOURCE)
+    report = apply_file_changes([
+        {"path": "calc.py", "edits": [("def multiply(x, y):\n    return x * y\n", "")]},
+        {"path": "new.py", "content": "X = 1\n"},
+    ])
+    assert report.written == ["new.py"]
+    assert len(report.conflicts) == 1
+    assert "calc.py" in report.summary()
+    assert (tmp_path / "calc.py").read_text() == SOURCE
@@ -0,0 +1,119 @@
+from src.core import db
+from src.core.config import Config
+from src.core.git_provider import GitProvider
+from src.core.convergence import file_state_fingerprint, review_fingerprint, has_guidance
+from src.core.pr_state import PRState, load_pr_state, save_pr_state
+from src.agents.code_agent import CodeAgent
+
+PR_URL = "https://github.com/owner/repo/pull/7"
+ISSUE_URL = "https://github.com/owner/repo/issues/3"
+COMPLAINT = "[REQUEST_CHANGES]\nThe average function in `calc.py` must handle an empty list"
+
+
+class LoopGit:
+    format_comments = staticmethod(GitProvider.format_comments)
+
+    def __init__(self, comments):
+        self.comments = comments
+        self.posted = []
+        self.pushed = 0
+
+    def get_issue(self, url): return "Title: Calc\nDescription:\nImplement average in calc.py"
+    def get_pr_comment_list(self, url): return list(self.comments)
+    def get_pr_files(self, url): return ["calc.py"]
+    def get_pr_diff(self, url): return ""
+    def checkout_pr(self, url): pass
+    def commit_changes(self, message): pass
+    def post_comment(self, url, body): self.posted.append(body)
+    def _get_repo_name_from_remote(self): return "owner/repo"
+
+    def create_pr(self, *a, **k):
+        self.pushed += 1
+        return PR_URL
+
+
+def _agent(tmp_path, monkeypatch, git, response):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("DASHBOARD_API_URL", raising=False)
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "events.db"))
+    db.init_db()
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(Config, "YC_FOLDER_ID", "folder")
+    monkeypatch.setattr(Config, "EDIT_FORMAT", "whole")
+    agent = CodeAgent(git_provider=git)
+    calls = []
+    monkeypatch.setattr(agent, "_log_step", lambda *a, **k: None)
+    monkeypatch.setattr(agent.router, "get", lambda stage: agent.llm)
+    monkeypatch.setattr(agent.llm, "generate", lambda system, user: calls.append(user) or response)
+    return agent, calls
+
+
+def _comment(i, body):
+    return {"id": f"issue:{i}", "kind": "general", "author": "bot", "path": None, "line": None, "body": body}
+
+
+def test_repeated_review_stops_before_generation(tmp_path, monkeypatch):
+    git = LoopGit([_comment(1, COMPLAINT), _comment(2, COMPLAINT), _comment(3, COMPLAINT + ".")])
+    agent, calls = _agent(tmp_path, monkeypatch, git, "")
+    (tmp_path / "calc.py").write_text("def average(xs):\n    return sum(xs) / len(xs)\n")
+    state = PRState(PR_URL)
+    for comment in git.comments[:2]:
+        state.record_iteration([comment], ["calc.py"], review_fp=review_fingerprint([comment]))
+    save_pr_state(state)
+
+    agent.run_fix(PR_URL, ISSUE_URL)
+    assert calls == [] and git.pushed == 0
+    assert "повторяет замечания" in git.posted[-1]
+    assert agent.last_run.summary()["attributes"]["stop_reason"] == "repeated_review"
+
+
+def test_agent_stop_comment_is_not_guidance(tmp_path, monkeypatch):
+    git = LoopGit([_comment(1, COMPLAINT), _comment(2, COMPLAINT), _comment(3, COMPLAINT + ".")])
+    agent, calls = _agent(tmp_path, monkeypatch, git, "")
+    (tmp_path / "calc.py").write_text("def average(xs):\n    return sum(xs) / len(xs)\n")
+    state = PRState(PR_URL)
+    for comment in git.comments[:2]:
+        state.record_iteration([comment], ["calc.py"], review_fp=review_fingerprint([comment]))
+    save_pr_state(state)
+    agent.run_fix(PR_URL, ISSUE_URL)
+
+    # Сводка остановки опубликована под токеном пользователя: автор не отличается от человека
+    stop_comment = {**_comment(4, git.posted[-1]), "author": "owner"}
+    assert not has_guidance([stop_comment, {"body": "/fix"}])
+    git.comments += [stop_comment, _comment(5, "/fix")]
+    agent.run_fix(PR_URL, ISSUE_URL)
+    assert calls == [] and len(git.posted) == 2
+
+
+def test_human_guidance_overrides_repeated_review():
+    assert not has_guidance([_comment(1, COMPLAINT), _comment(2, "/fix")])
+    assert has_guidance([_comment(2, "/fix use statistics.mean and return 0 for empty input")])
+
+
+def test_fix_reverting_to_previous_iteration_is_not_pushed(tmp_path, monkeypatch):
+    git = LoopGit([_comment(1, COMPLAINT), _comment(2, "[REQUEST_CHANGES]\nDivision by zero is back")])
+    agent, calls = _agent(tmp_path, monkeypatch, git, "File: `calc.py`\n```python\nA = 1\n```\n")
+    calc = tmp_path / "calc.py"
+    calc.write_text("A = 1\n")
+    state = PRState(PR_URL)
+    state.record_iteration(git.comments[:1], ["calc.py"], state_fp=file_state_fingerprint(["calc.py"]),
+                           review_fp=review_fingerprint(git.comments[:1]))
+    save_pr_state(state)
+    calc.write_text("B = 2\n")
+
+    agent.run_fix(PR_URL, ISSUE_URL)
+    assert len(calls) == 1 and git.pushed == 0
+    assert "прошлых итераций" in git.posted[-1]
+    assert agent.last_run.summary()["attributes"]["stop_reason"] == "cycle"
+    assert load_pr_state(PR_URL).iteration_count == 1
+
+
+def test_progressing_fix_is_pushed_and_fingerprinted(tmp_path, monkeypatch):
+    git = LoopGit([_comment(1, COMPLAINT)])
+    agent, calls = _agent(tmp_path, monkeypatch, git, "File: `calc.py`\n```python\nC = 3\n```\n")
+    (tmp_path / "calc.py").write_text("B = 2\n")
+
+    agent.run_fix(PR_URL, ISSUE_URL)
+    assert git.pushed == 1 and not git.posted
+    iteration = load_pr_state(PR_URL).iterations[0]
+    assert iteration["state_fp"] == file_state_fingerprint(["calc.py"]) and "empty" in iteration["review_fp"]
@@ -0,0 +1,116 @@
+from src.core.git_provider import GitProvider
+from src.core.pr_state import apply_webhook, load_pr_state
+from src.core.utils import ApplyReport
+
+PR_URL = "https://github.com/owner/repo/pull/7"
+ISSUE_URL = "https://github.com/owner/repo/issues/3"
+
+
+class FakeGit:
+    format_comments = staticmethod(GitProvider.format_comments)
+
+    def __init__(self):
+        self.comments = [
+            {"id": "issue:1", "kind": "general", "author": "bot", "path": None, "line": None,
+             "body": "[REQUEST_CHANGES]\nHandle empty input in `calc.py`"},
+        ]
+
+    def get_issue(self, url): return "Title: Calc\nDescription:\nImplement average in calc.py"
+    def get_pr_comment_list(self, url): return list(self.comments)
+    def get_pr_comment_count(self, url): return len(self.comments)
+    def get_pr_files(self, url): return ["calc.py"]
+    def get_pr_diff(self, url): return "File: calc.py\nStatus: added\nPatch:\n+def average(xs): ...\n---\n"
+    def checkout_pr(self, url): pass
+    def post_comment(self, url, body): pass
+    def _get_repo_name_from_remote(self): return "owner/repo"
+
+
+class FakeLLM:
+    model = "gpt-4o-mini"
+
+    def __init__(self):
+        self.prompts = []
+
+    def generate(self, system, user):
+        self.prompts.append(user)
+        return ""
+
+
+def test_fix_iterations_send_only_new_comments_and_delta_files(tmp_path, monkeypatch, make_code_agent):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "calc.py").write_text("def average(xs):\n    return sum(xs) / len(xs)\n")
+    (tmp_path / "report.py").write_text("from calc import average\n")
+    (tmp_path / "unrelated.py").write_text("X = 1\n")
+
+    git = FakeGit()
+    llm = FakeLLM()
+    agent = make_code_agent(git, llm)
+    monkeypatch.setattr(agent, "_get_context", lambda: (_ for _ in ()).throw(AssertionError("full context")))
+    monkeypatch.setattr(agent, "_apply_and_push", lambda *a, **k: ApplyReport(written=["calc.py"]))
+
+    agent.run_fix(PR_URL, ISSUE_URL)
+    first = llm.prompts[-1]
+    assert "Handle empty input" in first and "File: `calc.py`" in first
+    assert "unrelated.py" not in first
+
+    state = load_pr_state(PR_URL)
+    assert state.processed_comment_ids == ["issue:1"] and state.touched_files == ["calc.py"]
+
+    # Без новых замечаний повторный запуск ничего не делает
+    agent.run_fix(PR_URL, ISSUE_URL)
+    assert len(llm.prompts) == 1
+
+    git.comments.append({"id": "review:9", "kind": "review", "author": "bot", "path": "report.py", "line": 1,
+                         "body": "Import is unused"})
+    agent.run_fix(PR_URL, ISSUE_URL)
+    second = llm.prompts[-1]
+    assert "Import is unused" in second and "Handle empty input" not in second.split("НОВЫЕ ЗАМЕЧАНИЯ")[1]
+    assert "Итерация 1: изменены calc.py" in second
+    assert "File: `report.py`" in second and "File: `calc.py`" in second
+    assert len(load_pr_state(PR_URL).iterations) == 2
+
+
+def _webhook_agent(tmp_path, monkeypatch, make_code_agent):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "calc.py").write_text("def average(xs):\n    return sum(xs) / len(xs)\n")
+
+    repo = {"full_name": "owner/repo"}
+    apply_webhook("pull_request", {"action": "opened", "repository": repo,
+                                   "pull_request": {"html_url": PR_URL, "head": {"sha": "abc"}, "body": "Fixes #3"}})
+    apply_webhook("issue_comment", {"action": "created", "repository": repo,
+                                    "issue": {"html_url": PR_URL, "pull_request": {"html_url": PR_URL}},
+                                    "comment": {"id": 1, "user": {"login": "bot"},
+                                                "body": "[REQUEST_CHANGES]\nHandle empty input in `calc.py`"}})
+
+    git = FakeGit()
+    llm = FakeLLM()
+    agent = make_code_agent(git, llm)
+    monkeypatch.setattr(agent, "_apply_and_push", lambda *a, **k: ApplyReport(written=["calc.py"]))
+    return git, agent, llm
+
+
+def test_fix_uses_webhook_state_instead_of_comment_api(tmp_path, monkeypatch, make_code_agent):
+    git, agent, llm = _webhook_agent(tmp_path, monkeypatch, make_code_agent)
+    git.get_pr_comment_list = lambda url: (_ for _ in ()).throw(AssertionError("comment API call"))
+    issues = []
+    get_issue = git.get_issue
+    git.get_issue = lambda url: issues.append(url) or get_issue(url)
+
+    # Из webhook payload приходит URL самого PR; связанная задача берется из состояния
+    agent.run_fix(PR_URL, PR_URL)
+    assert issues == [ISSUE_URL]
+    assert "Handle empty input" in llm.prompts[-1]
+    assert load_pr_state(PR_URL).processed_comment_ids == ["issue:1"]
+
+
+def test_missed_webhook_triggers_comment_resync(tmp_path, monkeypatch, make_code_agent):
+    git, agent, llm = _webhook_agent(tmp_path, monkeypatch, make_code_agent)
+    # Webhook о втором замечании не дошел: в API комментариев больше, чем в состоянии
+    git.comments.append({"id": "review:9", "kind": "review", "author": "bot", "path": "calc.py", "line": 1,
+                         "body": "Average must round to two digits"})
+
+    agent.run_fix(PR_URL, PR_URL)
+    assert "Average must round to two digits" in llm.prompts[-1]
+    state = load_pr_state(PR_URL)
+    assert [c["id"] for c in state.comments] == ["issue:1", "review:9"] and state.comments_synced
+    assert state.processed_comment_ids == ["issue:1", "review:9"]
@@ -0,0 +1,75 @@
+import os
+import subprocess
+import pytest
+from src.core.config import Config
+from src.core.history_index import HistoryIndex
+
+
+def _git(root, *args):
+    subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+                   cwd=root, check=True, capture_output=True)
+
+
+def _commit(root, message, files):
+    for path in files:
+        full = os.path.join(root, path)
+        os.makedirs(os.path.dirname(full) or root, exist_ok=True)
+        with open(full, "a") as f:
+            f.write(f"# {message}\n")
+    _git(root, "add", "-A")
+    _git(root, "commit", "-m", message)
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path / "cache"))
+    root = str(tmp_path / "repo")
+    os.makedirs(root)
+    _git(root, "init", "-q")
+    _commit(root, "Add billing invoices", ["src/billing.py", "tests/test_billing.py"])
+    _commit(root, "Fix invoice rounding", ["src/billing.py", "tests/test_billing.py", "config/billing.yaml"])
+    _commit(root, "Invoice currency support", ["src/billing.py", "tests/test_billing.py"])
+    _commit(root, "Login rate limit", ["src/auth.py", "config/billing.yaml"])
+    return root
+
+
+def test_companions_follow_cochange_counts(repo):
+    index = HistoryIndex(repo)
+    assert index.update()["new"] == 4
+
+    companions = index.companions(["src/billing.py"], k=3, min_support=2, min_confidence=0.3)
+    assert companions == [("tests/test_billing.py", 1.0)]
+    # Порог support отсекает единичное совпадение
+    assert index.companions(["src/auth.py"], k=3, min_support=2) == []
+    assert index.companions(["src/auth.py"], k=3, min_support=1)[0][0] == "config/billing.yaml"
+
+
+def test_similar_files_from_commit_messages(repo):
+    index = HistoryIndex(repo)
+    index.update()
+    assert index.similar_files("Invoices are rounded incorrectly", 1)[0][0] in ("src/billing.py", "tests/test_billing.py")
+    assert index.similar_files("login rate limit", 1)[0][0] in ("src/auth.py", "config/billing.yaml")
+
+
+def test_incremental_update_reads_only_new_commits(repo):
+    HistoryIndex(repo).update()
+    _commit(repo, "Auth tests", ["src/auth.py", "tests/test_auth.py"])
+
+    index = HistoryIndex(repo)  # состояние загружается с диска
+    stats = index.update()
+    assert (stats["commits"], stats["new"]) == (5, 1)
+    assert index.update()["new"] == 0
+    assert index.companions(["tests/test_auth.py"], min_support=1)[0][0] == "src/auth.py"
+
+
+def test_update_picks_up_index_saved_by_another_process(repo):
+    first, second = HistoryIndex(repo), HistoryIndex(repo)
+    first.update()
+    _commit(repo, "Auth tests", ["src/auth.py", "tests/test_auth.py"])
+    assert second.update()["new"] == 1
+
+    # Первый экземпляр перечитывает общий индекс и не считает коммиты повторно
+    stats = first.update()
+    assert (stats["commits"], stats["new"]) == (5, 0)
+    assert first.file_commits[first.ids["src/billing.py"]] == 3
+    assert not any(name.endswith(".tmp") for name in os.listdir(first.cache_dir))
@@ -0,0 +1,42 @@
+from src.core.impact_analysis import ImportGraph
+
+
+def _write(root, path, text):
+    target = root / path
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_text(text)
+
+
+def test_changed_module_selects_transitive_tests(tmp_path):
+    _write(tmp_path, "app/__init__.py", "")
+    _write(tmp_path, "app/core.py", "def add(a, b):\n    return a + b\n")
+    _write(tmp_path, "app/api.py", "from .core import add\n\ndef handler():\n    return add(1, 2)\n")
+    _write(tmp_path, "app/other.py", "X = 1\n")
+    _write(tmp_path, "tests/test_api.py", "from app.api import handler\n\ndef test_handler():\n    assert handler() == 3\n")
+    _write(tmp_path, "tests/test_other.py", "def test_other():\n    from app import other\n    assert other.X == 1\n")
+    _write(tmp_path, "tests/test_core.py", "import app.core\n\ndef test_add():\n    assert app.core.add(2, 2) == 5\n")
+
+    graph = ImportGraph(str(tmp_path), cache_dir=str(tmp_path / ".cache"))
+    assert graph.refresh()["parsed"] == 7
+    assert graph.impacted_tests(["app/core.py"]) == ["tests/test_api.py", "tests/test_core.py"]
+    # Импорт внутри функции тоже учитывается; изменение пакета затрагивает всех, кто его импортирует
+    assert graph.impacted_tests(["app/other.py"]) == ["tests/test_other.py"]
+    assert len(graph.impacted_tests(["app/__init__.py"])) == 3
+
+    result = graph.run_tests(graph.impacted_tests(["app/core.py"]), workers=2, budget=60)
+    assert result.passed == ["tests/test_api.py"] and list(result.failed) == ["tests/test_core.py"]
+    assert "assert 4 == 5" in result.failed["tests/test_core.py"]
+
+    # Граф кэшируется: повторно разбираются только измененные файлы
+    _write(tmp_path, "app/other.py", "X = 2\n")
+    cached = ImportGraph(str(tmp_path), cache_dir=str(tmp_path / ".cache"))
+    assert cached.refresh()["parsed"] == 1
+    assert set(cached.durations) == {"tests/test_api.py", "tests/test_core.py"}
+
+
+def test_time_budget_skips_remaining_tests(tmp_path):
+    _write(tmp_path, "tests/test_a.py", "def test_a():\n    pass\n")
+    graph = ImportGraph(str(tmp_path), cache_dir=str(tmp_path / ".cache"))
+    graph.refresh()
+    result = graph.run_tests(["tests/test_a.py"], budget=0)
+    assert result.skipped == ["tests/test_a.py"] and result.ok
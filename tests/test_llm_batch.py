@@ -0,0 +1,72 @@
+import time
+import threading
+import email.utils
+from src.core.llm import LLMProvider, LLMResponse, RateLimitError, parse_retry_after, MAX_RETRY_AFTER
+from src.core.rate_limiter import RateLimiter
+
+
+class SlowLLM(LLMProvider):
+    name = "SlowFake"
+    model = "fake"
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+        self.throttled = set()
+        self.limiter = RateLimiter(rpm=0, max_concurrency=3)
+
+    def _limiter(self):
+        return self.limiter
+
+    def _complete(self, system_prompt: str, user_prompt: str) -> LLMResponse:
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(0.02)
+            if user_prompt == "bad":
+                raise ValueError("bad prompt")
+            if user_prompt == "429" and user_prompt not in self.throttled:
+                self.throttled.add(user_prompt)
+                raise RateLimitError("quota", retry_after=0.01)
+            return LLMResponse(text=user_prompt.upper())
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def test_generate_many_keeps_order_and_errors(monkeypatch):
+    monkeypatch.setattr("src.core.llm.record_usage", lambda usage: None)
+    llm = SlowLLM()
+    prompts = [("sys", f"p{i}") for i in range(10)] + [("sys", "bad"), ("sys", "429")]
+
+    results = llm.generate_many(prompts, max_concurrency=8)
+
+    assert [r.text for r in results[:10]] == [f"P{i}" for i in range(10)]
+    assert not results[10].ok and "bad prompt" in results[10].error
+    # 429 повторяется через лимитер и в итоге проходит
+    assert results[11].text == "429"
+    # Лимитер провайдера ограничивает параллелизм даже при большем max_concurrency
+    assert llm.peak <= 3
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(rpm=1200, max_concurrency=10)  # не чаще раза в 50 мс
+    start = time.monotonic()
+    for _ in range(4):
+        with limiter.slot():
+            pass
+    assert time.monotonic() - start >= 0.15
+
+
+def test_retry_after_accepts_seconds_and_http_dates():
+    assert parse_retry_after("2.5") == 2.5
+    in_30s = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 25 < parse_retry_after(in_30s) <= 30
+    assert parse_retry_after(email.utils.formatdate(time.time() - 60, usegmt=True)) == 0.0
+    # Непонятное значение не роняет вызов: пауза по умолчанию
+    assert parse_retry_after("soon") == 1.0 and parse_retry_after(None, default=3.0) == 3.0
+    # Нечисловые значения — пауза по умолчанию, слишком длинные ограничены
+    assert parse_retry_after("nan") == 1.0 and parse_retry_after("inf") == 1.0 and parse_retry_after("-inf") == 1.0
+    assert parse_retry_after("86400") == MAX_RETRY_AFTER
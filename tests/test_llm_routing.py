@@ -0,0 +1,30 @@
+from src.core.config import Config
+from src.core.llm import YandexGPTLLM, STAGE_SELECTION, STAGE_GENERATION
+
+
+def test_stage_routes(monkeypatch):
+    monkeypatch.setattr(Config, "LLM_MODEL", "gpt-4o")
+    monkeypatch.setattr(Config, "LLM_ROUTES", '{"selection": {"model": "gpt-4o-mini", "temperature": 0, "maxTokens": 500}}')
+
+    selection = Config.get_llm_route(STAGE_SELECTION)
+    assert selection["model"] == "gpt-4o-mini"
+    assert selection["temperature"] == 0.0
+    assert selection["max_tokens"] == 500
+
+    # Стадии без переопределений используют настройки по умолчанию
+    generation = Config.get_llm_route(STAGE_GENERATION)
+    assert generation["model"] == "gpt-4o"
+    assert generation["max_tokens"] == Config.LLM_MAX_TOKENS
+
+
+def test_invalid_routes_are_ignored(monkeypatch):
+    monkeypatch.setattr(Config, "LLM_ROUTES", "{not json")
+    assert Config.get_llm_route(STAGE_SELECTION)["model"] == Config.LLM_MODEL
+
+
+def test_yandex_model_uri(monkeypatch):
+    monkeypatch.setattr(Config, "YC_FOLDER_ID", "folder")
+    assert YandexGPTLLM().model_uri == "gpt://folder/yandexgpt/latest"
+    assert YandexGPTLLM(model="gpt-4o-mini").model_uri == "gpt://folder/yandexgpt/latest"
+    assert YandexGPTLLM(model="yandexgpt-lite").model_uri == "gpt://folder/yandexgpt-lite/latest"
+    assert YandexGPTLLM(model="gpt://other/yandexgpt/rc").model_uri == "gpt://other/yandexgpt/rc"
@@ -0,0 +1,45 @@
+import json
+import requests
+from src.core.config import Config
+from src.core.llm import YandexGPTLLM
+from src.core.mock_llm_server import MockLLMServer
+
+
+def test_openai_protocol_with_script_and_streaming():
+    server = MockLLMServer(script=[{"pattern": "factorial", "response": "def factorial(n): ..."}]).start()
+    try:
+        body = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "Write factorial"}]}
+        plain = requests.post(f"{server.url}/v1/chat/completions", json=body).json()
+        assert plain["choices"][0]["message"]["content"] == "def factorial(n): ..."
+        assert plain["usage"]["completion_tokens"] > 0
+
+        stream = requests.post(f"{server.url}/v1/chat/completions", stream=True,
+                               json={**body, "stream": True, "stream_options": {"include_usage": True}})
+        events = [line[len(b"data: "):] for line in stream.iter_lines() if line.startswith(b"data: ")]
+        assert events[-1] == b"[DONE]"
+        chunks = [json.loads(e) for e in events[:-1]]
+        text = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks if c["choices"])
+        assert text == "def factorial(n): ..."
+        assert chunks[-1]["usage"]["prompt_tokens"] > 0
+    finally:
+        server.stop()
+
+
+def test_yandex_streaming_and_rate_limit_injection(monkeypatch):
+    server = MockLLMServer(latency=0.05, tokens_per_sec=500).start()
+    monkeypatch.setattr(Config, "YC_FOLDER_ID", "folder")
+    monkeypatch.setattr(Config, "YC_API_URL", f"{server.url}/foundationModels/v1")
+    monkeypatch.setattr(Config, "YC_COMPLETION_MODE", "sync")
+    monkeypatch.setattr(Config, "LLM_STREAM", True)
+    recorded = []
+    monkeypatch.setattr("src.core.llm.record_usage", recorded.append)
+    try:
+        assert YandexGPTLLM().generate("sys", "stream me") == "Mock response to: stream me"
+        assert recorded[-1].ttft is not None and recorded[-1].tokens_out > 0
+
+        server.rate_limit_rate = 1.0
+        response = requests.post(f"{server.url}/foundationModels/v1/completion", json={"messages": []})
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "1"
+    finally:
+        server.stop()
@@ -0,0 +1,57 @@
+from src.core.config import Config
+from src.core.pr_state import apply_webhook, load_pr_state
+
+PR_URL = "https://github.com/owner/repo/pull/7"
+REPO = {"full_name": "owner/repo"}
+
+
+def _comment_event(action, comment_id, body):
+    return {
+        "action": action,
+        "repository": REPO,
+        "issue": {"html_url": PR_URL, "pull_request": {"html_url": PR_URL}},
+        "comment": {"id": comment_id, "user": {"login": "bot"}, "body": body},
+    }
+
+
+def test_webhooks_keep_pr_state_current(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path))
+
+    apply_webhook("pull_request", {
+        "action": "opened",
+        "repository": REPO,
+        "pull_request": {"html_url": PR_URL, "head": {"sha": "abc123"}, "body": "Closes #3"},
+    })
+    state = load_pr_state(PR_URL)
+    assert state.issue_url == "https://github.com/owner/repo/issues/3"
+    assert state.head_sha == "abc123" and state.comments_synced
+
+    apply_webhook("issue_comment", _comment_event("created", 1, "[REQUEST_CHANGES]\nFix it"))
+    apply_webhook("issue_comment", _comment_event("created", 2, "[REQUEST_CHANGES]\nAgain"))
+    apply_webhook("issue_comment", _comment_event("edited", 2, "[APPROVE]"))
+    apply_webhook("pull_request_review_comment", {
+        "action": "created",
+        "repository": REPO,
+        "pull_request": {"html_url": PR_URL},
+        "comment": {"id": 5, "user": {"login": "bot"}, "path": "calc.py", "position": 4, "body": "Typo"},
+    })
+    state = load_pr_state(PR_URL)
+    assert [c["id"] for c in state.comments] == ["issue:1", "issue:2", "review:5"]
+    assert state.request_changes_count == 1
+    assert state.comments[2]["path"] == "calc.py"
+
+    apply_webhook("issue_comment", _comment_event("deleted", 1, ""))
+    apply_webhook("pull_request", {
+        "action": "synchronize",
+        "repository": REPO,
+        "pull_request": {"html_url": PR_URL, "head": {"sha": "def456"}, "body": ""},
+    })
+    state = load_pr_state(PR_URL)
+    assert state.request_changes_count == 0
+    assert state.head_sha == "def456" and state.issue_url.endswith("/issues/3")
+
+
+def test_events_without_pr_are_ignored(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path))
+    assert apply_webhook("issue_comment", {"action": "created", "issue": {"html_url": "x"}, "comment": {}}) is None
+    assert apply_webhook("push", {}) is None
@@ -0,0 +1,58 @@
+import pytest
+from src.core.prompt_builder import PromptBuilder, count_tokens, get_context_window
+
+
+def _files(n: int, size: int) -> str:
+    body = "x = 1\n" * size
+    return "".join(f"\nFile: `src/mod_{i}.py`\n```\n{body}```\n" for i in range(n))
+
+
+def test_everything_fits():
+    builder = PromptBuilder("Task:\n{task}\nCode:\n{context}", budget_tokens=10_000)
+    builder.add("task", "Fix the bug", priority=100)
+    builder.add("context", _files(2, 10), priority=50, strategy="blocks")
+    prompt = builder.build()
+    assert "src/mod_1.py" in prompt
+    assert builder.summary() == ""
+
+
+def test_replace_changes_only_the_named_section():
+    builder = PromptBuilder("{note}|{task}|{context}", budget_tokens=10_000)
+    builder.add("note", "NOTE", priority=100).add("task", "Fix", priority=100).add("context", "code", priority=50)
+    assert builder.replace("note", "").build() == "|Fix|code"
+    with pytest.raises(KeyError):
+        builder.replace("missing", "x")
+
+
+def test_low_priority_blocks_are_dropped_whole():
+    context = _files(10, 200)
+    builder = PromptBuilder("{task}\n{context}", budget_tokens=1500)
+    builder.add("task", "Implement feature " * 20, priority=100)
+    builder.add("context", context, priority=50, strategy="blocks")
+    prompt = builder.build()
+
+    assert count_tokens(prompt) <= 1500
+    assert "Implement feature" in prompt
+    report = {r.name: r for r in builder.report}
+    assert report["task"].kept_tokens == report["task"].tokens
+    assert report["context"].dropped
+    # Отброшенные файлы перечислены, но их содержимого нет
+    assert "src/mod_9.py" in prompt
+    assert prompt.count("x = 1") < context.count("x = 1")
+    # Детерминированность
+    assert builder.build() == prompt
+
+
+def test_head_strategy_keeps_latest_comments():
+    comments = "".join(f"comment {i}\n" for i in range(2000))
+    builder = PromptBuilder("{comments}", budget_tokens=300)
+    builder.add("comments", comments, priority=100, strategy="head")
+    prompt = builder.build()
+    assert "comment 1999" in prompt
+    assert "comment 0\n" not in prompt
+    assert count_tokens(prompt) <= 300
+
+
+def test_context_window_lookup():
+    assert get_context_window("gpt-4o-mini") == 128_000
+    assert get_context_window("gpt://folder/yandexgpt-lite/latest") == 32_000
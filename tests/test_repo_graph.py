@@ -0,0 +1,73 @@
+import subprocess
+from src.core.config import Config
+from src.core.prompt_builder import count_tokens
+from src.core.repo_graph import RepoGraph, get_repo_graph, pagerank
+from src.core.repo_scanner import RepoMapCache
+
+
+def _repo(root, fillers=150):
+    (root / "pkg").mkdir(parents=True)
+    (root / "web").mkdir()
+    (root / "pkg" / "__init__.py").write_text("")
+    (root / "pkg" / "auth.py").write_text(
+        "from pkg.tokens import make_token\n\n\nclass Login:\n    def check(self, user):\n"
+        "        return make_token(user)\n\n    def logout(self, user): ...\n")
+    (root / "pkg" / "tokens.py").write_text("def make_token(user):\n    return str(user)\n")
+    (root / "pkg" / "billing.py").write_text("def charge(amount):\n    return amount\n\ndef refund(amount): ...\n")
+    (root / "web" / "widget.js").write_text("function renderWidget(node) {}\n")
+    (root / "web" / "page.js").write_text("function showPage() { renderWidget(document.body); }\n")
+    for i in range(fillers):
+        (root / "pkg" / f"filler_{i}.py").write_text(f"def helper_{i}(x):\n    return x\n\ndef other_{i}(y): ...\n")
+    for args in (["init", "-q"], ["add", "."], ["-c", "user.email=a@b", "-c", "user.name=a", "commit", "-qm", "init"]):
+        subprocess.run(["git", *args], cwd=root, check=True, capture_output=True)
+    return str(root)
+
+
+def test_pagerank_follows_edges_from_seeds():
+    edges = {"a.py": {"b.py": 1.0}, "b.py": {"c.py": 1.0}, "d.py": {"a.py": 1.0}}
+    rank = pagerank(edges, {"a.py": 1.0})
+    assert rank["a.py"] > rank["b.py"] > rank["c.py"] > 0
+    assert "d.py" not in rank
+    assert abs(sum(rank.values()) - 1.0) < 1e-3
+
+
+def test_ranked_map_keeps_relevant_structure_within_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path / "cache"))
+    root = _repo(tmp_path / "repo")
+    graph = get_repo_graph(root)
+
+    repo_map = graph.render("Login.check in pkg/auth.py returns a wrong token", budget=120)
+    assert count_tokens(repo_map) <= 120
+    assert repo_map.startswith("pkg/auth.py:\n  class Login:\n    def check(self, user): ...")
+    # Импортируемый модуль поднимается графом выше несвязанных файлов
+    paths = [line.rstrip(":") for line in repo_map.splitlines() if not line.startswith(" ")]
+    assert paths.index("pkg/tokens.py") < len(paths) - 1
+    assert "filler_149" not in repo_map and len(paths) < 50
+
+    # Использование идентификатора в JS: page.js вызывает функцию из widget.js
+    js_map = graph.render("The page in web/page.js is blank", budget=60)
+    paths = [line.rstrip(":") for line in js_map.splitlines() if not line.startswith(" ")]
+    assert paths[:2] == ["web/page.js", "web/widget.js"]
+
+    # Названный в задаче символ выше остальных строк файла; в hybrid — только кандидаты
+    only = graph.render("Make charge reject negative amounts", budget=500, only=["pkg/billing.py", "pkg/auth.py"])
+    assert only.startswith("pkg/billing.py:\n  def charge(amount): ...")
+    assert {line.rstrip(":") for line in only.splitlines() if not line.startswith(" ")} <= {"pkg/billing.py", "pkg/auth.py"}
+
+
+def test_graph_is_rebuilt_only_when_map_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path / "cache"))
+    root = _repo(tmp_path / "repo", fillers=3)
+    cache = RepoMapCache(root)
+    cache.refresh()
+    graph = RepoGraph(cache)
+    graph.build()
+    edges = graph.edges
+    graph.build()
+    assert graph.edges is edges and edges["pkg/auth.py"] == {"pkg/tokens.py": 1.0}
+
+    (tmp_path / "repo" / "pkg" / "billing.py").write_text("from pkg.tokens import make_token\n\n"
+                                                          "def charge(amount):\n    return make_token(amount)\n")
+    cache.refresh()
+    graph.build()
+    assert graph.edges["pkg/billing.py"] == {"pkg/tokens.py": 1.0}
@@ -0,0 +1,132 @@
+import json
+import subprocess
+import threading
+from src.core.config import Config
+from src.core.llm import LLMRouter
+from src.core.repo_hierarchy import DirectoryDigests, partition
+from src.core.repo_scanner import RepoMapCache
+from src.agents.code_agent import CodeAgent
+
+
+def _repo(root):
+    for package, names in {"pkg/auth": ["login", "session", "tokens"], "pkg/billing": ["charge", "refund", "invoice"],
+                           "web": ["page", "widget", "router"]}.items():
+        (root / package).mkdir(parents=True)
+        for name in names:
+            (root / package / f"{name}.py").write_text(f"class {name.title()}:\n    def run(self): ...\n\n"
+                                                       f"def {name}_helper(x):\n    return x\n")
+    (root / "setup.py").write_text("def setup(): ...\n")
+    for args in (["init", "-q"], ["add", "."], ["-c", "user.email=a@b", "-c", "user.name=a", "commit", "-qm", "init"]):
+        subprocess.run(["git", *args], cwd=root, check=True, capture_output=True)
+    return str(root)
+
+
+def test_partition_splits_large_directories_into_bounded_subtrees():
+    paths = [f"src/big/m{i}.py" for i in range(5)] + ["src/small/a.py", "src/small/b.py", "src/top.py",
+                                                        "docs/index.md", "README.md"]
+    units = partition(paths, max_files=3)
+    assert units == {
+        "./*": ["README.md"],
+        "docs/": ["docs/index.md"],
+        "src/*": ["src/top.py"],
+        "src/big/*": ["src/big/m0.py", "src/big/m1.py", "src/big/m2.py"],
+        "src/big/*2": ["src/big/m3.py", "src/big/m4.py"],
+        "src/small/": ["src/small/a.py", "src/small/b.py"],
+    }
+    assert partition(paths, max_files=100) == {"./": sorted(paths)}
+
+
+def test_digests_are_cached_until_a_file_in_the_subtree_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path / "cache"))
+    root = _repo(tmp_path / "repo")
+    cache = RepoMapCache(root)
+    cache.refresh()
+    units = partition(list(cache.entries), max_files=4)
+
+    digests, built = DirectoryDigests(root).get(units, cache.entries)
+    assert built == len(units) == 4
+    assert digests["pkg/billing/"].startswith("pkg/billing/ (3 files): charge.py, invoice.py, refund.py | Charge,")
+    assert "charge_helper" in digests["pkg/billing/"] and "run" not in digests["pkg/billing/"].split("|")[1]
+
+    (tmp_path / "repo" / "web" / "page.py").write_text("class Page:\n    pass\n")
+    cache.refresh()
+    digests, built = DirectoryDigests(root).get(units, cache.entries)
+    assert built == 1 and "page_helper" not in digests["web/"]
+
+
+class SelectionLLM:
+    model = "gpt-4o-mini"
+
+    def __init__(self):
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def generate(self, system, user):
+        with self._lock:
+            self.prompts.append(user)
+        if "SUBTREES" in user:
+            return json.dumps([name for name in ("pkg/billing/", "pkg/auth/") if f"\n{name} (" in user])
+        if "pkg/billing/charge.py" in user:
+            return json.dumps({"modify": ["pkg/billing/charge.py"], "read": ["pkg/billing/invoice.py"]})
+        return json.dumps({"modify": [], "read": ["pkg/auth/login.py"]})
+
+
+def test_hierarchical_selection_expands_only_chosen_subtrees(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(Config, "FILE_SELECTION_MODE", "hierarchical")
+    monkeypatch.setattr(Config, "HIERARCHY_UNIT_FILES", 4)
+    # Одна сводка на запрос: первый этап — четыре параллельных запроса
+    monkeypatch.setattr(Config, "HIERARCHY_DIGEST_TOKENS", 1)
+    root = _repo(tmp_path / "repo")
+    llm = SelectionLLM()
+    monkeypatch.setattr(LLMRouter, "get", lambda self, stage: llm)
+    agent = CodeAgent(git_provider=object())
+    agent.root = root
+    monkeypatch.setattr(agent, "_log_step", lambda *a, **k: None)
+
+    files = agent._select_hierarchical("Charge must reject negative amounts")
+
+    assert files == ["pkg/billing/charge.py", "pkg/billing/invoice.py", "pkg/auth/login.py"]
+    assert agent._read_only_files == {"pkg/billing/invoice.py", "pkg/auth/login.py"}
+    stage_one = [p for p in llm.prompts if "SUBTREES" in p]
+    stage_two = [p for p in llm.prompts if "REPO MAP" in p]
+    assert len(stage_one) == 4 and len(stage_two) == 2
+    # Карты второго этапа — только файлы выбранного поддерева
+    billing = next(p for p in stage_two if "pkg/billing/charge.py" in p)
+    assert "pkg/auth/" not in billing and "web/" not in billing
+
+
+class FailingLLM:
+    model = "gpt-4o-mini"
+
+    def generate(self, system, user):
+        return "not json"
+
+
+def _agent(tmp_path, monkeypatch, root, llm):
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(Config, "FILE_SELECTION_MODE", "hierarchical")
+    monkeypatch.setattr(Config, "HIERARCHY_UNIT_FILES", 4)
+    monkeypatch.setattr(LLMRouter, "get", lambda self, stage: llm)
+    agent = CodeAgent(git_provider=object())
+    agent.root = root
+    monkeypatch.setattr(agent, "_log_step", lambda *a, **k: None)
+    return agent
+
+
+def test_failed_selection_falls_back_to_ranked_files(tmp_path, monkeypatch):
+    root = _repo(tmp_path / "repo")
+    agent = _agent(tmp_path, monkeypatch, root, FailingLLM())
+    monkeypatch.setattr(Config, "RETRIEVAL_TOP_K", 2)
+
+    files = agent._select_hierarchical("Charge in pkg/billing/charge.py must reject negative amounts")
+    assert files is not None and len(files) == 2 and "pkg/billing/charge.py" in files
+
+
+def test_empty_repository_selects_nothing(tmp_path, monkeypatch):
+    root = tmp_path / "repo"
+    root.mkdir()
+    subprocess.run(["git", "init", "-q"], cwd=root, check=True)
+    agent = _agent(tmp_path, monkeypatch, str(root), FailingLLM())
+    monkeypatch.setattr(Config, "REPO_MAP_TOKENS", 0)
+    assert agent._select_hierarchical("Create a helper in utils.py") == []
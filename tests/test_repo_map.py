@@ -0,0 +1,100 @@
+import gzip
+import subprocess
+import time
+from src.core.config import Config
+from src.core.repo_files import source_files
+from src.core.repo_scanner import RepoMapCache, RepoMapGenerator, scan_files
+
+
+def _git(root, *args):
+    subprocess.run(["git", *args], cwd=root, check=True, capture_output=True)
+
+
+def _repo(root, modules=0):
+    (root / "pkg").mkdir(parents=True)
+    (root / "pkg" / "calc.py").write_text("import os\n\nclass Calc:\n    def add(self, a, b):\n        return a + b\n")
+    (root / "app.js").write_text("function render(x) {}\n")
+    (root / "README.md").write_text("# demo\n")
+    (root / ".gitignore").write_text("build/\n")
+    (root / "build").mkdir()
+    (root / "build" / "out.py").write_text("def generated(): ...\n")
+    for i in range(modules):
+        (root / "pkg" / f"mod_{i}.py").write_text(f"def f_{i}(x):\n    return x + {i}\n")
+    _git(root, "init", "-q")
+    _git(root, "add", ".")
+    _git(root, "-c", "user.email=a@b", "-c", "user.name=a", "commit", "-qm", "init")
+    return str(root)
+
+
+def test_map_cache_reparses_only_changed_files_and_is_shared(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path / "cache"))
+    root = _repo(tmp_path / "repo")
+
+    cache = RepoMapCache(root)
+    assert cache.refresh()["parsed"] == 4
+    repo_map = cache.render()
+    assert "pkg/calc.py:\n  class Calc:\n    def add(self, a, b): ..." in repo_map
+    assert "app.js:\n  function render(...)" in repo_map
+    assert "README.md" in repo_map and "build/out.py" not in repo_map
+
+    # Новый экземпляр (другой запуск) читает сжатый кэш с диска и ничего не разбирает
+    with gzip.open(cache._path, "rt") as f:
+        assert "pkg/calc.py" in f.read()
+    other = RepoMapCache(root)
+    assert other.refresh()["parsed"] == 0
+    assert other.render() == repo_map
+
+    (tmp_path / "repo" / "pkg" / "calc.py").write_text("def total(xs): ...\n")
+    (tmp_path / "repo" / "app.js").unlink()
+    stats = other.refresh()
+    assert (stats["parsed"], stats["removed"]) == (1, 1)
+    assert "pkg/calc.py:\n  def total(xs): ..." in other.render() and "app.js" not in other.render()
+
+
+def test_generate_map_on_warm_cache_is_fast(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path / "cache"))
+    root = _repo(tmp_path / "repo", modules=2000)
+    cold = RepoMapGenerator.generate_map(root)
+
+    start = time.perf_counter()
+    warm = RepoMapGenerator.generate_map(root)
+    assert time.perf_counter() - start < 1.0
+    assert warm == cold and "pkg/mod_1999.py:\n  def f_1999(x): ..." in warm
+
+
+def test_parallel_scan_matches_serial_order_and_falls_back(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(Config, "REPO_MAP_PARALLEL_MIN", 1)
+    root = _repo(tmp_path / "repo", modules=40)
+    paths = sorted(p.relative_to(root).as_posix() for p in (tmp_path / "repo" / "pkg").glob("*.py"))
+    serial = list(scan_files(root, paths, workers=1))
+
+    assert list(scan_files(root, paths, workers=2)) == serial
+
+    def broken_pool(*args, **kwargs):
+        raise OSError("no processes")
+    monkeypatch.setattr("src.core.repo_scanner.ProcessPoolExecutor", broken_pool)
+    assert list(scan_files(root, paths, workers=2)) == serial
+
+
+def test_map_skips_vendored_generated_binary_and_oversized_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(Config, "REPO_MAX_FILE_BYTES", 2000)
+    repo = tmp_path / "repo"
+    (repo / "web" / "node_modules" / "lib").mkdir(parents=True)
+    (repo / "web" / "node_modules" / "lib" / "index.js").write_text("function vendored() {}\n")
+    (repo / "web" / "app.min.js").write_text("function minified() {}\n")
+    (repo / "web" / "app.js").write_text("function app() {}\n")
+    (repo / "blob.py").write_bytes(b"def fake():\x00\x01\x02")
+    (repo / "huge.py").write_text("def huge(): ...\n" * 500)
+    root = _repo(repo)
+
+    repo_map = RepoMapGenerator.generate_map(root)
+    assert "web/app.js:\n  function app(...)" in repo_map
+    assert "node_modules" not in repo_map and "app.min.js" not in repo_map
+    # Бинарные и слишком большие файлы не читаются, но остаются в карте именем
+    assert "\nblob.py\n" in f"\n{repo_map}\n" and "\nhuge.py\n" in f"\n{repo_map}\n"
+    assert "def huge" not in repo_map
+
+    monkeypatch.setattr(Config, "REPO_INCLUDE_GLOBS", ["pkg/*"])
+    assert source_files(root).keys() == {"pkg/calc.py"}
@@ -0,0 +1,116 @@
+import os
+from collections import Counter
+import pytest
+from src.core.config import Config
+from src.core.retrieval import RetrievalIndex, record_selection, tokenize
+from src.core.repo_scanner import RepoMapGenerator
+
+FILES = {
+    "src/auth/login.py": '"""User login and session tokens."""\n\ndef authenticate_user(username, password):\n    return check_password(username, password)\n',
+    "src/billing/invoice.py": '"""Invoices for customers."""\n\nclass InvoiceGenerator:\n    def render_pdf(self, invoice):\n        pass\n',
+    "src/utils/strings.py": "def slugify(text):\n    return text.lower().replace(' ', '-')\n",
+    "README.md": "# Demo project\nBilling and auth services.\n",
+    "logo.png": b"\x89PNG\x00\x00binary",
+}
+
+
+def _write(root, path, content):
+    full = os.path.join(root, path)
+    os.makedirs(os.path.dirname(full) or root, exist_ok=True)
+    mode = "wb" if isinstance(content, bytes) else "w"
+    with open(full, mode) as f:
+        f.write(content)
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path / "cache"))
+    root = tmp_path / "repo"
+    for path, content in FILES.items():
+        _write(str(root), path, content)
+    return str(root)
+
+
+def test_tokenize_splits_identifiers():
+    tokens = tokenize("InvoiceGenerator.render_pdf(files)")
+    assert {"invoicegenerator", "invoice", "generator", "render_pdf", "render", "pdf", "file"} <= set(tokens)
+
+
+def test_rank_by_symbols_docstrings_and_mentions(repo):
+    index = RetrievalIndex(repo)
+    assert index.refresh()["updated"] == len(FILES)
+
+    assert index.rank("Fix the PDF rendering of customer invoices", 2)[0][0] == "src/billing/invoice.py"
+    assert index.rank("authenticate user fails with wrong password", 1)[0][0] == "src/auth/login.py"
+    # Явное упоминание файла поднимает его наверх даже без общих термов
+    assert index.rank("Add a helper to `strings.py`", 1)[0][0] == "src/utils/strings.py"
+
+
+def test_incremental_refresh_and_persistence(repo):
+    index = RetrievalIndex(repo)
+    index.refresh()
+    assert index.refresh()["updated"] == 0
+
+    _write(repo, "src/utils/strings.py", "def parse_currency_amount(text):\n    return float(text)\n" * 2)
+    os.remove(os.path.join(repo, "README.md"))
+    stats = index.refresh()
+    assert (stats["updated"], stats["removed"]) == (1, 1)
+    assert index.rank("parse currency amount", 1)[0][0] == "src/utils/strings.py"
+
+    # Новый экземпляр читает индекс с диска и ничего не переиндексирует
+    reloaded = RetrievalIndex(repo)
+    assert reloaded.refresh()["updated"] == 0
+    assert reloaded.rank("parse currency amount", 3) == index.rank("parse currency amount", 3)
+
+
+def test_recall_against_recorded_selections(repo):
+    index = RetrievalIndex(repo)
+    index.refresh()
+    record_selection("Invoices render an empty PDF", ["src/billing/invoice.py"], root=repo)
+    record_selection("Login rejects valid password", ["src/auth/login.py", "src/removed.py"], root=repo)
+
+    report = index.evaluate(k=1)
+    assert report["queries"] == 2
+    assert report["recall"] == 1.0
+
+
+def test_filter_map_keeps_ranked_entries():
+    repo_map = "a.py:\n  def a(): ...\nb.py\nc.py:\n  class C:"
+    assert RepoMapGenerator.filter_map(repo_map, ["c.py", "deep/d.py"]) == "c.py:\n  class C:\ndeep/d.py"
+
+
+def test_shared_index_is_replaced_not_mutated_under_readers(repo):
+    np = pytest.importorskip("numpy")
+    reader = RetrievalIndex(repo)
+    reader.refresh()
+    before = np.array(reader.vectors)
+    row = reader.rows["src/utils/strings.py"]
+
+    # Другой процесс (отдельный экземпляр) обновляет общий индекс
+    writer = RetrievalIndex(repo)
+    _write(repo, "src/utils/strings.py", "def parse_currency_amount(text):\n    return float(text)\n")
+    assert writer.refresh()["updated"] == 1
+    assert np.array_equal(reader.vectors, before) and not reader.vectors.flags.writeable
+    assert not any(name.endswith(".tmp") for name in os.listdir(writer.cache_dir))
+
+    # Читатель подхватывает сохраненный индекс, не переиндексируя файлы
+    assert reader.refresh()["updated"] == 0
+    assert not np.array_equal(reader.vectors[row], before[row])
+    assert reader.rank("parse currency amount", 1)[0][0] == "src/utils/strings.py"
+
+
+def test_cosine_uses_stored_stats_and_matches_full_computation(repo, monkeypatch):
+    np = pytest.importorskip("numpy")
+    RetrievalIndex(repo).refresh()
+
+    # Статистика векторов читается с диска, запрос ее не пересчитывает
+    index = RetrievalIndex(repo)
+    monkeypatch.setattr(index, "_update_stats", lambda: pytest.fail("stats recomputed"))
+    query = Counter(tokenize("parse currency amount from invoice text"))
+    scores = index._cosine(query)
+
+    matrix = np.asarray(index.vectors[:len(index.docs)], dtype=np.float64)
+    idf = np.log((len(index.rows) + 1) / (np.count_nonzero(matrix, axis=0) + 1)) + 1.0
+    weighted, vector = matrix * idf, index._vector(query) * idf
+    expected = weighted @ vector / (np.linalg.norm(weighted, axis=1) * np.linalg.norm(vector))
+    assert scores and all(abs(score - expected[row]) < 1e-5 for row, score in scores.items())
@@ -0,0 +1,57 @@
+from src.core.config import Config
+from src.core.llm import LLMRouter
+from src.core.prompt_builder import PromptBuilder, count_tokens
+from src.agents.reviewer_agent import ReviewerAgent, OMITTED_NOTE
+
+
+class ReviewGit:
+    def __init__(self, diff):
+        self.diff = diff
+        self.comments = []
+
+    def get_issue(self, url):
+        return "Add a double() helper"
+
+    def get_pr_diff(self, url):
+        return self.diff
+
+    def post_comment(self, url, body):
+        self.comments.append(body)
+
+
+class RecordingLLM:
+    model = "gpt-4o-mini"
+    max_tokens = 1000
+
+    def __init__(self):
+        self.prompts = []
+
+    def generate(self, system, user):
+        self.prompts.append((system, user))
+        return "[APPROVE]\nLooks good"
+
+
+def _diff(files, lines):
+    body = "".join(f"+x_{i} = {i}\n" for i in range(lines))
+    return "".join(f"\nFile: `src/mod_{n}.py`\n```diff\n{body}```\n" for n in range(files))
+
+
+def _review(tmp_path, monkeypatch, diff):
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(Config, "LLM_CONTEXT_TOKENS", 6000)
+    llm = RecordingLLM()
+    monkeypatch.setattr(LLMRouter, "get", lambda self, stage: llm)
+    ReviewerAgent(git_provider=ReviewGit(diff))._run("https://github.com/o/r/pull/1", "https://github.com/o/r/issues/1")
+    return llm.prompts[0]
+
+
+def test_omitted_files_note_fits_into_the_budget(tmp_path, monkeypatch):
+    system, user = _review(tmp_path, monkeypatch, _diff(20, 200))
+    budget = PromptBuilder.for_llm(RecordingLLM(), "", system).budget_tokens
+    assert OMITTED_NOTE.strip() in user and "src/mod_19.py" in user
+    assert count_tokens(user, "gpt-4o-mini") <= budget
+
+
+def test_no_note_when_the_whole_diff_fits(tmp_path, monkeypatch):
+    _, user = _review(tmp_path, monkeypatch, _diff(2, 5))
+    assert "NOTE:" not in user and "x_4 = 4" in user
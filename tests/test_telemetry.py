@@ -0,0 +1,45 @@
+from src.core import db
+from src.core.llm import LLMProvider, LLMResponse
+from src.core.telemetry import track_run
+
+
+class FakeLLM(LLMProvider):
+    name = "Fake"
+    model = "fake-model"
+
+    def __init__(self, stage: str, fail: bool = False):
+        self.stage = stage
+        self.fail = fail
+
+    def _complete(self, system_prompt: str, user_prompt: str) -> LLMResponse:
+        if self.fail:
+            raise RuntimeError("boom")
+        return LLMResponse(text="ok", tokens_in=len(user_prompt), tokens_out=2, cached_tokens=1)
+
+
+def test_usage_is_recorded_per_run_and_stage(tmp_path, monkeypatch):
+    monkeypatch.delenv("DASHBOARD_API_URL", raising=False)
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "events.db"))
+    db.init_db()
+
+    with track_run("code", "owner/repo", "issue/1") as run:
+        assert FakeLLM("selection").generate("sys", "abcd") == "ok"
+        assert FakeLLM("generation").generate("sys", "abcdefgh") == "ok"
+        assert FakeLLM("generation", fail=True).generate("sys", "x") == ""
+
+    summary = run.summary()
+    assert summary["llm_calls"] == 3
+    assert summary["errors"] == 1
+    assert summary["stages"]["generation"]["tokens_in"] == 8
+
+    stats = {row["stage"]: row for row in db.get_usage_stats(repo_name="owner/repo")}
+    assert stats["selection"]["calls"] == 1
+    assert stats["generation"]["calls"] == 2
+    assert stats["generation"]["errors"] == 1
+    assert stats["generation"]["cache_hits"] == 1
+
+    per_run = db.get_usage_stats(group_by=["run"])
+    assert per_run[0]["run"] == run.run_id
+
+    events = db.get_recent_events(repo_name="owner/repo")
+    assert any(e["event_type"] == "run_summary" for e in events)
@@ -0,0 +1,90 @@
+from src.core import db
+from src.core.config import Config
+from src.core.validation import validate_changes, module_name
+from src.agents.code_agent import CodeAgent
+
+ISSUE_URL = "https://github.com/owner/repo/issues/4"
+
+
+def test_syntax_and_local_import_errors_are_reported(tmp_path):
+    pkg = tmp_path / "pkg"
+    pkg.mkdir()
+    (pkg / "__init__.py").write_text("")
+    (pkg / "good.py").write_text("import some_missing_third_party_lib\nX = 1\n")
+    (pkg / "broken.py").write_text("def f(:\n    pass\n")
+    (pkg / "uses.py").write_text("from pkg.absent import thing\n")
+    (tmp_path / "config.json").write_text("{bad json")
+
+    paths = ["pkg/good.py", "pkg/broken.py", "pkg/uses.py", "config.json"]
+    report = validate_changes(paths, root=str(tmp_path), tests=False)
+    errors = {e.path: e.kind for e in report.errors}
+    # Отсутствующий сторонний пакет ошибкой не считается, модуль репозитория — считается
+    assert errors == {"pkg/broken.py": "syntax", "pkg/uses.py": "import", "config.json": "syntax"}
+    assert not report.ok and "line 1" in report.summary()
+
+
+def test_impacted_tests_run_on_change(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path / "cache"))
+    (tmp_path / "tests").mkdir()
+    (tmp_path / "tests" / "test_calc.py").write_text("from calc import X\n\ndef test_x():\n    assert X == 2\n")
+    (tmp_path / "calc.py").write_text("X = 1\n")
+    assert module_name("src/core/__init__.py") == "src.core" and module_name("my-scripts/run.py") is None
+
+    report = validate_changes(["calc.py"], root=str(tmp_path), tests=True)
+    assert [e.kind for e in report.errors] == ["test"] and "assert 1 == 2" in report.errors[0].message
+
+
+class Git:
+    def __init__(self):
+        self.prs = []
+        self.comments = []
+
+    def get_issue(self, url): return "Title: Calc\nDescription:\nAdd function double(x) to calc.py"
+    def get_issue_comment_list(self, url): return []
+    def create_branch(self, name): pass
+    def commit_changes(self, message): pass
+    def post_comment(self, url, body): self.comments.append(body)
+    def _get_repo_name_from_remote(self): return "owner/repo"
+
+    def create_pr(self, title, body, base="main"):
+        self.prs.append(title)
+        return "https://github.com/owner/repo/pull/5"
+
+
+def _run(tmp_path, monkeypatch, responses):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "calc.py").write_text("X = 1\n")
+    monkeypatch.delenv("DASHBOARD_API_URL", raising=False)
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "events.db"))
+    db.init_db()
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(Config, "YC_FOLDER_ID", "folder")
+    monkeypatch.setattr(Config, "EDIT_FORMAT", "whole")
+    monkeypatch.setattr(Config, "FILE_SELECTION_MODE", "llm")
+    monkeypatch.setattr(Config, "REPO_MAP_TOKENS", 0)
+    monkeypatch.setattr(Config, "HISTORY_COMPANIONS", 0)
+    git = Git()
+    agent = CodeAgent(git_provider=git)
+    prompts = []
+    monkeypatch.setattr(agent, "_log_step", lambda *a, **k: None)
+    monkeypatch.setattr(agent, "_build_repo_map", lambda: "calc.py")
+    monkeypatch.setattr(agent, "_select_relevant_files", lambda issue, repo_map: ["calc.py"])
+    monkeypatch.setattr(agent.llm, "generate", lambda system, user: prompts.append(user) or responses.pop(0))
+    agent.run(ISSUE_URL)
+    return git, prompts
+
+
+def test_broken_generation_is_repaired_in_the_same_run(tmp_path, monkeypatch):
+    git, prompts = _run(tmp_path, monkeypatch, [
+        "File: `calc.py`\n```python\nX = 1\ndef double(x)\n    return 2 * x\n```\n",
+        "File: `calc.py`\n```python\nX = 1\ndef double(x):\n    return 2 * x\n```\n",
+    ])
+    assert len(prompts) == 2 and "expected ':'" in prompts[1]
+    assert git.prs and "def double(x):" in (tmp_path / "calc.py").read_text()
+
+
+def test_unrepaired_code_is_not_pushed(tmp_path, monkeypatch):
+    broken = "File: `calc.py`\n```python\ndef double(x)\n    return 2 * x\n```\n"
+    git, prompts = _run(tmp_path, monkeypatch, [broken, broken])
+    assert len(prompts) == 2 and not git.prs
+    assert "локальная проверка" in git.comments[-1]
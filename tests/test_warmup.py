@@ -0,0 +1,99 @@
+import os
+import subprocess
+import threading
+import time
+from src.core import warmup
+from src.core.config import Config
+from src.core.repo_files import repo_cache_dir, _cache_key
+
+
+def _git(root, *args):
+    return subprocess.run(["git", *args], cwd=root, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def _origin(path):
+    path.mkdir()
+    (path / "calc.py").write_text("def double(x):\n    return 2 * x\n")
+    _git(path, "init", "-q", "-b", "main")
+    _git(path, "add", ".")
+    _git(path, "-c", "user.email=a@b", "-c", "user.name=a", "commit", "-qm", "init")
+    return str(path)
+
+
+def test_should_warm_on_issue_changes_and_default_branch_push():
+    assert warmup.should_warm("issues", {"action": "opened"})
+    assert warmup.should_warm("issues", {"action": "edited"})
+    assert not warmup.should_warm("issues", {"action": "labeled"})
+    repo = {"default_branch": "main"}
+    assert warmup.should_warm("push", {"ref": "refs/heads/main", "repository": repo})
+    assert not warmup.should_warm("push", {"ref": "refs/heads/feature", "repository": repo})
+    assert not warmup.should_warm("pull_request", {"action": "opened"})
+
+
+def test_events_during_warmup_coalesce_into_one_rerun(monkeypatch):
+    monkeypatch.setattr(Config, "FILE_SELECTION_MODE", "hybrid")
+    release = threading.Event()
+    runs = []
+
+    def task():
+        runs.append(1)
+        release.wait(5)
+
+    assert warmup.schedule_warmup("owner/repo", task)
+    time.sleep(0.05)
+    assert not warmup.schedule_warmup("owner/repo", task)
+    assert not warmup.schedule_warmup("owner/repo", task)
+    # Прогрев идет: запуск ждет его не дольше timeout
+    assert not warmup.wait_for_warmup("owner/repo", timeout=0.1)
+    release.set()
+    assert warmup.wait_for_warmup("owner/repo", timeout=5)
+    assert len(runs) == 2
+
+
+def test_wait_is_skipped_when_warmup_builds_nothing_reused(monkeypatch):
+    monkeypatch.setattr(warmup, "cache_tasks", lambda root=".": {})
+    release = threading.Event()
+    warmup.schedule_warmup("owner/idle", lambda: release.wait(5))
+    start = time.monotonic()
+    assert warmup.wait_for_warmup("owner/idle", timeout=5)
+    assert time.monotonic() - start < 1
+    release.set()
+
+
+def test_clone_works_without_mirror_and_reuses_it_after_warmup(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(Config, "FILE_SELECTION_MODE", "llm")
+    monkeypatch.setattr(Config, "HISTORY_COMPANIONS", 3)
+    origin = _origin(tmp_path / "origin")
+
+    # Зеркала еще нет — обычный клон
+    warmup.clone_repo("owner/repo", str(tmp_path / "cold"), url=origin)
+    assert (tmp_path / "cold" / "calc.py").exists()
+    assert not os.path.isdir(warmup.mirror_path("owner/repo"))
+
+    status = warmup.warm_repository("owner/repo", url=origin)
+    assert {"repo_map", "history"} <= set(status["caches"]) and status["head"] == _git(origin, "rev-parse", "HEAD")
+    assert _git(warmup.mirror_path("owner/repo"), "symbolic-ref", "HEAD") == "refs/heads/main"
+
+    warmup.clone_repo("owner/repo", str(tmp_path / "warm"), url=origin)
+    # --dissociate: клон не ссылается на объекты зеркала
+    assert not (tmp_path / "warm" / ".git" / "objects" / "info" / "alternates").exists()
+    assert warmup.is_warm(str(tmp_path / "warm"))
+
+    # Push в origin делает кэши устаревшими до следующего прогрева
+    (tmp_path / "origin" / "calc.py").write_text("def double(x):\n    return x * 2\n")
+    _git(origin, "-c", "user.email=a@b", "-c", "user.name=a", "commit", "-qam", "change")
+    _git(tmp_path / "warm", "pull", "-q")
+    assert not warmup.is_warm(str(tmp_path / "warm"))
+
+
+def test_cache_dir_key_ignores_scheme_and_credentials(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "AGENT_CACHE_DIR", str(tmp_path / "cache"))
+    repo = _origin(tmp_path / "repo")
+    _git(repo, "remote", "add", "origin", "https://github.com/owner/repo.git")
+
+    path = repo_cache_dir(repo, "retrieval")
+    assert path == os.path.join(Config.AGENT_CACHE_DIR, _cache_key("github.com/owner/repo.git"), "retrieval")
+    assert os.path.isdir(path)
+    _git(repo, "remote", "set-url", "origin", "https://x-access-token:T@github.com/owner/repo.git")
+    assert repo_cache_dir(repo, "retrieval") == path
@@ -0,0 +1,76 @@
+import time
+import threading
+import pytest
+from src.core.config import Config
+from src.core.llm import YandexGPTLLM
+from src.core.mock_llm_server import MockLLMServer
+from src.core.operation_poller import OperationPoller
+from src.core.rate_limiter import RateLimiter
+
+
+@pytest.fixture
+def mock_server(monkeypatch):
+    server = MockLLMServer(latency=0.4).start()
+    monkeypatch.setattr(Config, "YC_FOLDER_ID", "folder")
+    monkeypatch.setattr(Config, "YC_API_URL", f"{server.url}/foundationModels/v1")
+    monkeypatch.setattr(Config, "YC_OPERATIONS_URL", f"{server.url}/operations")
+    monkeypatch.setattr(Config, "YC_POLL_MIN_INTERVAL", 0.05)
+    monkeypatch.setattr(Config, "YC_POLL_MAX_INTERVAL", 0.2)
+    monkeypatch.setattr("src.core.llm.record_usage", lambda usage: None)
+    yield server
+    server.stop()
+
+
+def test_sync_mode(mock_server, monkeypatch):
+    monkeypatch.setattr(Config, "YC_COMPLETION_MODE", "sync")
+    assert YandexGPTLLM().generate("sys", "hello") == "Mock response to: hello"
+
+
+def test_async_mode_multiplexes_operations(mock_server, monkeypatch):
+    monkeypatch.setattr(Config, "YC_COMPLETION_MODE", "async")
+    llm = YandexGPTLLM()
+    assert llm.generate("sys", "single") == "Mock response to: single"
+
+    threads_before = threading.active_count()
+    start = time.monotonic()
+    results = llm.generate_many([("sys", f"task {i}") for i in range(8)])
+    elapsed = time.monotonic() - start
+
+    assert [r.text for r in results] == [f"Mock response to: task {i}" for i in range(8)]
+    # 8 генераций по 0.4s ожидаются параллельно одним потоком опроса, а не последовательно
+    assert elapsed < 8 * 0.4 / 2
+    assert threading.active_count() <= threads_before + 1
+
+
+def test_async_call_releases_the_limiter_slot_while_polling(mock_server, monkeypatch):
+    monkeypatch.setattr(Config, "YC_COMPLETION_MODE", "async")
+    llm = YandexGPTLLM()
+    limiter = RateLimiter(rpm=0, max_concurrency=1)
+    monkeypatch.setattr(llm, "_limiter", lambda: limiter)
+    results = []
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=lambda i=i: results.append(llm.generate("sys", f"t{i}"))) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == [f"Mock response to: t{i}" for i in range(3)]
+    # Один слот занят только на создание операции: три генерации по 0.4s ждут результата одновременно
+    assert time.monotonic() - start < 3 * 0.4
+
+
+def test_poller_uses_headers_of_each_operation(monkeypatch):
+    monkeypatch.setattr(Config, "YC_POLL_MIN_INTERVAL", 0.01)
+    seen = {}
+
+    def fetch(operation_id, headers):
+        seen[operation_id] = headers["Authorization"]
+        return {"done": True, "response": {"id": operation_id}}
+
+    poller = OperationPoller(fetch)
+    first = poller.submit("op-1", headers={"Authorization": "Api-Key A"})
+    second = poller.submit("op-2", headers={"Authorization": "Api-Key B"})
+    assert first.result(timeout=2) == {"id": "op-1"} and second.result(timeout=2) == {"id": "op-2"}
+    assert seen == {"op-1": "Api-Key A", "op-2": "Api-Key B"}